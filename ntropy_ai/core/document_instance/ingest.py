@@ -0,0 +1,161 @@
+"""
+Incremental ingestion
+
+Re-ingesting a source (a PDF, a JSON file...) only embeds and upserts its new or modified chunks,
+and deletes the vectors of the chunks that are no longer in the source.
+
+The loaders and the chunkers give deterministic ids (see utils.fingerprint): a page keeps its id, a chunk id is
+derived from its document id, its position and its text. The vectors are stored with the chunk ids, and a manifest
+(JSON file) records, per source, the hash of the source bytes, the embeddings model, the ingested ids and their content_hash.
+An item whose id is known but whose content_hash changed (eg. a page or a JSON value ingested without chunking) is embedded again.
+
+usage:
+- loader = PDFLoader("report.pdf")
+- chunks = [chunk for page in loader.extract_text() for chunk in SentenceAwareChunk(1000, page)]
+- ingest(store, chunks, source=loader.source, model="amazon.titan-embed-text-v2:0", source_hash=loader.source_hash)
+- ... the file changes ...
+- ingest(...) again -> only the changed chunks are embedded, the removed chunks are deleted from the store
+"""
+from ntropy_ai.core.utils.base_format import Document, TextChunk
+from ntropy_ai.core.utils import failed_writes
+from ntropy_ai.core.utils.settings import logger
+from typing import List, Union
+import json
+import os
+
+
+MANIFEST_VERSION = 2
+
+
+class IngestManifest():
+    """
+    Per source record of the ingested chunk ids: {source: {"source_hash", "model", "model_settings", "ids", "hashes", "pending"}}.
+    hashes are the content_hash of the ingested ids (the manifests of version 1 have none).
+    pending are the ids whose write failed: they may be in the store but must be embedded and upserted again.
+    """
+    def __init__(self, path: str = "ingest_manifest.json"):
+        self.path = path
+        self.sources = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.sources = json.load(f)["sources"]
+
+    def get(self, source: str) -> Union[dict, None]:
+        return self.sources.get(source)
+
+    def unchanged(self, source: str, source_hash: str, model: str, model_settings: dict = None) -> bool:
+        """
+        True if the source was fully ingested from the same bytes with the same model,
+        check it with the file hash (utils.fingerprint.file_hash) to skip loading an unchanged file.
+        """
+        entry = self.sources.get(source)
+        return entry is not None and source_hash is not None and entry["source_hash"] == source_hash and self.same_model(entry, model, model_settings)
+
+    @staticmethod
+    def same_model(entry: dict, model: str, model_settings: dict = None) -> bool:
+        return entry["model"] == model and entry["model_settings"] == json.loads(json.dumps(model_settings or {}, sort_keys=True, default=str))
+
+    def set(self, source: str, source_hash: Union[str, None], model: str, model_settings: dict, ids: List[str], pending: List[str] = (), hashes: dict = None):
+        self.sources[source] = {
+            "source_hash": source_hash,
+            "model": model,
+            "model_settings": json.loads(json.dumps(model_settings or {}, sort_keys=True, default=str)),
+            "ids": sorted(ids),
+            "hashes": dict(sorted((hashes or {}).items())),
+            "pending": sorted(pending)
+        }
+
+    def remove(self, source: str):
+        self.sources.pop(source, None)
+
+    def save(self):
+        # written to a temporary file then renamed, so an interrupted run does not leave a truncated manifest
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "sources": self.sources}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def ingest(store,
+           items: List[Union[Document, TextChunk]],
+           source: str,
+           model: str,
+           model_settings: dict = None,
+           source_hash: str = None,
+           manifest: Union[str, IngestManifest] = "ingest_manifest.json",
+           batch_size: int = 32,
+           force: bool = False,
+           **store_kwargs) -> dict:
+    """
+    Embeds and upserts the new or modified chunks of a source and deletes the vectors of its removed chunks.
+
+    Args:
+        store: The vector store (Pinecone, OpenSearchServerless, LocalVectorStore).
+        items (List[Document | TextChunk]): All the chunks (or image documents) of the source, with deterministic ids.
+        source (str): The name of the source (eg. loader.source).
+        model (str): The embeddings model.
+        model_settings (dict, optional): The settings of the embeddings model.
+        source_hash (str, optional): The hash of the source bytes (eg. loader.source_hash), an unchanged source is skipped.
+            Defaults to the source_hash of the items metadata.
+        manifest (str | IngestManifest, optional): The manifest or its path. Defaults to ingest_manifest.json.
+        batch_size (int, optional): The embeddings batch size. Defaults to 32.
+        force (bool, optional): Embeds and upserts all the chunks. Defaults to False.
+        **store_kwargs: The namespace (Pinecone, local store) or index (OpenSearch) of add_vectors and delete.
+
+    Returns:
+        dict: source, skipped, embedded, unchanged, deleted and failed (the vectors that could not be written).
+    """
+    from ntropy_ai.core.providers import embed_many
+    manifest = manifest if isinstance(manifest, IngestManifest) else IngestManifest(manifest)
+    if source_hash is None:
+        source_hash = next((item.metadata["source_hash"] for item in items if item.metadata.get("source_hash")), None)
+    report = {"source": source, "skipped": False, "embedded": 0, "unchanged": 0, "deleted": 0, "failed": 0}
+    if not force and manifest.unchanged(source, source_hash, model, model_settings):
+        report["skipped"] = True
+        report["unchanged"] = len(manifest.get(source)["ids"])
+        return report
+
+    entry = manifest.get(source)
+    previous_ids = set(entry["ids"]) if entry else set()
+    # the vectors of another model can not be kept, they are all replaced
+    known_ids = previous_ids - set(entry.get("pending", ())) if entry and not force and manifest.same_model(entry, model, model_settings) else set()
+    items = list({item.id: item for item in items}.values())
+    current_ids = [item.id for item in items]
+    hashes = {item.id: item.metadata["content_hash"] for item in items if item.metadata.get("content_hash")}
+    previous_hashes = (entry.get("hashes") or {}) if entry else {}
+    # a known id is unchanged if its content_hash is the same (an id without hash, eg. from a version 1 manifest, is kept)
+    new_items = [
+        item for item in items
+        if item.id not in known_ids or previous_hashes.get(item.id, hashes.get(item.id)) != hashes.get(item.id)
+    ]
+    removed_ids = sorted(previous_ids - set(current_ids))
+    report["unchanged"] = len(items) - len(new_items)
+
+    failed = 0
+    if new_items:
+        vectors = embed_many(model, new_items, model_settings, batch_size=batch_size)
+        for vector, item in zip(vectors, new_items):
+            # the vector id is the chunk id, so the next run finds it again
+            vector.id = item.id
+            vector.document_metadata = {**item.metadata, **(vector.document_metadata or {})}
+        # the ids written again (model change, force, pending retries) may already be in the store: OpenSearch generates
+        # the _id of each document, so adding them again would duplicate them, they are deleted first
+        rewritten_ids = sorted(item.id for item in new_items if item.id in previous_ids)
+        if rewritten_ids:
+            store.delete(rewritten_ids, **store_kwargs)
+        failed = failed_writes(store.add_vectors(vectors, **store_kwargs))
+        report["embedded"] = len(new_items)
+    if removed_ids:
+        store.delete(removed_ids, **store_kwargs)
+        report["deleted"] = len(removed_ids)
+
+    if failed:
+        # the new chunks are pending, the next run deletes them (some may have been written) then embeds and adds them again
+        logger.warning(f"{failed} vectors of {source} could not be written, they will be ingested again on the next run.")
+        manifest.set(source, None, model, model_settings, current_ids, pending=[item.id for item in new_items], hashes=hashes)
+    else:
+        manifest.set(source, source_hash, model, model_settings, current_ids, hashes=hashes)
+    report["failed"] = failed
+    manifest.save()
+    return report
@@ -1,9 +1,10 @@
 from ntropy_ai.core.utils.base_format import Document
+from ntropy_ai.core.utils.fingerprint import content_hash, file_hash, stable_id
 from typing import List, Union
 import json
 
 class JsonLoader:
-    def __init__(self, file_path: str, text_content_path: str = None, image_path: str = None, exclude: bool = False, image_suffix: Union[str, List[str]] = None):
+    def __init__(self, file_path: str, text_content_path: str = None, image_path: str = None, exclude: bool = False, image_suffix: Union[str, List[str]] = None, source: str = None):
         """
         Initializes the JsonLoader with the given file path and optional paths for text content and images.
 
@@ -13,8 +14,11 @@ class JsonLoader:
             image_path (str, optional): The path to the image content within the JSON structure. Defaults to None.
             exclude (bool, optional): Whether to exclude non-matching paths. Defaults to False.
             image_suffix (Union[str, List[str]], optional): The suffix or list of suffixes to filter image files. Defaults to common image extensions.
+            source (str, optional): The name of the source, the documents ids are derived from it and the JSON path. Defaults to file_path.
         """
         self.file_path = file_path
+        self.source = source or file_path
+        self.source_hash = None
         self.text_content_path = text_content_path
         self.image_path = image_path
         self.exclude = exclude
@@ -27,9 +31,10 @@ class JsonLoader:
         Returns:
             List[Document]: A list of Document objects created from the JSON data.
         """
+        self.source_hash = file_hash(self.file_path)
         with open(self.file_path, 'r') as f:
             data = json.load(f)
-    
+
         documents = self._process_data(data)
         return documents
 
@@ -59,22 +64,35 @@ class JsonLoader:
             # Process individual data items
             if self._matches_path(path, self.image_path) and isinstance(data, str) and any(data.lower().endswith(suffix) for suffix in self.image_suffix):
                 # Create a Document for image data
-                doc = Document(content=None, image=data, metadata={'path': path, 'type': 'image'})
+                doc = self._make_document(path, image=data)
                 documents.append(doc)
             elif self._matches_path(path, self.text_content_path):
                 # Create a Document for text content
-                doc = Document(content=str(data), metadata={'path': path, 'type': 'text'})
+                doc = self._make_document(path, content=str(data))
                 documents.append(doc)
             else:
                 if not self.exclude:
                     # Create a Document for other data if not excluded
                     if any(data.lower().endswith(suffix) for suffix in self.image_suffix):
-                        doc = Document(content=None, image=data, metadata={'path': path, 'type': 'image'})
+                        doc = self._make_document(path, image=data)
                     else:
-                        doc = Document(content=str(data), metadata={'path': path, 'type': 'text'})
+                        doc = self._make_document(path, content=str(data))
                     documents.append(doc)
         return documents
 
+    def _make_document(self, path: str, content: str = None, image: str = None) -> Document:
+        """
+        Creates the Document of a JSON value, its id is derived from the source and the JSON path
+        (the unchanged chunks of a modified value keep their ids, ingest finds a modified value with its content_hash).
+        """
+        value_hash = content_hash(content if image is None else image)
+        return Document(
+            id=stable_id(self.source, path) if image is None else stable_id(self.source, path, value_hash),
+            content=content,
+            image=image,
+            metadata={'path': path, 'type': 'image' if image is not None else 'text', 'source': self.source, 'source_hash': self.source_hash, 'content_hash': value_hash}
+        )
+
     def _matches_path(self, current_path: str, target_path: str) -> bool:
         """
         Checks if the current path matches the target path.
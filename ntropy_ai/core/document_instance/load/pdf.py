@@ -1,5 +1,5 @@
-import pymupdf
 from ntropy_ai.core.utils.base_format import Document
+from ntropy_ai.core.utils.fingerprint import content_hash, file_hash, stable_id
 from typing import List
 import os
 import tempfile
@@ -12,16 +12,22 @@ class PDFLoader:
         file_path (str): The path to the PDF file.
         output_img_path (str): The directory path where extracted images will be saved.
         pdf (pymupdf.Document): The opened PDF document.
+        source (str): The name of the source in the documents ids and metadata.
+        source_hash (str): The sha256 of the PDF file bytes.
     """
-    def __init__(self, file_path: str, output_img_path: str = None):
+    def __init__(self, file_path: str, output_img_path: str = None, source: str = None):
         """
         Initializes the PDFLoader with the given file path and optional output image path.
 
         Args:
             file_path (str): The path to the PDF file.
             output_img_path (str, optional): The directory path where extracted images will be saved. Defaults to a temporary directory.
+            source (str, optional): The name of the source, the documents ids are derived from it, the page and the content. Defaults to file_path.
         """
+        import pymupdf
         self.file_path = file_path
+        self.source = source or file_path
+        self.source_hash = file_hash(file_path)
         
         if output_img_path is None:
             self.output_img_path = tempfile.mkdtemp()
@@ -43,10 +49,13 @@ class PDFLoader:
             text_content = page.get_text().encode('utf-8')
             documents.append(
                 Document(
+                    # the id of a page does not change with its text, so its unchanged chunks keep their ids,
+                    # ingest finds a modified page with its content_hash
+                    id=stable_id(self.source, "text", page_number),
                     page_number=page_number,
                     content=text_content,
                     image=None,
-                    metadata={"type": "text"}
+                    metadata={"type": "text", "source": self.source, "source_hash": self.source_hash, "content_hash": content_hash(text_content)}
                 )
             )
         return documents
@@ -59,6 +68,7 @@ class PDFLoader:
         Returns:
             List[Document]: A list of Document objects containing image paths from each page of the PDF.
         """
+        import pymupdf
         documents: List[Document] = []
         for page_number in range(len(self.pdf)):
             page = self.pdf[page_number]
@@ -81,12 +91,14 @@ class PDFLoader:
                 image_path = f"{self.output_img_path}/image_{page_number}_{image_index}.png"
                 pixmap.save(image_path)
 
+                image_hash = content_hash(pixmap.samples)
                 documents.append(
                     Document(
+                        id=stable_id(self.source, "image", page_number, image_index, image_hash),
                         page_number=page_number,
                         content=None,
                         image=image_path,
-                        metadata={"type": "image"}
+                        metadata={"type": "image", "source": self.source, "source_hash": self.source_hash, "content_hash": image_hash}
                     )
                 )
         return documents
@@ -1,9 +1,30 @@
 from ntropy_ai.core.utils.base_format import Document
 from typing import List
 from ntropy_ai.core.utils.base_format import TextChunk, Document
+from ntropy_ai.core.utils.fingerprint import content_hash, stable_id
 import re
 
 
+def make_chunk(document: Document, chunk: str, chunk_number: int) -> TextChunk:
+    """
+    Creates a TextChunk of a document. Its id is derived from the document id, the chunk number and the text,
+    so re-chunking an unchanged document gives the same ids and a modified chunk gets a new id.
+    """
+    chunk_hash = content_hash(chunk)
+    return TextChunk(
+        id=stable_id(document.id, chunk_number, chunk_hash),
+        chunk=chunk,
+        chunk_number=chunk_number,
+        document_id=document.id,
+        metadata={
+            "type": "text",
+            "page_number": document.page_number,
+            "content_hash": chunk_hash,
+            **{key: document.metadata[key] for key in ("source", "source_hash") if key in document.metadata}
+        }
+    )
+
+
 def BasicTextChunk(chunk_size: int, document: Document) -> List[TextChunk]:
     """
     The chunking method splits the document's text content into smaller chunks of a specified size without any context awareness.
@@ -19,15 +40,7 @@ def BasicTextChunk(chunk_size: int, document: Document) -> List[TextChunk]:
     text = document.content
     for i in range(0, len(text), chunk_size):
         chunk = text[i:i + chunk_size]
-        text_chunk = TextChunk(
-            chunk=chunk, 
-            chunk_number=i // chunk_size, 
-            document_id=document.id,
-            metadata={
-                "type": "text",
-                "page_number": document.page_number,
-            }
-        )
+        text_chunk = make_chunk(document, chunk, i // chunk_size)
         chunk_list.append(text_chunk)
     return chunk_list
 
@@ -53,15 +66,7 @@ def RecursiveTextChunk(chunk_size: int, document: Document, start_index: int = 0
         return chunk_list
 
     chunk = text[start_index:start_index + chunk_size]
-    text_chunk = TextChunk(
-        chunk=chunk, 
-        chunk_number=start_index // chunk_size, 
-        document_id=document.id,
-        metadata={
-            "type": "text",
-            "page_number": document.page_number,
-        }
-    )
+    text_chunk = make_chunk(document, chunk, start_index // chunk_size)
     chunk_list.append(text_chunk)
 
     return RecursiveTextChunk(chunk_size, document, start_index + chunk_size, chunk_list)
@@ -89,28 +94,12 @@ def SentenceAwareChunk(chunk_size: int, document: Document) -> List[TextChunk]:
         if len(current_chunk) + len(sentence) <= chunk_size:
             current_chunk += sentence + " "
         else:
-            text_chunk = TextChunk(
-                chunk=current_chunk.strip(), 
-                chunk_number=chunk_number, 
-                document_id=document.id,
-                metadata={
-                    "type": "text",
-                    "page_number": document.page_number,
-                }
-            )
+            text_chunk = make_chunk(document, current_chunk.strip(), chunk_number)
             chunk_list.append(text_chunk)
             chunk_number += 1
             current_chunk = sentence + " "
 
     if current_chunk:
-        text_chunk = TextChunk(
-            chunk=current_chunk.strip(), 
-            chunk_number=chunk_number, 
-            document_id=document.id,
-            metadata={
-                "type": "text",
-                "page_number": document.page_number,
-            }
-        )
+        text_chunk = make_chunk(document, current_chunk.strip(), chunk_number)
         chunk_list.append(text_chunk)
     return chunk_list
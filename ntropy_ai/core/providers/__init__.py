@@ -1,41 +1,51 @@
-from pinecone import Pinecone
-from ntropy_ai.core.utils.settings import ModelsBaseSettings
+from ntropy_ai.core.utils.settings import ModelsBaseSettings, resolve_model
+from ntropy_ai.core.utils.base_format import Document, TextChunk, Vector, VectorBatch
+from typing import Iterable, List, Union
+
+
+def __getattr__(name: str):
+    # pinecone is only imported when ntropy_ai.core.providers.Pinecone is accessed, so importing a provider module does not load it
+    if name == "Pinecone":
+        from pinecone import Pinecone
+        return Pinecone
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def list_models(by_provider: str = None, models_only: bool = False, embeddings_only: bool = False):
     # will return a dir with all the providers and model, you can filter with a provider (eg "openai") or with embeddings_only=True or models_only=True
     out = {}
+    providers_list_map = ModelsBaseSettings().providers_list_map
     if embeddings_only:
-        for provider in ModelsBaseSettings().providers_list_map:
-            if 'embeddings_models' in ModelsBaseSettings().providers_list_map[provider]:
+        for provider in providers_list_map:
+            if 'embeddings_models' in providers_list_map[provider]:
                 out[provider] = {"embeddings_models": []}
-                for model in ModelsBaseSettings().providers_list_map[provider]['embeddings_models']['models_map']:
+                for model in providers_list_map[provider]['embeddings_models']['models_map']:
                     out[provider]["embeddings_models"].append(model)
     elif models_only:
-        for provider in ModelsBaseSettings().providers_list_map:
-            if 'models' in ModelsBaseSettings().providers_list_map[provider]:
+        for provider in providers_list_map:
+            if 'models' in providers_list_map[provider]:
                 out[provider] = {"models": []}
-                for model in ModelsBaseSettings().providers_list_map[provider]['models']:
+                for model in providers_list_map[provider]['models']:
                     out[provider]["models"].append(model)
     elif by_provider:
-        if 'embeddings_models' in ModelsBaseSettings().providers_list_map[by_provider]:
+        if 'embeddings_models' in providers_list_map[by_provider]:
             out[by_provider] = {"embeddings_models": []}
-            for model in ModelsBaseSettings().providers_list_map[by_provider]['embeddings_models']['models_map']:
+            for model in providers_list_map[by_provider]['embeddings_models']['models_map']:
                 out[by_provider]["embeddings_models"].append(model)
-        if 'models' in ModelsBaseSettings().providers_list_map[by_provider]:
+        if 'models' in providers_list_map[by_provider]:
             out[by_provider] = {"models": []}
-            for model in ModelsBaseSettings().providers_list_map[by_provider]['models']:
+            for model in providers_list_map[by_provider]['models']:
                 out[by_provider]["models"].append(model)
 
     else:
-        for provider in ModelsBaseSettings().providers_list_map:
+        for provider in providers_list_map:
             out[provider] = {}
-            if 'embeddings_models' in ModelsBaseSettings().providers_list_map[provider]:
+            if 'embeddings_models' in providers_list_map[provider]:
                 out[provider]["embeddings_models"] = []
-                for model in ModelsBaseSettings().providers_list_map[provider]['embeddings_models']['models_map']:
+                for model in providers_list_map[provider]['embeddings_models']['models_map']:
                     out[provider]["embeddings_models"].append(model)
-            if 'models' in ModelsBaseSettings().providers_list_map[provider]:
+            if 'models' in providers_list_map[provider]:
                 out[provider]["models"] = []
-                for model in ModelsBaseSettings().providers_list_map[provider]['models']:
+                for model in providers_list_map[provider]['models']:
                     out[provider]["models"].append(model)
 
             if not out[provider]:
@@ -44,11 +54,52 @@ def list_models(by_provider: str = None, models_only: bool = False, embeddings_o
 
 def get_model_settings(model: str):
     # get the settings of a model 
-    for provider in ModelsBaseSettings().providers_list_map:
-        if 'embeddings_models' in ModelsBaseSettings().providers_list_map[provider] and model in ModelsBaseSettings().providers_list_map[provider]["embeddings_models"]["models_map"]:
-            return ModelsBaseSettings().providers_list_map[provider]["embeddings_models"]["models_map"][model]().model_settings
-        
-    raise ValueError(f"Model {model} not found in settings.")
+    resolved_model = resolve_model(model)
+    if resolved_model.model_type != 'embeddings':
+        raise ValueError(f"Model {model} not found in settings.")
+    return resolved_model.model_class().model_settings
+
+
+def embed_many(model: str, documents: Iterable[Document | TextChunk], model_settings: dict = None, batch_size: int = 32, as_batch: bool = False, **kwargs) -> Union[List[Vector], VectorBatch]:
+    """
+    Generate the embeddings of several documents with one call.
 
+    usage:
+    - embed_many("amazon.titan-embed-text-v2:0", chunks, {"dimensions": 512}, batch_size=64, max_workers=16)
+
+    Args:
+        model (str): The embeddings model name.
+        documents (Iterable[Document | TextChunk]): The documents or text chunks to embed.
+        model_settings (dict, optional): The settings for the model.
+        batch_size (int, optional): The number of documents processed together. Defaults to 32.
+        as_batch (bool, optional): Return a VectorBatch (contiguous float32 matrix) instead of a list. Defaults to False.
+        **kwargs: Provider specific options (eg. max_workers for AWS).
+
+    Returns:
+        List[Vector] | VectorBatch: The generated embeddings, in the same order as the documents.
+    """
+    resolved_model = resolve_model(model)
+    if resolved_model.model_type != 'embeddings':
+        raise ValueError(f"Model {model} is not an embeddings model.")
+    if resolved_model.batch_embedding_func is None:
+        vectors = [resolved_model.embedding_func(model, document, model_settings) for document in documents]
+    else:
+        vectors = resolved_model.batch_embedding_func(model, documents, model_settings, batch_size=batch_size, **kwargs)
+    return VectorBatch.from_vectors(vectors) if as_batch else vectors
 
 
+def embed_queries(model: str, queries: List[Union[str, List[float], Vector]], model_settings: dict = None, **kwargs) -> List[Union[List[float], Vector]]:
+    """
+    Embeds the text queries of a list of queries with one embed_many call, the query vectors are kept as is.
+    Used by the query_many method of the vector stores.
+    """
+    texts = [i for i, query in enumerate(queries) if isinstance(query, str)]
+    if not texts:
+        return list(queries)
+    if not model:
+        raise Exception("model is required to embed the text queries !")
+    documents = [Document(content=queries[i], page_number=-1, data_type="text") for i in texts]
+    embedded = list(queries)
+    for i, vector in zip(texts, embed_many(model, documents, model_settings, **kwargs)):
+        embedded[i] = vector
+    return embedded
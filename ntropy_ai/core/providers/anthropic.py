@@ -1,7 +1,8 @@
 import json
 import base64
+import asyncio
 from ntropy_ai.core.utils.chat import ChatHistory, ChatManager
-from ntropy_ai.core.utils import ensure_local_file
+from ntropy_ai.core.utils import ensure_local_file, aretrieve, require_connection
 from ntropy_ai.core.utils.connections_manager import ConnectionManager
 import os
 import anthropic as AnthropicClient
@@ -24,6 +25,7 @@ class AnthropicConnection():
         """
         self.api_key = api_key
         self.client = None
+        self.async_client = None
         self.other_setting = other_setting
 
     def init_connection(self):
@@ -47,6 +49,17 @@ class AnthropicConnection():
         if self.client is None:
             self.init_connection()
         return self.client
+
+    def get_async_client(self):
+        """
+        Retrieve the AsyncAnthropic client, it is created on first use.
+
+        Returns:
+            anthropic.AsyncAnthropic: The async Anthropic client instance.
+        """
+        if self.async_client is None:
+            self.async_client = AnthropicClient.AsyncAnthropic(api_key=self.api_key)
+        return self.async_client
     
     def get_other_setting(self):
         """
@@ -69,6 +82,16 @@ def get_client():
     return ConnectionManager().get_connection("Anthropic").get_client()
 
 
+def get_async_client():
+    """
+    Retrieve the AsyncAnthropic client from the connection manager.
+
+    Returns:
+        anthropic.AsyncAnthropic: The async Anthropic client instance.
+    """
+    return ConnectionManager().get_connection("Anthropic").get_async_client()
+
+
 def require_login(func):
     """
     Decorator to ensure that the Anthropic connection is initialized before calling the function.
@@ -79,11 +102,7 @@ def require_login(func):
     Returns:
         function: The wrapped function.
     """
-    def wrapper(*args, **kwargs):
-        if ConnectionManager().get_connection("Anthropic") is None:
-            raise Exception("Anthropic connection not found. Please initialize the connection.")
-        return func(*args, **kwargs)
-    return wrapper
+    return require_connection("Anthropic")(func)
 
 
 class utils:
@@ -166,6 +185,23 @@ class AnthropicModel():
         self.agent_prompt = agent_prompt
         self.anthropic_client = get_client()
 
+    def add_rag_prompt(self, query: str, context: list):
+        """
+        build the agent prompt with the retrieved context and add it to the chat history
+        """
+        if not self.agent_prompt:
+            warnings.warn("agent_prompt is not defined.")
+        prompt = self.agent_prompt(query=query, context=context)
+        final_prompt = prompt.prompt
+        # print('used docs: ', prompt.context_doc) access source if you want
+        
+        # add the prompt and the context to the chat history
+
+        if prompt.images_list:
+            self.history.add_message(role='user', content=final_prompt, images=prompt.images_list)
+        else:
+            self.history.add_message(role='user', content=final_prompt)
+
     @require_login
     def chat(self, query: str, images: list = []):
         """
@@ -175,22 +211,11 @@ class AnthropicModel():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and images:
+            elif images:
                 if len(images) > 1:
                     warnings.warn("Only one image is supported for now.")
                 context.extend(self.retriever(query_image=images[0]))
-            if not self.agent_prompt:
-                warnings.warn("agent_prompt is not defined.")
-            prompt = self.agent_prompt(query=query, context=context)
-            final_prompt = prompt.prompt
-            # print('used docs: ', prompt.context_doc) access source if you want
-            
-            # add the prompt and the context to the chat history
-
-            if prompt.images_list:
-                self.history.add_message(role='user', content=final_prompt, images=prompt.images_list)
-            else:
-                self.history.add_message(role='user', content=final_prompt)
+            self.add_rag_prompt(query, context)
 
             response = self.anthropic_client.messages.create(
                 model=self.model_name,
@@ -209,4 +234,34 @@ class AnthropicModel():
 
 
         self.history.add_message(role='assistant', content=response.content[0].text)
-        return response.content[0].text
\ No newline at end of file
+        return response.content[0].text
+
+    @require_login
+    async def achat(self, query: str, images: list = []):
+        """
+        async chat with the model, using the AsyncAnthropic client
+        the retriever can be a coroutine function (eg. Pinecone.aquery), otherwise it runs in the default executor
+        the images are downloaded and read in a worker thread so the event loop is not blocked
+        """
+        anthropic_client = get_async_client()
+        if self.retriever:
+            context = []
+            if query:
+                context.extend(await aretrieve(self.retriever, query_text=query))
+            elif images:
+                if len(images) > 1:
+                    warnings.warn("Only one image is supported for now.")
+                context.extend(await aretrieve(self.retriever, query_image=images[0]))
+            self.add_rag_prompt(query, context)
+        else:
+            self.history.add_message(role='user', content=query, images=images)
+
+        messages = await asyncio.to_thread(utils.format_chat_to_anthropic_format, self.history.get_history())
+        response = await anthropic_client.messages.create(
+            model=self.model_name,
+            max_tokens=1024,
+            messages=messages
+        )
+
+        self.history.add_message(role='assistant', content=response.content[0].text)
+        return response.content[0].text
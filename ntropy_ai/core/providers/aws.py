@@ -1,24 +1,33 @@
 from pydantic import BaseModel, Field, ConfigDict
 from pydantic.fields import PydanticUndefined
-from typing import Union, List
+from typing import Union, List, Iterable, Iterator, Callable, Tuple
 import base64
 import json
 from datetime import datetime
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
-from ntropy_ai.core.utils.base_format import Vector, Document, TextChunk
-from ntropy_ai.core.utils.settings import ModelsBaseSettings
+from ntropy_ai.core.utils.base_format import Vector, VectorBatch, Document, TextChunk
+from ntropy_ai.core.utils.settings import ModelsBaseSettings, resolve_model
 from ntropy_ai.core.utils.connections_manager import ConnectionManager
-import boto3
+from ntropy_ai.core.utils.embeddings_cache import get_embeddings_cache
+from ntropy_ai.core.utils.query_cache import get_query_cache
+from ntropy_ai.core.utils.filters import Eq, Filter, filter_field_names, filter_fields, opensearch_field, to_opensearch
+from ntropy_ai.core.utils.hybrid import fuse
+from ntropy_ai.core.providers import embed_queries
 import os
 import random
 import time
-from ntropy_ai.core.utils import Loader, ensure_local_file
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+import threading
+import asyncio
+import functools
+from ntropy_ai.core.utils import Loader, ensure_local_file, aretrieve, require_connection
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from ntropy_ai.core.utils.chat import ChatManager, ChatHistory
 from ntropy_ai.core.utils.settings import logger
 import logging
 
 
+# boto3, botocore and opensearch-py are imported inside the functions that use them, so importing this module stays cheap.
+
 # AWSConnection class handles the connection to AWS services using boto3
 class AWSConnection:
     def __init__(self, access_key: str, secret_access_key: str, other_setting: dict, **kwargs):
@@ -37,17 +46,26 @@ class AWSConnection:
         # Set the region name, defaulting to 'us-east-1' if not provided
         self.region_name = other_setting.get("region_name", "us-east-1") if other_setting else "us-east-1"
         self.session = None
+        # service name -> boto3 client, the clients (and their http connection pool) are shared by all the calls
+        self.service_clients = {}
+        self._service_clients_lock = threading.Lock()
+        # model name -> AdaptiveConcurrencyLimiter, shared by all the bulk embeddings calls
+        self.concurrency_limiters = {}
 
     def init_connection(self):
         """
         Initializes the AWS session using the provided credentials and settings.
         """
+        import boto3
+        from botocore.exceptions import NoCredentialsError, PartialCredentialsError
         try:
             self.session = boto3.Session(
                 aws_access_key_id=self.aws_access_key_id,
                 aws_secret_access_key=self.aws_secret_access_key,
                 region_name=self.region_name
             )
+            # the clients of the previous session are dropped
+            self.service_clients = {}
             logger.info("AWS connection initialized successfully.")
         except (NoCredentialsError, PartialCredentialsError) as e:
             raise Exception(f"Error initializing AWS connection: {e}")
@@ -62,7 +80,73 @@ class AWSConnection:
         if self.session is None:
             self.init_connection()
         return self.session
+
+    def get_client_config(self):
+        """
+        Returns the botocore config of the service clients, built from other_setting:
+        - max_pool_connections (default 50)
+        - retry_mode: legacy, standard or adaptive (default standard)
+        - max_attempts (default 5)
+        - connect_timeout and read_timeout in seconds (default 10 and 60)
+
+        Returns:
+            botocore.config.Config: The clients config.
+        """
+        from botocore.config import Config
+        other_setting = self.other_setting or {}
+        return Config(
+            max_pool_connections=other_setting.get("max_pool_connections", 50),
+            retries={
+                "mode": other_setting.get("retry_mode", "standard"),
+                "max_attempts": other_setting.get("max_attempts", 5)
+            },
+            connect_timeout=other_setting.get("connect_timeout", 10),
+            read_timeout=other_setting.get("read_timeout", 60)
+        )
+
+    def get_service_client(self, service_name: str):
+        """
+        Returns the client of an AWS service, it is created once and then reused.
+        boto3 clients are thread-safe, the same client can be used by several threads.
+
+        Args:
+            service_name (str): The service name (eg. "bedrock-runtime", "s3", "textract").
+
+        Returns:
+            botocore.client.BaseClient: The service client.
+        """
+        client = self.service_clients.get(service_name)
+        if client is None:
+            # the boto3 session is not thread-safe, the clients are created under the lock
+            with self._service_clients_lock:
+                client = self.service_clients.get(service_name)
+                if client is None:
+                    client = self.get_client().client(service_name, config=self.get_client_config())
+                    self.service_clients[service_name] = client
+        return client
     
+    def get_concurrency_limiter(self, model: str) -> "AdaptiveConcurrencyLimiter":
+        """
+        Returns the concurrency limiter of a model, its maximum concurrency is read from other_setting
+        (embeddings_concurrency[model], then embeddings_max_concurrency, default 16).
+
+        Args:
+            model (str): The model name.
+
+        Returns:
+            AdaptiveConcurrencyLimiter: The limiter of the model.
+        """
+        limiter = self.concurrency_limiters.get(model)
+        if limiter is None:
+            with self._service_clients_lock:
+                limiter = self.concurrency_limiters.get(model)
+                if limiter is None:
+                    other_setting = self.other_setting or {}
+                    max_limit = (other_setting.get("embeddings_concurrency") or {}).get(model, other_setting.get("embeddings_max_concurrency", 16))
+                    limiter = AdaptiveConcurrencyLimiter(max_limit=max_limit)
+                    self.concurrency_limiters[model] = limiter
+        return limiter
+
     def get_other_setting(self):
         """
         Returns the additional settings for the connection.
@@ -72,6 +156,83 @@ class AWSConnection:
         """
         return self.other_setting
 
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of concurrent requests with an AIMD policy (additive increase, multiplicative decrease):
+    the limit grows by one after a full window of successful requests and is halved when a request is throttled.
+    The other failures change nothing.
+
+    usage:
+    - with limiter:
+        invoke the model
+      a throttled request must call limiter.on_throttle() before leaving the block,
+      the block is a success when it ends without an exception
+    - limiter.acquire(), then limiter.on_success() or limiter.on_throttle(), then limiter.release()
+    """
+    def __init__(self, max_limit: int, initial_limit: int = None, min_limit: int = 1):
+        """
+        Args:
+            max_limit (int): The maximum number of concurrent requests.
+            initial_limit (int, optional): The starting limit. Defaults to a quarter of max_limit.
+            min_limit (int, optional): The minimum limit. Defaults to 1.
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit or max(min_limit, max_limit // 4))
+        self.in_flight = 0
+        self.throttles = 0
+        self._successes = 0
+        self._outcome = threading.local()
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        self._outcome.value = None
+
+    def on_success(self):
+        """
+        Marks the current request as successful, it counts towards the next increase of the limit when it is released.
+        """
+        self._outcome.value = "success"
+
+    def on_throttle(self):
+        """
+        Marks the current request as throttled, the limit is halved when it is released.
+        """
+        self._outcome.value = "throttle"
+
+    def release(self):
+        """
+        Releases the slot of the current request. A request that is neither successful nor throttled leaves the limit unchanged.
+        """
+        outcome = getattr(self._outcome, 'value', None)
+        self._outcome.value = None
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == "throttle":
+                self.throttles += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._successes = 0
+            elif outcome == "success":
+                self._successes += 1
+                if self._successes >= int(self.limit):
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None and self._outcome.value is None:
+            self.on_success()
+        self.release()
+
+
 # Utility class for AWS-related operations
 class utils:
     @staticmethod
@@ -84,6 +245,29 @@ class utils:
         """
         return ConnectionManager().get_connection("AWS").get_client()
 
+    @staticmethod
+    def get_service_client(service_name: str):
+        """
+        Retrieves the cached client of an AWS service from the connection manager.
+
+        Args:
+            service_name (str): The service name (eg. "bedrock-runtime").
+
+        Returns:
+            botocore.client.BaseClient: The service client.
+        """
+        return ConnectionManager().get_connection("AWS").get_service_client(service_name)
+
+    @staticmethod
+    def is_throttling_error(error: Exception) -> bool:
+        """
+        Returns True if the error is a botocore ClientError raised because the request was throttled.
+        """
+        response = getattr(error, 'response', None)
+        if not isinstance(response, dict):
+            return False
+        return response.get('Error', {}).get('Code') in ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException')
+
     @staticmethod
     def get_other_settings():
         """
@@ -105,11 +289,7 @@ class utils:
         Returns:
             function: The decorated function.
         """
-        def wrapper(*args, **kwargs):
-            if ConnectionManager().get_connection("AWS") is None:
-                raise Exception("AWS connection not found. Please initialize the connection.")
-            return func(*args, **kwargs)
-        return wrapper
+        return require_connection("AWS")(func)
     
     @require_login
     def textract(document: str, retries: int = 0):
@@ -142,7 +322,7 @@ class utils:
             if not document_s3_bucket or not document_s3_path:
                 raise ValueError("Invalid document format. Please provide a valid document containing a valid S3 URL or a local path.")
 
-        textract_client = utils.get_client().client("textract")
+        textract_client = utils.get_service_client("textract")
         response = textract_client.start_document_text_detection(
                    DocumentLocation={
                        'S3Object': {
@@ -178,6 +358,111 @@ class utils:
         img = open(image, 'rb').read()
         return base64.b64encode(img).decode('utf-8')
     
+    def prepare_embeddings_body(model: str, model_settings: dict) -> dict:
+        """
+        Builds and validates the request body of an embeddings model, without the document inputs.
+
+        Args:
+            model (str): The name of the AWS model.
+            model_settings (dict): The settings for the model.
+
+        Returns:
+            dict: The body fields, inputText and inputImage are set by invoke_embeddings_model.
+        """
+        # Retrieve the model input schema from the settings
+        embedding_model_setting = resolve_model(model).input_schema
+        if embedding_model_setting is None:
+            raise ValueError(f"Model {model} not found in settings. Please check the model name.")
+
+        # Initialize body fields with default values from the model input schema
+        body_fields = {key: value.default for key, value in embedding_model_setting.model_fields.items()}
+
+        # Update body fields with provided model settings
+        for key, value in model_settings.items():
+            if key in body_fields:
+                body_fields[key] = value
+
+        # Set model_name field
+        body_fields["model_name"] = model
+
+        # Check if the keys of the input model_settings are actual keys of the model
+        for key in model_settings.keys():
+            if key not in body_fields:
+                raise ValueError(f"Model setting [{key}] does not exist for model {model}.")
+
+        # Remove any fields with PydanticUndefined value
+        keys_to_delete = [key for key, value in body_fields.items() if value is PydanticUndefined]
+        for key in keys_to_delete:
+            del body_fields[key]
+
+        # Validate the body fields with Pydantic
+        try:
+            embedding_model_setting.model_validate(body_fields)
+        except Exception:
+            raise ValueError(f"Error. Please check if the settings are correct. Use model_settings(model) to check the correct settings.")
+
+        # Remove model_name from body fields before sending the request
+        if "model_name" in body_fields:
+            del body_fields["model_name"]
+        return body_fields
+
+    def invoke_embeddings_model(client, model: str, document: Document | TextChunk, body_fields: dict, model_settings: dict) -> Vector:
+        """
+        Embeds one document with a Bedrock runtime client and a body prepared by prepare_embeddings_body.
+
+        Returns:
+            Vector: The generated embeddings as a Vector object.
+        """
+        # Prepare metadata for the output
+        output_metadata = {
+            'model': model,
+            'model_settings': model_settings,
+            'timestamp': datetime.now().isoformat()
+        }
+        # Extract text and image inputs from the document
+        text_input = document.content if isinstance(document, Document) or isinstance(document, str) else document.chunk
+        image_input = document.image if isinstance(document, Document) else None
+
+        # Set inputText and inputImage fields (copy, the body is shared between the requests)
+        body_fields = dict(body_fields)
+        body_fields["inputText"] = text_input
+        output_metadata['chunk'] = document.chunk_number if hasattr(document, 'chunk_number') else None
+        output_metadata['content'] = text_input
+
+        image_bytes = None
+        if image_input:
+            image_input = ensure_local_file(image_input)
+            image_bytes = open(image_input, 'rb').read()
+            body_fields["inputImage"] = base64.b64encode(image_bytes).decode('utf8')
+            output_metadata['image_path'] = image_input
+
+        # the body settings already contain the defaults of the model, so they are the normalized settings of the cache key
+        cache = get_embeddings_cache()
+        response_embeddings = None
+        if cache is not None:
+            cache_key = cache.make_key(model, {key: value for key, value in body_fields.items() if key not in ("inputText", "inputImage")}, text=text_input, image=image_bytes)
+            response_embeddings = cache.get(cache_key)
+
+        if response_embeddings is None:
+            # Invoke the model with the prepared body fields
+            response = client.invoke_model(
+                body=json.dumps(body_fields), modelId=model, accept="application/json", contentType="application/json"
+            )
+            response_body = json.loads(response.get('body').read())
+            response_embeddings = response_body['embedding']
+            if cache is not None:
+                cache.set(cache_key, response_embeddings)
+
+        # Return the generated embeddings as a Vector object
+        return Vector(
+            document_id=document.id,
+            vector=response_embeddings,
+            size=len(response_embeddings),
+            data_type="text" if text_input else "image",
+            content=text_input if text_input else image_input,
+            metadata=output_metadata
+        )
+
     def format_chat_to_bedrock_format(chat: ChatHistory):
         messages = []
         for message in chat:
@@ -203,7 +488,7 @@ class s3_utils():
         if not default_bucket:
             default_bucket = ModelsBaseSettings().providers_list_map["AWS"]["settings"]["default_s3_bucket"]
         self.default_bucket = default_bucket
-        self.s3_client = utils.get_client().client("s3")
+        self.s3_client = utils.get_service_client("s3")
 
     @utils.require_login
     def upload_to_s3(self, file_name: str, bucket: str = None, object_name: str = None):
@@ -218,6 +503,7 @@ class s3_utils():
             Returns:
                 str: The URL of the uploaded file, or None if an error occurred.
         """
+        from botocore.exceptions import NoCredentialsError
         if bucket:
             self.default_bucket = bucket
         try:
@@ -263,6 +549,7 @@ class s3_utils():
         Returns:
             str: The path to the downloaded file, or None if an error occurred.
         """
+        from botocore.exceptions import NoCredentialsError
         if bucket:
             self.default_bucket = bucket
         try:
@@ -296,6 +583,7 @@ class OpenSearchServerless:
             default_index: str = None, 
             region: str = "us-east-1"
         ):
+        from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
         self.embedding_func = None
         self.embedding_model_settings = None
         self.embedding_model_name = None
@@ -315,17 +603,15 @@ class OpenSearchServerless:
             connection_class = RequestsHttpConnection,
             pool_maxsize = 20
         )  
+        # index name -> mapping, read once per index
+        self.index_mappings = {}
+        # the indexes without the filter_fields keyword template, already warned about
+        self.keyword_fallback_indexes = set()
     
     def set_embeddings_model(self, model: str, model_settings: dict = None):
         self.embedding_model_settings = model_settings
         self.embedding_model_name = model
-        for provider in ModelsBaseSettings().providers_list_map:
-            if "embeddings_models" in ModelsBaseSettings().providers_list_map[provider]:
-                for model_name in ModelsBaseSettings().providers_list_map[provider]['embeddings_models']['models_map']:
-                    if model_name == model:
-                        self.embedding_func = ModelsBaseSettings().providers_list_map[provider]['functions']['embeddings']
-                        # this needs to be fixed !
-                        break
+        self.embedding_func = resolve_model(model).embedding_func
         if not self.embedding_func:
             raise Exception(f"model {model} not found !")
 
@@ -339,120 +625,520 @@ class OpenSearchServerless:
             body={
                 "settings": {"index.knn": True},
                 "mappings": {
+                    # the filterable fields are exact values (keyword), not full text
+                    "dynamic_templates": [
+                        {"filter_fields_strings": {"path_match": "filter_fields.*", "match_mapping_type": "string", "mapping": {"type": "keyword"}}}
+                    ],
                     "properties": {
                         "values": {"type": "knn_vector", "dimension": dimension},
-
+                        "vector_id": {"type": "keyword"},
+                        "document_id": {"type": "keyword"},
+                        "data_type": {"type": "keyword"},
+                        "content": {"type": "text"},
+                        # native objects, kept in _source but not indexed (the filterable keys are in filter_fields)
+                        "document_metadata": {"type": "object", "enabled": False},
+                        "output_metadata": {"type": "object", "enabled": False},
+                        "metadata": {"type": "object", "enabled": False}
                     }
                 },
             },
         )
 
 
-    def add_vectors(self, vectors: List[float], index: str = None):
+    def get_index_mapping(self, index: str) -> dict:
+        """
+        Returns the mapping of an index (read once per index).
+        """
+        if index not in self.index_mappings:
+            response = self.opensearch_client.indices.get_mapping(index=index)
+            mapping = response[index] if index in response else next(iter(response.values()))
+            self.index_mappings[index] = mapping['mappings']
+        return self.index_mappings[index]
+
+    def get_index_properties(self, index: str) -> dict:
+        """
+        Returns the mapping properties of an index (read once per index).
+        """
+        return self.get_index_mapping(index).get('properties', {})
+
+    def keyword_fields(self, index: str, filter: Filter) -> set:
+        """
+        Returns the fields of a filter mapped as text with a keyword sub-field, their Eq / In filters use the sub-field
+        (a term query on an analyzed text field matches nothing).
+        The indexes created without the filter_fields keyword template (before it was added to create_index, or by another tool)
+        map the metadata strings dynamically as text + keyword: the fields not mapped yet are assumed to be mapped that way.
+        """
+        mapping = self.get_index_mapping(index)
+        has_template = any("filter_fields_strings" in template for template in mapping.get('dynamic_templates', []))
+        if not has_template and index not in self.keyword_fallback_indexes:
+            self.keyword_fallback_indexes.add(index)
+            logger.warning(f"Index {index} has no keyword mapping for the filter fields, the string filters use the .keyword sub-fields.")
+
+        def field_mapping(field: str) -> Union[dict, None]:
+            properties = {'properties': mapping.get('properties', {})}
+            for part in field.split("."):
+                properties = properties.get('properties', {}).get(part)
+                if properties is None:
+                    return None
+            return properties
+
+        fields = set()
+        for field in map(opensearch_field, filter_field_names(filter)):
+            properties = field_mapping(field)
+            if properties is None:
+                if not has_template:
+                    fields.add(field)
+            elif properties.get('type') == "text" and 'keyword' in properties.get('fields', {}):
+                fields.add(field)
+        return fields
+
+    def get_dimension(self, index: str) -> int:
+        """
+        Returns the dimension of the knn_vector field of an index, from its mapping.
+        """
+        return self.get_index_properties(index)['values']['dimension']
+
+    def has_native_metadata(self, index: str) -> bool:
+        # the indices created before the metadata was stored as native objects map it as a string
+        return self.get_index_properties(index).get('document_metadata', {}).get('type') not in ('text', 'keyword')
+
+    @staticmethod
+    def decode_metadata(value) -> dict:
+        if value is None:
+            return {}
+        return json.loads(value) if isinstance(value, str) else value
+
+    def to_document(self, vector: Vector, native_metadata: bool = True) -> dict:
+        encode = (lambda value: value) if native_metadata else (lambda value: json.dumps(value) if isinstance(value, dict) else value)
+        return {
+            "values": vector.to_list(),
+            # the serverless collections generate the _id, the vector id is kept to find the document again (delete, re-ingestion)
+            "vector_id": vector.id,
+            "document_id": vector.document_id,
+            "content": vector.content,
+            "data_type": vector.data_type,
+            "document_metadata": encode(vector.document_metadata),
+            "output_metadata": encode(vector.output_metadata),
+            "metadata": encode(getattr(vector, 'metadata', {})),
+            # flattened metadata keys (eg. document_metadata.page_number), so they can be filtered
+            "filter_fields": filter_fields(vector.document_metadata, vector.output_metadata)
+        }
+
+    @staticmethod
+    def make_chunks(lines: List[str], chunk_size: int, max_chunk_bytes: int) -> List[List[int]]:
+        """
+        Splits the bulk items (serialized action + document lines) in chunks of at most chunk_size items and max_chunk_bytes bytes.
+
+        Returns:
+            List[List[int]]: The items positions of each chunk.
+        """
+        chunks, chunk, chunk_bytes = [], [], 0
+        for position, line in enumerate(lines):
+            line_bytes = len(line.encode('utf-8'))
+            if chunk and (len(chunk) >= chunk_size or chunk_bytes + line_bytes > max_chunk_bytes):
+                chunks.append(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(position)
+            chunk_bytes += line_bytes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def add_vectors(self,
+                    vectors: Union[List[Vector], VectorBatch],
+                    index: str = None,
+                    chunk_size: int = 500,
+                    max_chunk_bytes: int = 5 * 1024 * 1024,
+                    max_workers: int = 4,
+                    max_retries: int = 3,
+                    progress: Callable[[int, int], None] = None) -> List[dict]:
         """
         Adds vectors to the specified OpenSearch index using the bulk API.
 
+        The vectors are sent in chunks (by number of items and bytes) by parallel bulk workers.
+        Only the items that failed with a retryable error (429, 5xx) are sent again, with exponential backoff.
+
         Args:
-            vectors (List[Vector]): The list of vectors to add.
+            vectors (List[Vector] | VectorBatch): The vectors to add.
             index (str, optional): The name of the index. Defaults to the default index.
+            chunk_size (int, optional): The maximum number of vectors per bulk request. Defaults to 500.
+            max_chunk_bytes (int, optional): The maximum size of a bulk request body. Defaults to 5MB.
+            max_workers (int, optional): The number of parallel bulk requests. Defaults to 4.
+            max_retries (int, optional): The number of retries of the failed items. Defaults to 3.
+            progress (Callable[[int, int], None], optional): Called with (number of indexed vectors, total) after each chunk.
+
+        Returns:
+            List[dict]: One report per chunk: chunk, size, indexed, attempts and errors (the items that could not be indexed).
         """
         index = index or self.default_index
         if not index:
             raise ValueError("Index must be specified either as a parameter or as a default index.")
 
-        actions = []
-        for vector in vectors:
-            action_metadata = {
-                "index": {
-                    "_index": index
-                }
-            }
-            document = {
-                "values": vector.vector,
-                "document_id": vector.document_id,
-                "content": vector.content,
-                "data_type": vector.data_type,
-                "document_metadata": json.dumps(vector.document_metadata) if isinstance(vector.document_metadata, dict) else vector.document_metadata,
-                "output_metadata": json.dumps(vector.output_metadata) if isinstance(vector.output_metadata, dict) else vector.output_metadata,
-                "metadata": json.dumps(vector.metadata) if isinstance(vector.metadata, dict) else vector.metadata
-            }
-            actions.append(action_metadata)
-            actions.append(document)
-
-        # Perform the bulk operation
-        response = self.opensearch_client.bulk(body=actions)
-        if response['errors']:
-            raise Exception("Errors occurred during bulk indexing: {}".format(response['items']))
+        # each item is serialized once, the chunks and the retries reuse the lines
+        action_line = json.dumps({"index": {"_index": index}})
+        native_metadata = self.has_native_metadata(index)
+        if isinstance(vectors, VectorBatch):
+            vectors = vectors.to_vectors()
+        lines = [action_line + "\n" + json.dumps(self.to_document(vector, native_metadata), default=str) + "\n" for vector in vectors]
+        chunks = self.make_chunks(lines, chunk_size, max_chunk_bytes)
+        indexed_total = 0
+        lock = threading.Lock()
+
+        def bulk(chunk_number: int, positions: List[int]) -> dict:
+            nonlocal indexed_total
+            report = {"chunk": chunk_number, "size": len(positions), "indexed": 0, "attempts": 0, "errors": []}
+            pending = positions
+            for attempt in range(max_retries + 1):
+                report["attempts"] = attempt + 1
+                retryable = []
+                try:
+                    response = self.opensearch_client.bulk(body="".join(lines[position] for position in pending))
+                    for position, item in zip(pending, response['items']):
+                        result = item.get('index', item)
+                        if 'error' not in result:
+                            report["indexed"] += 1
+                            continue
+                        error = {"position": position, "status": result.get('status'), "error": result['error']}
+                        if result.get('status') == 429 or (result.get('status') or 0) >= 500:
+                            retryable.append(error)
+                        else: # eg. a mapping error, sending the item again would fail again
+                            report["errors"].append(error)
+                except Exception as e: # the whole request failed (connection error, 5xx...)
+                    retryable = [{"position": position, "status": getattr(e, 'status_code', None), "error": str(e)} for position in pending]
+                if not retryable:
+                    break
+                if attempt == max_retries:
+                    report["errors"].extend(retryable)
+                    break
+                pending = [error["position"] for error in retryable]
+                time.sleep(random.uniform(0, min(10, 0.5 * 2 ** attempt)))
+            if progress is not None:
+                with lock:
+                    indexed_total += report["indexed"]
+                    progress(indexed_total, len(lines))
+            return report
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            reports = list(executor.map(bulk, range(len(chunks)), chunks))
+        self.invalidate_query_cache(index)
+        failed = sum(len(report["errors"]) for report in reports)
+        if failed:
+            logger.error(f"{failed} of {len(lines)} vectors could not be indexed, see the returned report.")
+        return reports
         
     def query(
             self, 
-            query_vector: List[float] = None, 
+            query_vector: Union[List[float], Vector] = None, 
             query_text: str = None,
             index: str = None, 
-            top_k: int = 3
+            top_k: int = 3,
+            filter: Filter = None,
+            include_values: bool = True
         ):
+        """
+        k-NN query. filter (eg. Eq("data_type", "text") & Range("document_metadata.page_number", lte=3)) is applied
+        during the k-NN search (knn filter), so k results are returned when enough documents match.
+        The vectors values are excluded from _source with include_values=False (the Vectors then have an empty vector and size 0).
+        The results are cached when the query cache is enabled (see enable_query_cache).
+        """
+        index = index or self.default_index
+        if not index:
+            raise ValueError("Index must be specified either as a parameter or as a default index.")
+        cache, cache_key = get_query_cache(), None
+        if cache is not None and (query_vector is not None or query_text):
+            scope = cache.make_scope("opensearch", self.host, index)
+            cache_key = cache.make_key(
+                scope, query_text if query_vector is None else query_vector, top_k, include_values, filter,
+                self.embedding_model_name if query_vector is None else None,
+                self.embedding_model_settings if query_vector is None else None
+            )
+            results = cache.get(cache_key)
+            if results is not None:
+                return results
+            generation = cache.generation(scope)
+        if query_vector is None:
+            query_vector = self.embed_query(query_text)
+        results = self.opensearch_client.search(index=index, body=self.knn_search_body(query_vector, top_k, filter, include_values, index=index))
+        vectors = [self.hit_to_vector(hit, index) for hit in results['hits']['hits']]
+        if cache_key is not None:
+            cache.set(cache_key, scope, vectors, generation)
+        return vectors
+
+    def delete(self, ids: List[str], index: str = None, batch_size: int = 1000) -> int:
+        """
+        Deletes the documents of the given vector ids (delete_by_query on vector_id, batch_size ids per request).
+        The documents written without vector_id are matched by their _id (their vector id, see hit_to_vector).
+
+        Returns:
+            int: The number of deleted documents.
+        """
+        index = index or self.default_index
+        if not index:
+            raise ValueError("Index must be specified either as a parameter or as a default index.")
+        deleted = 0
+        for start in range(0, len(ids), batch_size):
+            batch = list(ids[start:start + batch_size])
+            query = {"bool": {"should": [{"terms": {"vector_id": batch}}, {"ids": {"values": batch}}], "minimum_should_match": 1}}
+            response = self.opensearch_client.delete_by_query(index=index, body={"query": query}, params={"conflicts": "proceed"})
+            deleted += response.get('deleted', 0)
+        self.invalidate_query_cache(index)
+        return deleted
+
+    def delete_by_document(self, document_id: str, index: str = None) -> int:
+        """
+        Deletes the documents of a source document (delete_by_query on document_id).
+
+        Returns:
+            int: The number of deleted documents.
+        """
+        return self.delete_by_filter(Eq("document_id", document_id), index=index)
+
+    def delete_by_filter(self, filter: Filter, index: str = None) -> int:
+        """
+        Deletes the documents matching a filter (eg. Eq("document_metadata.source", "report.pdf")) with one delete_by_query.
+
+        Returns:
+            int: The number of deleted documents.
+        """
         index = index or self.default_index
+        if not index:
+            raise ValueError("Index must be specified either as a parameter or as a default index.")
+        response = self.opensearch_client.delete_by_query(index=index, body={"query": {"bool": {"filter": [to_opensearch(filter, self.keyword_fields(index, filter))]}}}, params={"conflicts": "proceed"})
+        self.invalidate_query_cache(index)
+        failures = response.get('failures') or []
+        if failures:
+            logger.error(f"{len(failures)} documents of {index} could not be deleted: {failures[:3]}")
+        return response.get('deleted', 0)
+
+    def invalidate_query_cache(self, index: str):
+        # the cached query results of the index may not include the written documents
+        cache = get_query_cache()
+        if cache is not None:
+            cache.invalidate(cache.make_scope("opensearch", self.host, index))
+
+    def embed_query(self, query_text: str) -> Vector:
+        """
+        Embeds a text query with the embeddings model of the store.
+        """
         model = self.embedding_model_name
         model_settings = self.embedding_model_settings
-
         if not model or not model_settings:
             raise ValueError("model and model_settings are required !")
+        query_vector_func = None
+        # if the user did not set a default embedding model but specified one in the parameters
+        if not self.embedding_func:
+            if not model_settings:
+                if not self.embedding_model_settings:
+                    raise Exception("model settings is required to match the output format !")
+                model_settings = self.embedding_model_settings
+            query_vector_func = resolve_model(model).embedding_func
+        else:
+            logger.warning("using default embedding model")
+            query_vector_func = self.embedding_func
+        if not query_vector_func:
+            raise Exception(f"model {model} not found !")
+
+        if query_text:
+            document = Document(content=query_text, page_number=-1, data_type="text")
+        else:
+            raise Exception("query_text or query_image is required !")
+        return query_vector_func(model, document, model_settings)
+
+    @staticmethod
+    def source_filter(include_values: bool) -> dict:
+        # filter_fields duplicates the metadata, the values are the bulk of the payload
+        return {"excludes": ["filter_fields"] if include_values else ["filter_fields", "values"]}
+
+    def knn_search_body(self, query_vector: Union[List[float], Vector], top_k: int, filter: Filter = None, include_values: bool = True, index: str = None) -> dict:
+        knn = {
+            "vector": query_vector.to_list() if isinstance(query_vector, Vector) else [float(value) for value in query_vector],
+            "k": top_k
+        }
+        if filter is not None:
+            knn["filter"] = to_opensearch(filter, self.keyword_fields(index, filter) if index else ())
+        return {
+            "size": top_k,
+            "query": {"knn": {"values": knn}},
+            "_source": self.source_filter(include_values)
+        }
+
+    def lexical_search_body(self, query_text: str, top_k: int, filter: Filter = None, include_values: bool = True, index: str = None) -> dict:
+        query = {"bool": {"must": [{"match": {"content": query_text}}]}}
+        if filter is not None:
+            query["bool"]["filter"] = [to_opensearch(filter, self.keyword_fields(index, filter) if index else ())]
+        return {
+            "size": top_k,
+            "query": query,
+            "_source": self.source_filter(include_values)
+        }
+
+    def query_many(
+            self,
+            queries: List[Union[str, List[float], Vector]],
+            index: str = None,
+            top_k: int = 3,
+            filter: Filter = None,
+            include_values: bool = True
+        ) -> List[List[Vector]]:
+        """
+        Runs several k-NN queries at once: the text queries are embedded in one batch (embed_many)
+        and the searches are sent in one msearch request.
+
+        Args:
+            queries (List[str | List[float] | Vector]): The query texts or query vectors.
+            index (str, optional): The name of the index. Defaults to the default index.
+            top_k (int, optional): The number of results per query. Defaults to 3.
+
+        Returns:
+            List[List[Vector]]: The results of each query, in the order of the queries.
+        """
+        index = index or self.default_index
         if not index:
             raise ValueError("Index must be specified either as a parameter or as a default index.")
-        
+        if len(queries) == 0:
+            return []
+        query_vectors = embed_queries(self.embedding_model_name, queries, self.embedding_model_settings)
+        body = []
+        for query_vector in query_vectors:
+            body.extend(({"index": index}, self.knn_search_body(query_vector, top_k, filter, include_values, index=index)))
+        results = []
+        for result in self.opensearch_client.msearch(body=body)['responses']:
+            if 'error' in result:
+                raise Exception(f"Error in multi search: {result['error']}")
+            results.append([self.hit_to_vector(hit, index) for hit in result['hits']['hits']])
+        return results
+
+    def hybrid_query(
+            self,
+            query_text: str,
+            query_vector: Union[List[float], Vector] = None,
+            index: str = None,
+            top_k: int = 3,
+            fusion: str = "rrf",
+            weights: Tuple[float, float] = (1.0, 1.0),
+            rrf_k: int = 60,
+            candidates: int = None,
+            filter: Filter = None,
+            include_values: bool = True
+        ) -> List[Vector]:
+        """
+        Hybrid search: a BM25 match query on content and the k-NN query are sent in one msearch request,
+        then the two rankings are fused (rrf or weighted scores).
 
-        if not query_vector:
-            query_vector_func = None
-            # if the user did not set a default embedding model but specified one in the parameters
-            if not self.embedding_func:
-                if not model_settings:
-                    if not self.embedding_model_settings:
-                        raise Exception("model settings is required to match the output format !")
-                    model_settings = self.embedding_model_settings
-                for provider in ModelsBaseSettings().providers_list_map:
-                    if "embeddings_models" in ModelsBaseSettings().providers_list_map[provider]:
-                        for model_name in ModelsBaseSettings().providers_list_map[provider]['embeddings_models']['models_map']:
-                            if model_name == model:
-                                query_vector_func = ModelsBaseSettings().providers_list_map[provider]['functions']['embeddings']
-                                break
-            else:
-                logger.warning("using default embedding model")
-                query_vector_func = self.embedding_func
-            if not query_vector_func:
-                raise Exception(f"model {model} not found !")
-
-            if query_text:
-                document = Document(content=query_text, page_number=-1, data_type="text")
-            else:
-                raise Exception("query_text or query_image is required !")
-            query_vector = query_vector_func(model, document, model_settings)
-
-
-        search_query = {
-            "query": 
-            {"knn": 
-             {"values": {
-                 "vector": query_vector.vector if isinstance(query_vector, Vector) else query_vector,
-                   "k": top_k}}}
-        }
-        results = self.opensearch_client.search(index=index, body=search_query)
-        
-        final_out = []
-        for hit in results['hits']['hits']:
-            final_out.append(
-                Vector(
-                    score=hit['_score'],
-                    size=len(hit['_source']['values']),
-                    document_id=hit['_source']['document_id'],
-                    vector=hit['_source']['values'],
-                    content=hit['_source']['content'],
-                    data_type=hit['_source']['data_type'],
-                    document_metadata=json.loads(hit['_source']['document_metadata']),
-                    output_metadata=json.loads(hit['_source']['output_metadata']),
-                    metadata={**json.loads(hit['_source']['metadata']), "_id": hit['_id'], "_index": hit['_index']},
-                )
-            )
-        return final_out
+        Args:
+            query_text (str): The query, searched as keywords and embedded (unless query_vector is given).
+            query_vector (List[float] | Vector, optional): The query embeddings.
+            index (str, optional): The name of the index. Defaults to the default index.
+            top_k (int, optional): The number of results. Defaults to 3.
+            fusion (str, optional): rrf (reciprocal rank fusion) or weighted (min-max normalized scores). Defaults to rrf.
+            weights (Tuple[float, float], optional): The weights of the k-NN and the lexical results. Defaults to (1.0, 1.0).
+            rrf_k (int, optional): The rrf rank constant. Defaults to 60.
+            candidates (int, optional): The number of results of each search before fusion. Defaults to max(2 * top_k, 20).
+            filter (Filter, optional): Applied to both searches.
+
+        Returns:
+            List[Vector]: The results, the score is the fused score.
+        """
+        index = index or self.default_index
+        if not index:
+            raise ValueError("Index must be specified either as a parameter or as a default index.")
+        candidates = candidates or max(2 * top_k, 20)
+        if query_vector is None:
+            query_vector = self.embed_query(query_text)
+        response = self.opensearch_client.msearch(body=[
+            {"index": index}, self.knn_search_body(query_vector, candidates, filter, include_values, index=index),
+            {"index": index}, self.lexical_search_body(query_text, candidates, filter, include_values, index=index)
+        ])
+        hits, rankings = {}, []
+        for result in response['responses']:
+            if 'error' in result:
+                raise Exception(f"Error in hybrid search: {result['error']}")
+            rankings.append([(hit['_id'], hit['_score']) for hit in result['hits']['hits']])
+            for hit in result['hits']['hits']:
+                hits.setdefault(hit['_id'], hit)
+        fused = fuse(rankings[0], rankings[1], fusion=fusion, weights=weights, rrf_k=rrf_k)[:top_k]
+        return [self.hit_to_vector({**hits[hit_id], '_score': score}, index) for hit_id, score in fused]
+
+    def hit_to_vector(self, hit: dict, index: str) -> Vector:
+        """
+        Maps a search hit back to the universal Vector format.
+        The id is the vector_id of the document, or its _id for the documents written without one (so it is the same on every read).
+        """
+        source = hit['_source']
+        values = source.get('values')
+        return Vector(
+            id=source.get('vector_id') or hit['_id'],
+            score=hit.get('_score'),
+            size=len(values) if values is not None else 0,
+            document_id=source['document_id'],
+            vector=values if values is not None else [],
+            content=source.get('content'),
+            data_type=source['data_type'],
+            document_metadata=self.decode_metadata(source.get('document_metadata')),
+            output_metadata=self.decode_metadata(source.get('output_metadata')),
+            metadata={**self.decode_metadata(source.get('metadata')), "_id": hit['_id'], "_index": hit['_index']},
+        )
+
+    def iter_vectors(self, index: str = None, batch_size: int = 500, cursor: Union[dict, None] = None) -> Iterator[Tuple[List[Vector], dict]]:
+        """
+        Streams the documents of an index with their values, batch_size at a time.
+        Yields each batch with the cursor to resume after it:
+        - search_after on vector_id when every document has one (resumable at any time),
+        - otherwise a scroll, resumed by skipping the documents already streamed.
+        """
+        index = index or self.default_index
+        if not index:
+            raise ValueError("Index must be specified either as a parameter or as a default index.")
+        cursor = cursor or {}
+        body = {"size": batch_size, "query": {"match_all": {}}, "_source": {"excludes": ["filter_fields"]}}
+        sort_field = self.vector_id_sort_field(index)
+        if sort_field is not None:
+            while True:
+                page = dict(body, sort=[{sort_field: "asc"}], **({"search_after": [cursor["search_after"]]} if cursor.get("search_after") else {}))
+                hits = self.opensearch_client.search(index=index, body=page)['hits']['hits']
+                if not hits:
+                    return
+                cursor = {"search_after": hits[-1]['sort'][0]}
+                yield [self.hit_to_source_vector(hit, index) for hit in hits], cursor
+        skip = cursor.get("skip", 0)
+        response = self.opensearch_client.search(index=index, body=body, params={"scroll": "10m"})
+        streamed = 0
+        try:
+            while response['hits']['hits']:
+                hits = response['hits']['hits']
+                streamed += len(hits)
+                if streamed > skip:
+                    yield [self.hit_to_source_vector(hit, index) for hit in hits[max(0, skip - streamed + len(hits)):]], {"skip": streamed}
+                response = self.opensearch_client.scroll(scroll_id=response['_scroll_id'], params={"scroll": "10m"})
+        finally:
+            if response.get('_scroll_id'):
+                self.opensearch_client.clear_scroll(scroll_id=response['_scroll_id'])
+
+    def vector_id_sort_field(self, index: str) -> Union[str, None]:
+        # vector_id is a keyword in the indexes created by create_index, a text with a keyword sub-field if mapped dynamically
+        vector_id = self.get_index_properties(index).get('vector_id')
+        if vector_id is None:
+            return None
+        field = "vector_id" if vector_id.get('type') == "keyword" else "vector_id.keyword" if 'keyword' in vector_id.get('fields', {}) else None
+        if field is None:
+            return None
+        # the documents written before vector_id existed can not be paged with search_after
+        missing = self.opensearch_client.count(index=index, body={"query": {"bool": {"must_not": {"exists": {"field": "vector_id"}}}}})['count']
+        return field if missing == 0 else None
+
+    def hit_to_source_vector(self, hit: dict, index: str) -> Vector:
+        # the _id and _index of the hit are not kept, the vector is written to another store
+        vector = self.hit_to_vector(hit, index)
+        vector.metadata = {key: value for key, value in vector.metadata.items() if key not in ("_id", "_index")}
+        vector.score = None
+        return vector
+
+    async def aquery(self, **kwargs):
+        """
+        Async version of query, it runs in the default executor so the event loop is not blocked.
+        Takes the same arguments as query.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.query, **kwargs))
 
 
 """
@@ -466,6 +1152,7 @@ class AWSEmbeddingModels:
     # Amazon Titan Multimodal Embeddings G1 Input Model
     class AmazonTitanMultimodalEmbeddingsG1Input(BaseModel):
         model_name: str = "amazon.titan-embed-image-v1"
+        output_dimension: int = 1024
         model_settings: dict = Field(default_factory=lambda: {
             'embeddingConfig': {
                 'outputEmbeddingLength': "Only the following values are accepted: 256, 384, 1024."
@@ -482,6 +1169,7 @@ class AWSEmbeddingModels:
     # Amazon Titan Embed Text V2 Input Model
     class AmazonTitanEmbedTextV2Input(BaseModel):
         model_name: str = "amazon.titan-embed-text-v2:0"
+        output_dimension: int = 1024
         model_settings: dict = Field(default_factory=lambda: {
             "dimensions": "Only the following values are accepted: 1024 (default), 512, 256.",
             "normalize": "True or False"
@@ -507,88 +1195,75 @@ def AWSEmbeddings(model: str, document: Document | TextChunk | str, model_settin
     Returns:
         Vector: The generated embeddings as a Vector object.
     """
-    accept = "application/json"
-    content_type = "application/json"
-
-    # Retrieve the model input schema from the settings
-    embedding_model_setting = ModelsBaseSettings().providers_list_map["AWS"]["embeddings_models"]["models_map"].get(model).ModelInputSchema
     if model_settings is None:
         model_settings = dict()
         logger.warning(f"Model settings for model {model} not provided. Using default settings.")
-        model_settings_ = ModelsBaseSettings().providers_list_map["AWS"]["embeddings_models"]["models_map"].get(model)().model_settings    
-    if embedding_model_setting is None:
-        raise ValueError(f"Model {model} not found in settings. Please check the model name.")
-    
-    # Prepare metadata for the output
-    output_metadata = {
-        'model': model,
-        'model_settings': model_settings,
-        'timestamp': datetime.now().isoformat()
-    }    
-    # Extract text and image inputs from the document
-    text_input = document.content if isinstance(document, Document) or isinstance(document, str) else document.chunk
-    image_input = document.image if isinstance(document, Document) else None
-
-    # Initialize body fields with default values from the model input schema
-    body_fields = {key: value.default for key, value in embedding_model_setting.model_fields.items()}
-
-    # Update body fields with provided model settings
-    for key, value in model_settings.items():
-        if key in body_fields:
-            body_fields[key] = value
-
-    # Set inputText and inputImage fields
-    body_fields["inputText"] = text_input
-    output_metadata['chunk'] = document.chunk_number if hasattr(document, 'chunk_number') else None
-    output_metadata['content'] = text_input
-
-    if image_input:
-        image_input = ensure_local_file(image_input)
-        body_fields["inputImage"] = base64.b64encode(open(image_input, 'rb').read()).decode('utf8')
-        output_metadata['image_path'] = image_input
-
-    # Set model_name field
-    body_fields["model_name"] = model
-    
-    # Check if the keys of the input model_settings are actual keys of the model
-    for key in model_settings.keys():
-        if key not in body_fields:
-            raise ValueError(f"Model setting [{key}] does not exist for model {model}.")
-    
-    # Remove any fields with PydanticUndefined value
-    keys_to_delete = [key for key, value in body_fields.items() if value is PydanticUndefined]
-    for key in keys_to_delete:
-        del body_fields[key]
-    
-    # Validate the body fields with Pydantic
-    try:
-        embedding_model_setting.model_validate(body_fields)
-    except Exception:
-        raise ValueError(f"Error. Please check if the settings are correct. Use model_settings(model) to check the correct settings.")
-    
-    # Remove model_name from body fields before sending the request
-    if "model_name" in body_fields:
-        del body_fields["model_name"]
-    
+    body_fields = utils.prepare_embeddings_body(model, model_settings)
+
     # Get the AWS Bedrock runtime client
-    client = utils.get_client().client("bedrock-runtime")
-
-    # Invoke the model with the prepared body fields
-    response = client.invoke_model(
-        body=json.dumps(body_fields), modelId=model, accept=accept, contentType=content_type
-    )
-    response_body = json.loads(response.get('body').read())
-    response_embeddings = response_body['embedding']
-
-    # Return the generated embeddings as a Vector object
-    return Vector(
-        document_id=document.id,
-        vector=response_embeddings,
-        size=len(response_embeddings),
-        data_type="text" if text_input else "image",
-        content=text_input if text_input else image_input,
-        metadata=output_metadata
-    )
+    client = utils.get_service_client("bedrock-runtime")
+    return utils.invoke_embeddings_model(client, model, document, body_fields, model_settings)
+
+
+@utils.require_login
+def AWSEmbeddingsBatch(model: str, documents: Iterable[Document | TextChunk], model_settings: dict = None, batch_size: int = 32, max_workers: int = None, max_retries: int = 8) -> List[Vector]:
+    """
+    Generates embeddings for several documents using the specified AWS model (bulk mode).
+
+    The settings are validated and the client is created once, then the invoke_model calls run on a thread pool
+    (Bedrock embeddings models take one input per request). The number of concurrent requests is set by the
+    AdaptiveConcurrencyLimiter of the model: it is halved when Bedrock throttles and grows back while the requests succeed,
+    so the throughput follows the account quota. Throttled requests are retried with exponential backoff.
+
+    The limiters are shared by all the calls of the process and configured with AWSConnection other_setting:
+    - embeddings_max_concurrency: default maximum concurrency of the embeddings models (default 16)
+    - embeddings_concurrency: maximum concurrency per model, eg. {"amazon.titan-embed-image-v1": 4}
+
+    Args:
+        model (str): The name of the AWS model to use.
+        documents (Iterable[Document | TextChunk]): The documents or text chunks to generate embeddings for.
+        model_settings (dict, optional): The settings for the model.
+        batch_size (int, optional): The minimum number of documents in flight. Defaults to 32.
+        max_workers (int, optional): The number of threads. Defaults to the maximum concurrency of the model.
+        max_retries (int, optional): The number of retries of a throttled request. Defaults to 8.
+
+    Returns:
+        List[Vector]: The generated embeddings, in the same order as the documents.
+    """
+    if model_settings is None:
+        model_settings = dict()
+        logger.warning(f"Model settings for model {model} not provided. Using default settings.")
+    body_fields = utils.prepare_embeddings_body(model, model_settings)
+    client = utils.get_service_client("bedrock-runtime")
+    limiter = ConnectionManager().get_connection("AWS").get_concurrency_limiter(model)
+
+    def embed(document):
+        for attempt in range(max_retries + 1):
+            with limiter:
+                try:
+                    return utils.invoke_embeddings_model(client, model, document, body_fields, model_settings)
+                except Exception as e:
+                    if not utils.is_throttling_error(e):
+                        raise
+                    limiter.on_throttle()
+                    if attempt == max_retries:
+                        raise
+            # full jitter backoff, outside of the limiter so the slot is released while waiting
+            time.sleep(random.uniform(0, min(20, 0.25 * 2 ** attempt)))
+
+    vectors = []
+    pending = deque()
+    max_workers = max_workers or limiter.max_limit
+    # keep a bounded number of documents in flight, the results are collected in order
+    window = max(batch_size, 2 * max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for document in documents:
+            pending.append(executor.submit(embed, document))
+            if len(pending) >= window:
+                vectors.append(pending.popleft().result())
+        while pending:
+            vectors.append(pending.popleft().result())
+    return vectors
 
 
 class AWSBedrockModelsSettings:
@@ -616,9 +1291,14 @@ class AWSBedrockModels():
             temperature: float = 0.5,
             max_tokens: int = 1024,
             ):
-            if model_name not in ModelsBaseSettings().providers_list_map["AWS"]["models"]:
+            try:
+                resolved_model = resolve_model(model_name)
+            except ValueError:
+                resolved_model = None
+            if resolved_model is None or resolved_model.provider != "AWS" or resolved_model.model_type != 'chat':
                 raise ValueError(f"Model {model_name} not found in AWS settings.")
             self.model_name = model_name
+            self.model_settings_schema = resolved_model.model_class
             self.temperature = temperature
             self.max_tokens = max_tokens
             self.system_prompt = system_prompt # 
@@ -628,7 +1308,51 @@ class AWSBedrockModels():
             if system_prompt:
                 self.history.add_message(role='system', content=system_prompt)
             self.agent_prompt = agent_prompt
-            self.aws_bedrock_client = utils.get_client().client("bedrock-runtime")
+            self.aws_bedrock_client = utils.get_service_client("bedrock-runtime")
+
+    def add_rag_prompt(self, query: str, context: list):
+        """
+        Builds the agent prompt with the retrieved context and adds it to the chat history.
+        """
+        if not self.agent_prompt:
+            logger.error("agent_prompt is not defined.")
+        prompt = self.agent_prompt(query=query, context=context)
+        final_prompt = prompt.prompt
+        # print('used docs: ', prompt.context_doc) access source if you want
+        
+        # add the prompt and the context to the chat history
+
+        if prompt.images_list:
+            self.history.add_message(role='user', content=final_prompt, images=prompt.images_list)
+        else:
+            self.history.add_message(role='user', content=final_prompt)
+
+    def build_request(self) -> str:
+        """
+        Builds and validates the request body from the chat history.
+        """
+        # validate the model settings
+        model_settings = self.model_settings_schema().model_settings
+        model_settings['messages'] = utils.format_chat_to_bedrock_format(chat=self.history.get_history())
+        model_settings['max_tokens'] = self.max_tokens
+        model_settings['temperature'] = self.temperature
+        self.model_settings_schema().model_validate(model_settings)
+        return json.dumps(model_settings)
+
+    def invoke(self, model_requests: str):
+        """
+        Invokes the model (blocking) and adds the response to the chat history.
+        """
+        try:
+            # Invoke the model with the request.
+            response = self.aws_bedrock_client.invoke_model(modelId=self.model_name, body=model_requests)
+            model_response = json.loads(response["body"].read())
+            response_text = model_response["content"][0]["text"]
+            self.history.add_message(role='assistant', content=response_text)
+            return response_text
+
+        except Exception as e:
+            logger.error(f"ERROR: Can't invoke '{self.model_name}'. Reason: {e}")
 
     @utils.require_login
     def chat(self, query: str, images: str = None):
@@ -636,57 +1360,29 @@ class AWSBedrockModels():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and images:
+            elif images:
                 context.extend(self.retriever(query_image=images))
-            if not self.agent_prompt:
-                logger.error("agent_prompt is not defined.")
-            prompt = self.agent_prompt(query=query, context=context)
-            final_prompt = prompt.prompt
-            # print('used docs: ', prompt.context_doc) access source if you want
-            
-            # add the prompt and the context to the chat history
-
-            if prompt.images_list:
-                self.history.add_message(role='user', content=final_prompt, images=prompt.images_list)
-            else:
-                self.history.add_message(role='user', content=final_prompt)
-
-
-            # validate the model settings
-            model_settings = ModelsBaseSettings().providers_list_map["AWS"]["models"][self.model_name]().model_settings
-            model_settings['messages'] = utils.format_chat_to_bedrock_format(chat=self.history.get_history())
-            model_settings['max_tokens'] = self.max_tokens
-            model_settings['temperature'] = self.temperature
-            ModelsBaseSettings().providers_list_map["AWS"]["models"][self.model_name]().model_validate(model_settings)
-
-            model_requests = json.dumps(model_settings)
-            try:
-                # Invoke the model with the request.
-                response = self.aws_bedrock_client.invoke_model(modelId=self.model_name, body=model_requests)
-                model_response = json.loads(response["body"].read())
-                response_text = model_response["content"][0]["text"]
-                self.history.add_message(role='assistant', content=response_text)
-                return response_text
-
-            except Exception as e:
-                logger.error(f"ERROR: Can't invoke '{self.model_name}'. Reason: {e}")
+            self.add_rag_prompt(query, context)
+        else:
+            self.history.add_message(role='user', content=query, images=images)
+        return self.invoke(self.build_request())
 
-        
+    @utils.require_login
+    async def achat(self, query: str, images: str = None):
+        """
+        Async version of chat. boto3 has no async client, the invocation runs in the default executor
+        so the event loop is not blocked.
+        The retriever can be a coroutine function (eg. OpenSearchServerless.aquery), otherwise it runs in the default executor.
+        The request is built in a worker thread, the images are downloaded and read there.
+        """
+        if self.retriever:
+            context = []
+            if query:
+                context.extend(await aretrieve(self.retriever, query_text=query))
+            elif images:
+                context.extend(await aretrieve(self.retriever, query_image=images))
+            self.add_rag_prompt(query, context)
         else:
             self.history.add_message(role='user', content=query, images=images)
-            model_settings = ModelsBaseSettings().providers_list_map["AWS"]["models"][self.model_name]().model_settings
-            model_settings['messages'] = utils.format_chat_to_bedrock_format(chat=self.history.get_history())
-            model_settings['max_tokens'] = self.max_tokens
-            model_settings['temperature'] = self.temperature
-            ModelsBaseSettings().providers_list_map["AWS"]["models"][self.model_name]().model_validate(model_settings)
-            model_requests = json.dumps(model_settings)
-            try:
-                # Invoke the model with the request.
-                response = self.aws_bedrock_client.invoke_model(modelId=self.model_name, body=model_requests)
-                model_response = json.loads(response["body"].read())
-                response_text = model_response["content"][0]["text"]
-                self.history.add_message(role='assistant', content=response_text)
-                return response_text
-
-            except Exception as e:
-                logger.error(f"ERROR: Can't invoke '{self.model_name}'. Reason: {e}")
+        model_requests = await asyncio.to_thread(self.build_request)
+        return await asyncio.get_running_loop().run_in_executor(None, self.invoke, model_requests)
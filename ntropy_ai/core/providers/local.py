@@ -0,0 +1,627 @@
+"""
+Local vector store
+
+In-process vector store with exact search: the vectors of a namespace are stored in one contiguous float32 matrix
+and a query is answered with one matrix-vector product and an argpartition.
+No network and no service to run, for tests, edge deployments and small corpora.
+For large corpora, index="hnsw" searches an HNSW graph instead (approximate, sub-linear).
+
+usage:
+- store = LocalVectorStore(metric="cosine")
+- store.set_embeddings_model("openai.clip-vit-base-patch32")
+- store.add_vectors(vectors)
+- store.query(query_text="...", top_k=5)
+- store.query_many(["...", "..."], top_k=5)
+- store.save("./index") / LocalVectorStore.load("./index")
+- store.compact() # after many deletes or re-ingests, removes the deleted rows
+"""
+from ntropy_ai.core.utils.settings import resolve_model
+from ntropy_ai.core.utils.base_format import Vector, VectorBatch, Document
+from ntropy_ai.core.utils.hnsw import HNSWIndex
+from ntropy_ai.core.utils.filters import Eq, Filter, filter_fields, matches
+from ntropy_ai.core.utils.hybrid import BM25Index, fuse
+from ntropy_ai.core.providers import embed_queries
+from ntropy_ai.core import utils
+from typing import Iterator, List, Tuple, Union
+import numpy as np
+import json
+import os
+import asyncio
+import functools
+
+
+METRICS = ("cosine", "dot", "l2")
+INDEXES = ("exact", "hnsw")
+
+
+class LocalNamespace:
+    """
+    Storage of one namespace: a (capacity, dimension) float32 matrix filled up to len(ids) rows,
+    the squared norms of the rows and the other Vector fields as columns.
+    The deleted rows are tombstoned (masked out of the results) until compact() removes them.
+    """
+    def __init__(self, dimension: int, capacity: int = 1024, index: str = "exact", index_settings: dict = None, metric: str = "cosine"):
+        self.dimension = dimension
+        self.matrix = np.empty((capacity, dimension), dtype=np.float32)
+        self.squared_norms = np.empty(capacity, dtype=np.float32)
+        self.deleted = np.zeros(capacity, dtype=bool)
+        self.ids = []
+        self.rows = {} # id -> row of the live vectors
+        self.document_ids = []
+        self.data_types = []
+        self.contents = []
+        self.document_metadata = []
+        self.output_metadata = []
+        self.index = HNSWIndex(self, metric=metric, **(index_settings or {})) if index == "hnsw" else None
+        self.lexical = None # BM25 index of the text contents, built on the first hybrid query
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _reserve(self, count: int):
+        # the capacity is doubled so appending n vectors costs O(n) amortized copies
+        if count <= self.matrix.shape[0]:
+            return
+        capacity = max(count, 2 * self.matrix.shape[0])
+        matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+        matrix[:len(self)] = self.matrix[:len(self)]
+        squared_norms = np.empty(capacity, dtype=np.float32)
+        squared_norms[:len(self)] = self.squared_norms[:len(self)]
+        deleted = np.zeros(capacity, dtype=bool)
+        deleted[:len(self)] = self.deleted[:len(self)]
+        self.matrix, self.squared_norms, self.deleted = matrix, squared_norms, deleted
+        if self.index is not None:
+            self.index.reserve(capacity)
+
+    def _append(self, vector_id: str, batch: VectorBatch, index: int) -> int:
+        row = len(self.ids)
+        self.rows[vector_id] = row
+        self.ids.append(vector_id)
+        self.document_ids.append(batch.document_ids[index])
+        self.data_types.append(batch.data_types[index])
+        self.contents.append(batch.contents[index])
+        self.document_metadata.append(batch.document_metadata[index])
+        self.output_metadata.append(batch.output_metadata[index])
+        return row
+
+    def upsert(self, batch: VectorBatch) -> List[int]:
+        """
+        Adds the vectors of the batch, the vectors whose id is already stored are replaced
+        (an id repeated in the batch is stored once, with its last vector).
+
+        Returns:
+            List[int]: The rows of the vectors of the deduplicated batch.
+        """
+        if batch.dimension != self.dimension:
+            raise ValueError(f"vectors dimension {batch.dimension} does not match the store dimension {self.dimension}")
+        # a repeated id would delete a graph node that is not inserted yet
+        batch = batch.deduplicated()
+        self._reserve(len(self) + len(batch))
+        rows = []
+        for index, vector_id in enumerate(batch.ids):
+            row = self.rows.get(vector_id)
+            if row is not None and self.index is not None:
+                # the graph links of the old vector are stale, it is deleted and the new vector gets a new node
+                self.delete([vector_id])
+                row = None
+            if row is None:
+                row = self._append(vector_id, batch, index)
+            else:
+                self.document_ids[row] = batch.document_ids[index]
+                self.data_types[row] = batch.data_types[index]
+                self.contents[row] = batch.contents[index]
+                self.document_metadata[row] = batch.document_metadata[index]
+                self.output_metadata[row] = batch.output_metadata[index]
+            rows.append(row)
+        self.matrix[rows] = batch.vectors
+        self.squared_norms[rows] = np.einsum('ij,ij->i', batch.vectors, batch.vectors)
+        if self.index is not None:
+            for row in rows:
+                self.index.add(row)
+        if self.lexical is not None:
+            for vector_id, row in zip(batch.ids, rows):
+                self.index_text(vector_id, row)
+        return rows
+
+    def index_text(self, vector_id: str, row: int):
+        if self.data_types[row] == "text" and isinstance(self.contents[row], str):
+            self.lexical.add(vector_id, self.contents[row])
+        else:
+            self.lexical.remove(vector_id)
+
+    def lexical_index(self) -> BM25Index:
+        """
+        Returns the BM25 index of the text contents (the chunks), built on first use then kept up to date.
+        """
+        if self.lexical is None:
+            self.lexical = BM25Index()
+            for vector_id, row in self.rows.items():
+                self.index_text(vector_id, row)
+        return self.lexical
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Deletes vectors by id (the unknown ids are skipped).
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        deleted = 0
+        for vector_id in ids:
+            row = self.rows.pop(vector_id, None)
+            if row is None:
+                continue
+            self.deleted[row] = True
+            if self.index is not None:
+                self.index.remove(row)
+            if self.lexical is not None:
+                self.lexical.remove(vector_id)
+            deleted += 1
+        return deleted
+
+    def compact(self) -> int:
+        """
+        Removes the deleted rows: the live vectors are copied in row order to new arrays and the HNSW graph is rebuilt
+        (an upsert of a stored id in a graph appends a new row, so the rows grow with each re-ingest until the compaction).
+        The rows change, the iter_vectors cursors taken before the compaction are no longer valid.
+
+        Returns:
+            int: The number of removed rows.
+        """
+        live = np.flatnonzero(~self.deleted[:len(self)])
+        removed = len(self) - len(live)
+        if removed == 0:
+            return 0
+        capacity = max(len(live), 1)
+        matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+        matrix[:len(live)] = self.matrix[live]
+        squared_norms = np.empty(capacity, dtype=np.float32)
+        squared_norms[:len(live)] = self.squared_norms[live]
+        self.matrix, self.squared_norms, self.deleted = matrix, squared_norms, np.zeros(capacity, dtype=bool)
+        rows = live.tolist()
+        for name in ("ids", "document_ids", "data_types", "contents", "document_metadata", "output_metadata"):
+            column = getattr(self, name)
+            setattr(self, name, [column[row] for row in rows])
+        self.rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        if self.index is not None:
+            previous = self.index
+            self.index = HNSWIndex(self, metric=previous.metric, M=previous.M, ef_construction=previous.ef_construction, ef=previous.ef)
+            self.index.rng = previous.rng
+            self.index.reserve(capacity)
+            for row in range(len(self)):
+                self.index.add(row)
+        return removed
+
+    def scores(self, query: np.ndarray, metric: str) -> np.ndarray:
+        """
+        Scores every stored vector against the query (one matrix-vector product), or against each row of a
+        (queries, dimension) matrix (one matrix-matrix product, the scores are then a (queries, vectors) matrix).
+        For cosine and dot higher is better, for l2 the score is the euclidean distance (lower is better).
+        """
+        count = len(self)
+        products = query @ self.matrix[:count].T
+        if metric == "dot":
+            scores = products
+        elif metric == "cosine":
+            norms = np.sqrt(self.squared_norms[:count]) * np.linalg.norm(query, axis=-1)[..., None]
+            scores = products / np.maximum(norms, np.finfo(np.float32).tiny)
+        else:
+            # |x - q|^2 = |x|^2 - 2 x.q + |q|^2
+            scores = np.sqrt(np.maximum(self.squared_norms[:count] - 2 * products + np.einsum('...i,...i->...', query, query)[..., None], 0))
+        if len(self.rows) < count:
+            scores[..., self.deleted[:count]] = np.inf if metric == "l2" else -np.inf
+        return scores
+
+    def top_k(self, scores: np.ndarray, top_k: int, metric: str) -> np.ndarray:
+        """
+        Returns the rows of the top_k best scores, best first (argpartition then sort of the k candidates).
+        """
+        top_k = min(top_k, len(self.rows))
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+        ranking = scores if metric == "l2" else -scores
+        if top_k < len(scores):
+            candidates = np.argpartition(ranking, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(ranking[candidates], kind='stable')]
+
+    def filter_mask(self, filter: Filter) -> np.ndarray:
+        """
+        Returns the mask of the live rows matching the filter.
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        for row in self.rows.values():
+            fields = {"id": self.ids[row], "document_id": self.document_ids[row], "data_type": self.data_types[row], **filter_fields(self.document_metadata[row], self.output_metadata[row])}
+            mask[row] = matches(filter, fields)
+        return mask
+
+    def search(self, query: np.ndarray, top_k: int, metric: str, ef: int = None, filter: Filter = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the top_k rows and their scores, best first: exact search, or the HNSW graph if the namespace has one.
+        A filtered search is an exact search of the matching rows.
+        """
+        if filter is not None:
+            mask = self.filter_mask(filter)
+            scores = self.scores(query, metric)
+            scores[~mask] = np.inf if metric == "l2" else -np.inf
+            rows = self.top_k(scores, min(top_k, int(mask.sum())), metric)
+            return rows, scores[rows]
+        if self.index is None:
+            scores = self.scores(query, metric)
+            rows = self.top_k(scores, top_k, metric)
+            return rows, scores[rows]
+        rows, distances = self.index.search(query, top_k, ef=ef)
+        # the graph distances are converted to the exact search scores
+        if metric == "cosine":
+            return rows, 1 - distances
+        if metric == "dot":
+            return rows, -distances
+        return rows, np.sqrt(np.maximum(distances, 0))
+
+    def search_many(self, queries: np.ndarray, top_k: int, metric: str, ef: int = None, filter: Filter = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        search() of each row of a (queries, dimension) matrix. The exact search scores all the queries with one
+        matrix-matrix product and selects the top_k of every query with one argpartition.
+        """
+        if self.index is not None and filter is None:
+            return [self.search(query, top_k, metric, ef=ef) for query in queries]
+        scores = self.scores(queries, metric)
+        available = len(self.rows)
+        if filter is not None:
+            mask = self.filter_mask(filter)
+            scores[:, ~mask] = np.inf if metric == "l2" else -np.inf
+            available = int(mask.sum())
+        top_k = min(top_k, available)
+        if top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        ranking = scores if metric == "l2" else -scores
+        candidates = np.argpartition(ranking, top_k - 1, axis=1)[:, :top_k] if top_k < scores.shape[1] else np.tile(np.arange(scores.shape[1]), (len(queries), 1))
+        rows = np.take_along_axis(candidates, np.argsort(np.take_along_axis(ranking, candidates, axis=1), axis=1, kind='stable'), axis=1)
+        return [(query_rows, query_scores) for query_rows, query_scores in zip(rows, np.take_along_axis(scores, rows, axis=1))]
+
+    def get(self, row: int, score: float = None, include_values: bool = True) -> Vector:
+        return Vector(
+            id=self.ids[row],
+            document_id=self.document_ids[row],
+            score=score,
+            vector=self.matrix[row] if include_values else [],
+            # the size is the one of the returned values (0 without them), like the Pinecone results
+            size=self.dimension if include_values else 0,
+            data_type=self.data_types[row],
+            content=self.contents[row],
+            document_metadata=self.document_metadata[row],
+            output_metadata=self.output_metadata[row]
+        )
+
+    def save(self, path: str):
+        """
+        Saves the namespace in a directory: the vectors (.npy), the other columns (.json) and the HNSW graph.
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.matrix[:len(self)])
+        np.save(os.path.join(path, "deleted.npy"), self.deleted[:len(self)])
+        with open(os.path.join(path, "columns.json"), "w") as f:
+            json.dump({
+                "ids": self.ids,
+                "document_ids": self.document_ids,
+                "data_types": self.data_types,
+                "contents": self.contents,
+                "document_metadata": self.document_metadata,
+                "output_metadata": self.output_metadata
+            }, f, default=str)
+        if self.index is not None:
+            self.index.save(os.path.join(path, "hnsw.npz"))
+
+    @classmethod
+    def load(cls, path: str, index: str = "exact", metric: str = "cosine") -> "LocalNamespace":
+        matrix = np.load(os.path.join(path, "vectors.npy"))
+        namespace = cls(matrix.shape[1], capacity=max(len(matrix), 1), metric=metric)
+        namespace.matrix[:len(matrix)] = matrix
+        namespace.squared_norms[:len(matrix)] = np.einsum('ij,ij->i', matrix, matrix)
+        namespace.deleted[:len(matrix)] = np.load(os.path.join(path, "deleted.npy"))
+        with open(os.path.join(path, "columns.json")) as f:
+            columns = json.load(f)
+        for name, values in columns.items():
+            setattr(namespace, name, values)
+        namespace.rows = {vector_id: row for row, vector_id in enumerate(namespace.ids) if not namespace.deleted[row]}
+        if index == "hnsw":
+            namespace.index = HNSWIndex.load(os.path.join(path, "hnsw.npz"), namespace)
+        return namespace
+
+
+class LocalVectorStore:
+    """
+    In-process vector store with the same surface as the Pinecone store (add_vectors, query, fetch_vectors, set_embeddings_model).
+
+    Args:
+        metric (str, optional): cosine, dot or l2. Defaults to cosine.
+        dimension (int, optional): The vectors dimension. Defaults to the dimension of the first added vectors.
+        index (str, optional): exact (brute force) or hnsw (approximate). Defaults to exact.
+        index_settings (dict, optional): The HNSW settings: M, ef_construction, ef and seed.
+    """
+    def __init__(self, metric: str = "cosine", dimension: int = None, index: str = "exact", index_settings: dict = None):
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        if index not in INDEXES:
+            raise ValueError(f"index must be one of {INDEXES}")
+        self.metric = metric
+        self.dimension = dimension
+        self.index = index
+        self.index_settings = index_settings or {}
+        self.namespaces = {}
+        self.embedding_func = None
+        self.embedding_model_settings = None
+        self.embedding_model_name = None
+        self.embedding_model_settings_top_k = None
+        self.embedding_model_settings_include_values = None
+
+    def get_namespace(self, namespace: str = None, create: bool = False) -> Union[LocalNamespace, None]:
+        if namespace not in self.namespaces and create:
+            self.namespaces[namespace] = LocalNamespace(self.dimension, index=self.index, index_settings=self.index_settings, metric=self.metric)
+        return self.namespaces.get(namespace)
+
+    def add_vectors(self, vectors: Union[List[Vector], VectorBatch], namespace: str = None):
+        """
+        Adds (or replaces, by id) vectors in the store.
+
+        Args:
+            vectors (List[Vector] | VectorBatch): The vectors to add, a VectorBatch is copied as one block.
+            namespace (str, optional): The namespace.
+        """
+        batch = vectors if isinstance(vectors, VectorBatch) else VectorBatch.from_vectors(vectors)
+        if len(batch) == 0:
+            return
+        if self.dimension is None:
+            self.dimension = batch.dimension
+        self.get_namespace(namespace, create=True).upsert(batch)
+
+    def delete(self, ids: List[str], namespace: str = None) -> int:
+        """
+        Deletes vectors by id.
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        store = self.get_namespace(namespace)
+        return store.delete(ids) if store is not None else 0
+
+    def compact(self, namespace: str = None) -> int:
+        """
+        Removes the deleted rows of a namespace and rebuilds its HNSW graph (see LocalNamespace.compact).
+
+        Returns:
+            int: The number of removed rows.
+        """
+        store = self.get_namespace(namespace)
+        return store.compact() if store is not None else 0
+
+    def delete_by_document(self, document_id: str, namespace: str = None) -> int:
+        """
+        Deletes the vectors of a document.
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        return self.delete_by_filter(Eq("document_id", document_id), namespace=namespace)
+
+    def delete_by_filter(self, filter: Filter, namespace: str = None) -> int:
+        """
+        Deletes the vectors matching a filter (eg. Eq("document_metadata.source", "report.pdf")).
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        store = self.get_namespace(namespace)
+        if store is None:
+            return 0
+        return store.delete([store.ids[row] for row in np.flatnonzero(store.filter_mask(filter)).tolist()])
+
+    # set embeddings model default
+    def set_embeddings_model(self, model: str, model_settings: dict = None):
+        self.embedding_model_settings = model_settings
+        self.embedding_model_name = model
+        self.embedding_func = resolve_model(model).embedding_func
+        if not self.embedding_func:
+            raise Exception(f"model {model} not found !")
+
+    def set_retriever_settings(self, top_k: int, include_values: bool):
+        self.embedding_model_settings_top_k = top_k
+        self.embedding_model_settings_include_values = include_values
+
+    def fetch_vectors(self, ids: List[str], namespace: str = None) -> List[Vector]:
+        """
+        Returns the stored vectors with the given ids (the unknown ids are skipped).
+        """
+        store = self.get_namespace(namespace)
+        if store is None:
+            return []
+        return [store.get(store.rows[vector_id]) for vector_id in ids if vector_id in store.rows]
+
+    def iter_vectors(self, namespace: str = None, batch_size: int = 1000, cursor: int = None) -> Iterator[Tuple[List[Vector], int]]:
+        """
+        Streams the vectors of a namespace in row order, batch_size at a time.
+        Yields each batch with the cursor (next row) to resume after it.
+        """
+        store = self.get_namespace(namespace)
+        if store is None:
+            return
+        row = cursor or 0
+        while row < len(store):
+            end = min(row + batch_size, len(store))
+            yield [store.get(i) for i in range(row, end) if not store.deleted[i]], end
+            row = end
+
+    def save(self, path: str):
+        """
+        Saves the store (vectors, metadata and HNSW graphs) in a directory.
+        """
+        os.makedirs(path, exist_ok=True)
+        namespaces = []
+        for i, (name, store) in enumerate(self.namespaces.items()):
+            store.save(os.path.join(path, f"namespace_{i}"))
+            namespaces.append({"name": name, "path": f"namespace_{i}"})
+        with open(os.path.join(path, "store.json"), "w") as f:
+            json.dump({
+                "metric": self.metric,
+                "dimension": self.dimension,
+                "index": self.index,
+                "index_settings": self.index_settings,
+                "namespaces": namespaces
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalVectorStore":
+        """
+        Loads a store saved with save().
+        """
+        with open(os.path.join(path, "store.json")) as f:
+            settings = json.load(f)
+        store = cls(metric=settings["metric"], dimension=settings["dimension"], index=settings["index"], index_settings=settings["index_settings"])
+        for namespace in settings["namespaces"]:
+            store.namespaces[namespace["name"]] = LocalNamespace.load(os.path.join(path, namespace["path"]), index=store.index, metric=store.metric)
+        return store
+
+    def embed_query(self, query_text: str = None, query_image: str = None, model: str = None, model_settings: dict = None) -> Vector:
+        """
+        Embeds a text or image query with the given model, or with the default embeddings model of the store.
+        """
+        if not model:
+            if not self.embedding_model_name:
+                raise Exception("model is required !")
+            model = self.embedding_model_name
+        if model == self.embedding_model_name and self.embedding_func:
+            query_vector_func = self.embedding_func
+            model_settings = model_settings or self.embedding_model_settings
+        else:
+            query_vector_func = resolve_model(model).embedding_func
+        if not query_vector_func:
+            raise Exception(f"model {model} not found !")
+
+        if query_text:
+            document = Document(content=query_text, page_number=-1, data_type="text")
+        elif query_image:
+            if query_image.startswith('http'):
+                document = utils.save_img_to_temp_file(query_image, return_doc=True)
+            else:
+                document = Document(image=query_image, page_number=-1, data_type="image")
+        else:
+            raise Exception("query_text or query_image is required !")
+        return query_vector_func(model, document, model_settings)
+
+    def query(self,
+              query_vector: Union[List[float], Vector] = None,
+              model_settings: dict = None,
+              model: str = None,
+              query_text: str = None,
+              query_image: str = None,
+              top_k: int = 5,
+              include_values: bool = False,
+              namespace: str = None,
+              ef: int = None,
+              filter: Filter = None) -> List[Vector]:
+        """
+        Top_k search: exact (one matrix-vector product and an argpartition) or through the HNSW graph.
+        The scores are the cosine similarity, the dot product or the euclidean distance depending on the metric.
+        ef overrides the HNSW candidates list size of this query (ignored by the exact index).
+        filter (eg. Eq("data_type", "text") & Range("document_metadata.page_number", lte=3)) restricts the search to the matching vectors.
+        """
+        if query_vector is None:
+            query_vector = self.embed_query(query_text, query_image, model, model_settings)
+        query = query_vector.to_numpy() if isinstance(query_vector, Vector) else np.asarray(query_vector, dtype=np.float32)
+
+        store = self.get_namespace(namespace)
+        if store is None or len(store.rows) == 0:
+            return []
+        if query.shape[0] != store.dimension:
+            raise ValueError(f"query_vector shape does not match the vector store dimension (which is {store.dimension}). use model_settings to set the correct dimension !")
+
+        top_k = self.embedding_model_settings_top_k if self.embedding_model_settings_top_k else top_k
+        include_values = self.embedding_model_settings_include_values if self.embedding_model_settings_include_values else include_values
+        rows, scores = store.search(query, top_k, self.metric, ef=ef, filter=filter)
+        return [store.get(row, score=float(score), include_values=include_values) for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def query_many(self,
+                   queries: List[Union[str, List[float], Vector]],
+                   top_k: int = 5,
+                   model_settings: dict = None,
+                   model: str = None,
+                   include_values: bool = False,
+                   namespace: str = None,
+                   ef: int = None,
+                   filter: Filter = None) -> List[List[Vector]]:
+        """
+        Runs several queries at once: the text queries are embedded in one batch (embed_many) and the exact index
+        scores all the queries with one matrix-matrix product.
+
+        Args:
+            queries (List[str | List[float] | Vector]): The query texts or query vectors.
+            top_k (int, optional): The number of results per query. Defaults to 5.
+
+        Returns:
+            List[List[Vector]]: The results of each query, in the order of the queries.
+        """
+        store = self.get_namespace(namespace)
+        if store is None or len(store.rows) == 0:
+            return [[] for _ in queries]
+        model = model or self.embedding_model_name
+        model_settings = model_settings or (self.embedding_model_settings if model == self.embedding_model_name else None)
+        query_vectors = embed_queries(model, queries, model_settings)
+        matrix = np.stack([v.to_numpy() if isinstance(v, Vector) else np.asarray(v, dtype=np.float32) for v in query_vectors]).astype(np.float32, copy=False)
+        if matrix.shape[1] != store.dimension:
+            raise ValueError(f"query_vector shape does not match the vector store dimension (which is {store.dimension}). use model_settings to set the correct dimension !")
+
+        top_k = self.embedding_model_settings_top_k if self.embedding_model_settings_top_k else top_k
+        include_values = self.embedding_model_settings_include_values if self.embedding_model_settings_include_values else include_values
+        return [
+            [store.get(row, score=float(score), include_values=include_values) for row, score in zip(rows.tolist(), scores.tolist())]
+            for rows, scores in store.search_many(matrix, top_k, self.metric, ef=ef, filter=filter)
+        ]
+
+    def hybrid_query(self,
+                     query_text: str,
+                     query_vector: Union[List[float], Vector] = None,
+                     model_settings: dict = None,
+                     model: str = None,
+                     top_k: int = 5,
+                     fusion: str = "rrf",
+                     weights: Tuple[float, float] = (1.0, 1.0),
+                     rrf_k: int = 60,
+                     candidates: int = None,
+                     include_values: bool = False,
+                     namespace: str = None,
+                     filter: Filter = None) -> List[Vector]:
+        """
+        Hybrid search: the k-NN results and the BM25 results of the text contents are fused (rrf or weighted scores).
+
+        Args:
+            query_text (str): The query, searched as keywords and embedded (unless query_vector is given).
+            query_vector (List[float] | Vector, optional): The query embeddings.
+            top_k (int, optional): The number of results. Defaults to 5.
+            fusion (str, optional): rrf (reciprocal rank fusion) or weighted (min-max normalized scores). Defaults to rrf.
+            weights (Tuple[float, float], optional): The weights of the k-NN and the lexical results. Defaults to (1.0, 1.0).
+            rrf_k (int, optional): The rrf rank constant. Defaults to 60.
+            candidates (int, optional): The number of results of each search before fusion. Defaults to max(2 * top_k, 20).
+
+        Returns:
+            List[Vector]: The results, the score is the fused score.
+        """
+        store = self.get_namespace(namespace)
+        if store is None or len(store.rows) == 0:
+            return []
+        candidates = candidates or max(2 * top_k, 20)
+        if query_vector is None:
+            query_vector = self.embed_query(query_text=query_text, model=model, model_settings=model_settings)
+        vector_results = [(v.id, -v.score if self.metric == "l2" else v.score) for v in self.query(query_vector=query_vector, top_k=candidates, namespace=namespace, filter=filter)]
+        lexical_results = store.lexical_index().search(query_text, candidates if filter is None else len(store.rows))
+        if filter is not None:
+            mask = store.filter_mask(filter)
+            lexical_results = [(vector_id, score) for vector_id, score in lexical_results if mask[store.rows[vector_id]]][:candidates]
+        fused = fuse(vector_results, lexical_results, fusion=fusion, weights=weights, rrf_k=rrf_k)[:top_k]
+        return [store.get(store.rows[vector_id], score=score, include_values=include_values) for vector_id, score in fused]
+
+    async def aquery(self, **kwargs) -> List[Vector]:
+        """
+        async version of query, it runs in the default executor so the event loop is not blocked.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.query, **kwargs))
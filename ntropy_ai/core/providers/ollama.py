@@ -1,6 +1,7 @@
 import ollama
+import asyncio
 from pydantic import BaseModel
-from ntropy_ai.core.utils import ensure_local_file, save_img_to_temp_file
+from ntropy_ai.core.utils import ensure_local_file, save_img_to_temp_file, aretrieve
 from ntropy_ai.core.utils.settings import logger
 from ntropy_ai.core.utils.chat import ChatManager
 import logging
@@ -16,6 +17,20 @@ def list_models():
     models = ollama.list()
     return [model['name'] for model in models['models'] if 'clip' in model['details']['families']]
 
+_async_client = None
+
+def get_async_client():
+    """
+    Returns the ollama AsyncClient, it is created on first use and shared by all the models.
+
+    Returns:
+        ollama.AsyncClient: The async client.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = ollama.AsyncClient()
+    return _async_client
+
 class OllamaModel():
     """
     A class to represent an Ollama model.
@@ -59,7 +74,7 @@ class OllamaModel():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and image:
+            elif image:
                 context.extend(self.retriever(query_image=image))
             if not self.agent_prompt:
                 logger.warning("agent_prompt is not defined.")
@@ -111,7 +126,7 @@ class OllamaModel():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and image:
+            elif image:
                 context.extend(self.retriever(query_image=image))
             if not self.agent_prompt:
                 logger.warning("agent_prompt is not defined.")
@@ -135,6 +150,44 @@ class OllamaModel():
         self.history.add_message(role='assistant', content=response['message']['content'])
         return response['message']['content']
 
+    async def achat(self, query: str, image: str = None):
+        """
+        Async version of chat, using the ollama AsyncClient.
+        The retriever can be a coroutine function (eg. Pinecone.aquery), otherwise it runs in the default executor.
+        The images are downloaded in a worker thread so the event loop is not blocked.
+
+        Args:
+            query (str): The query text.
+            image (str): The image path or URL.
+
+        Returns:
+            str: The chat response.
+        """
+        if self.retriever:
+            context = []
+            if query:
+                context.extend(await aretrieve(self.retriever, query_text=query))
+            elif image:
+                context.extend(await aretrieve(self.retriever, query_image=image))
+            if not self.agent_prompt:
+                logger.warning("agent_prompt is not defined.")
+            prompt = self.agent_prompt(query=query, context=context)
+            final_prompt = prompt.prompt
+
+            # add the prompt and the context to the chat history
+            if prompt.images_list:
+                images_list = await asyncio.to_thread(lambda: [ensure_local_file(image) for image in prompt.images_list])
+                self.history.add_message(role='user', content=final_prompt, images=images_list)
+            else:
+                self.history.add_message(role='user', content=final_prompt)
+        else:
+            images = [await asyncio.to_thread(ensure_local_file, image)] if image else []
+            self.history.add_message(role='user', content=query, images=images)
+
+        response = await get_async_client().chat(model=self.model_name, messages=self.history.get_history())
+        self.history.add_message(role='assistant', content=response['message']['content'])
+        return response['message']['content']
+
     def schat(self, query: str, image: str = None):
         """
         Engages in a streaming chat with the model based on the query and image.
@@ -158,7 +211,7 @@ class OllamaModel():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and image:
+            elif image:
                 context.extend(self.retriever(query_image=image))
             if not self.agent_prompt:
                 logger.warning("agent_prompt is not defined.")
@@ -213,7 +266,7 @@ class OllamaModel():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and image:
+            elif image:
                 context.extend(self.retriever(query_image=image))
             if not self.agent_prompt:
                 logger.warning("agent_prompt is not defined.")
@@ -1,12 +1,11 @@
 from pydantic import BaseModel, Field, ConfigDict, ValidationError, field_validator
-from typing import Union, List, Dict, Any
-import clip as OpenaiCLIP # pip install git+https://github.com/openai/CLIP.git
-from ntropy_ai.core.utils.settings import ModelsBaseSettings
+from typing import Union, List, Dict, Any, Iterable
+from ntropy_ai.core.utils.settings import resolve_model
 from ntropy_ai.core.utils.connections_manager import ConnectionManager
+from ntropy_ai.core.utils.embeddings_cache import EmbeddingsCache, get_embeddings_cache
 from ntropy_ai.core.utils.base_format import Document, TextChunk, Vector
-from ntropy_ai.core.utils import save_img_to_temp_file
+from ntropy_ai.core.utils import save_img_to_temp_file, ensure_local_file, batched, aretrieve, require_connection
 from datetime import datetime
-import torch
 from PIL import Image
 from ntropy_ai.core.utils.settings import logger
 from ntropy_ai.core.utils.chat import ChatManager, ChatHistory
@@ -24,6 +23,15 @@ def get_client():
     """
     return ConnectionManager().get_connection("OpenAI").get_client()
 
+def get_async_client():
+    """
+    Retrieve the AsyncOpenAI client from the connection manager.
+
+    Returns:
+        openaiClient.AsyncOpenAI: The async OpenAI client instance.
+    """
+    return ConnectionManager().get_connection("OpenAI").get_async_client()
+
 def get_other_settings():
     """
     Retrieve other settings related to the OpenAI connection.
@@ -43,11 +51,7 @@ def require_login(func):
     Returns:
         function: The wrapped function.
     """
-    def wrapper(*args, **kwargs):
-        if ConnectionManager().get_connection("OpenAI") is None:
-            raise Exception("OpenAI connection not found. Please initialize the connection.")
-        return func(*args, **kwargs)
-    return wrapper
+    return require_connection("OpenAI")(func)
 
 class OpenAIConnection():
     """
@@ -63,6 +67,7 @@ class OpenAIConnection():
         """
         self.api_key = api_key
         self.client = None
+        self.async_client = None
         self.other_setting = other_setting
 
     def init_connection(self):
@@ -86,6 +91,17 @@ class OpenAIConnection():
         if self.client is None:
             self.init_connection()
         return self.client
+
+    def get_async_client(self):
+        """
+        Retrieve the AsyncOpenAI client, it is created on first use.
+
+        Returns:
+            openaiClient.AsyncOpenAI: The async OpenAI client instance.
+        """
+        if self.async_client is None:
+            self.async_client = openaiClient.AsyncOpenAI(api_key=self.api_key)
+        return self.async_client
     
     def get_other_setting(self):
         """
@@ -211,6 +227,64 @@ class utils:
             else:
                 raise ValueError(f"Tool {tool_name} not found in function_caller.")
 
+    def local_image_document(document: Document | TextChunk) -> Document | TextChunk:
+        """
+        Download the remote image of a document, the returned copy points to the local file (the other documents are returned as is),
+        so its cache key is the hash of the image bytes and the encoder does not download it again.
+        """
+        if isinstance(document, Document) and document.image and document.image.startswith("http"):
+            return document.model_copy(update={'image': ensure_local_file(document.image)})
+        return document
+
+    def embeddings_cache_key(cache: EmbeddingsCache, model: str, document: Document | TextChunk, model_settings: dict = None) -> str:
+        """
+        Build the embeddings cache key of a document (its image must be local, see local_image_document).
+        The device does not change the embeddings, it is not part of the key. The images are keyed by their bytes.
+        """
+        settings = {key: value for key, value in (model_settings or {}).items() if key != "device"}
+        image_input = document.image if isinstance(document, Document) else None
+        if image_input:
+            with open(image_input, 'rb') as image_file:
+                return cache.make_key(model, settings, image=image_file.read())
+        return cache.make_key(model, settings, text=document.content if isinstance(document, Document) else document.chunk)
+
+    def validate_embeddings_input(model: str, resolved_model, model_settings: dict = None, document: Document | TextChunk = None) -> dict:
+        """
+        Validate the model settings (the keys of the model_settings of the model, eg. device) and the input document
+        with the ModelInputSchema of the model. The batch path validates once per call, without a document.
+
+        Returns:
+            dict: The body fields of the model ({'input_document': document}).
+        """
+        embedding_model_setting = resolved_model.input_schema
+        if embedding_model_setting is None:
+            raise ValueError(f"Model {model} not found in settings. Please check the model name.")
+        known_settings = resolved_model.model_class().model_settings
+        for key in (model_settings or {}):
+            if key not in known_settings:
+                raise ValueError(f"Model setting [{key}] does not exist for model {model}.")
+        body_fields = {'input_document': document}
+        try:
+            embedding_model_setting.model_validate(body_fields) # validate with pydantic
+        except Exception:
+            raise ValueError(f"Error. please check if the settings are correct. use get_model_settings(model) to check the correct settings.")
+        return body_fields
+
+    def embeddings_to_vector(document: Document | TextChunk, embeddings, output_metadata: dict) -> Vector:
+        """
+        Wrap the embeddings (list or float32 numpy row, kept without copy) of a document in a Vector object.
+        """
+        content = document.image if isinstance(document, Document) and document.image else document.content if isinstance(document, Document) else document.chunk if isinstance(document, TextChunk) else None
+        return Vector(
+            document_id=document.id,
+            vector=embeddings,
+            size=len(embeddings),
+            data_type="image" if isinstance(document, Document) and document.image else "text" if isinstance(document, Document) else "text" if isinstance(document, TextChunk) else None,
+            content=content,
+            document_metadata=document.metadata,
+            output_metadata=output_metadata
+        )
+
 
 
     
@@ -227,6 +301,7 @@ class OpenAIEmbeddingModels():
         Model configuration for OpenAI CLIP ViT-B/32.
         """
         model_name: str = "openai.clip-vit-base-patch32"
+        output_dimension: int = 512
         model_settings: dict = Field(default_factory=lambda: {
             "device": "torch device: mps, cpu, cuda"
         })
@@ -246,6 +321,8 @@ class OpenAIEmbeddingModels():
 class CLIPmodel():
     """
     Class to manage the CLIP model and create embeddings.
+
+    torch and clip are imported when the first CLIPmodel is created, so importing this module stays cheap.
     """
     _model_cache = {}
     # ensure the model is loaded only once
@@ -257,7 +334,9 @@ class CLIPmodel():
             model (str): The model name.
             model_settings (dict, optional): Additional settings for the model.
         """
-        self.model = ModelsBaseSettings().providers_list_map["OpenAI"]["embeddings_models"]["models_map"].get(model)().config['model_name']
+        import torch
+        import clip as OpenaiCLIP # pip install git+https://github.com/openai/CLIP.git
+        self.model = resolve_model(model).model_class().config['model_name']
         self.device = model_settings.get("device") if model_settings and "device" in model_settings else "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
         if model not in self._model_cache:
             self.clip_model_pipe, self.clip_processor = OpenaiCLIP.load(self.model, device=self.device)
@@ -282,7 +361,19 @@ class CLIPmodel():
         input_document = body_fields.get('input_document')
         if input_document is None:
             raise ValueError("input_document is required for creating embeddings.")
+        return self.create_embeddings_clip_batch([input_document])[0].tolist()
+
+    @staticmethod
+    def get_document_input(input_document: Document | TextChunk):
+        """
+        Extract the text or the image of a document.
 
+        Args:
+            input_document (Document | TextChunk): The input document.
+
+        Returns:
+            tuple: (text_input, image_input), one of them is None.
+        """
         if isinstance(input_document, Document):
             text_input = input_document.content
             if text_input:
@@ -296,21 +387,48 @@ class CLIPmodel():
         
         if text_input and image_input:
             raise ValueError("input_document must contain either text or image content.")
-        if text_input:
-            text = OpenaiCLIP.tokenize([text_input]).to(self.device)
-            with torch.no_grad():
-                text_features = self.clip_model_pipe.encode_text(text)
-            embeddings = text_features.cpu().tolist()[0]
-        elif image_input:
-            if image_input.startswith("http"):
-                image = self.clip_processor(Image.open(save_img_to_temp_file(image_input, return_doc=False))).unsqueeze(0).to(self.device)
-            else:
-                image = self.clip_processor(Image.open(image_input)).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                embeddings = self.clip_model_pipe.encode_image(image)
-            embeddings = embeddings.cpu().tolist()[0]
-        else:
+        if not text_input and not image_input:
             raise ValueError("input_document must contain either text or image content.")
+        return text_input, image_input
+
+    def create_embeddings_clip_batch(self, documents: List[Document | TextChunk]):
+        """
+        Create embeddings for several documents using the CLIP model.
+        The texts and the images are tokenized / preprocessed together and encoded as one tensor batch each.
+
+        Args:
+            documents (List[Document | TextChunk]): The input documents.
+
+        Returns:
+            numpy.ndarray: The (len(documents), dimension) float32 embeddings matrix, in the same order as the documents.
+        """
+        import numpy as np
+        import torch
+        import clip as OpenaiCLIP
+        texts, images = [], [] # (position in documents, input)
+        for position, document in enumerate(documents):
+            text_input, image_input = self.get_document_input(document)
+            if text_input:
+                texts.append((position, text_input))
+            else:
+                images.append((position, image_input))
+
+        embeddings = None
+        with torch.no_grad():
+            if texts:
+                text = OpenaiCLIP.tokenize([text_input for _, text_input in texts]).to(self.device)
+                text_features = self.clip_model_pipe.encode_text(text).float().cpu().numpy()
+                embeddings = np.empty((len(documents), text_features.shape[1]), dtype=np.float32)
+                embeddings[[position for position, _ in texts]] = text_features
+            if images:
+                image = torch.stack([
+                    self.clip_processor(Image.open(save_img_to_temp_file(image_input, return_doc=False) if image_input.startswith("http") else image_input))
+                    for _, image_input in images
+                ]).to(self.device)
+                image_features = self.clip_model_pipe.encode_image(image).float().cpu().numpy()
+                if embeddings is None:
+                    embeddings = np.empty((len(documents), image_features.shape[1]), dtype=np.float32)
+                embeddings[[position for position, _ in images]] = image_features
         return embeddings
 
 
@@ -333,35 +451,77 @@ def OpenAIEmbeddings(model: str, document: Document | TextChunk | str, model_set
         
     }
     
-    if model not in ModelsBaseSettings().providers_list_map["OpenAI"]["embeddings_models"]["models_map"]:
+    resolved_model = resolve_model(model)
+    if resolved_model.provider != "OpenAI":
         raise ValueError(f"Model {model} not found in OpenAI settings.")
-    embedding_model_setting = ModelsBaseSettings().providers_list_map["OpenAI"]["embeddings_models"]["models_map"].get(model).ModelInputSchema
-    if embedding_model_setting is None:
-        raise ValueError(f"Model {model} not found in settings. Please check the model name.")
-
-    body_fields = embedding_model_setting.model_fields
-    body_fields['input_document'] = document
+    body_fields = utils.validate_embeddings_input(model, resolved_model, model_settings, document)
 
-    try:
-        embedding_model_setting.model_validate(body_fields) # validate with pydantic
-    except Exception:
-        raise ValueError(f"Error. please check if the settings are correct. use get_model_settings(model) to check the correct settings.")
+    cache = get_embeddings_cache()
+    embeddings = None
+    if cache is not None:
+        # a remote image is downloaded once, for its cache key and for the encoder
+        body_fields['input_document'] = utils.local_image_document(document)
+        cache_key = utils.embeddings_cache_key(cache, model, body_fields['input_document'], model_settings)
+        embeddings = cache.get(cache_key)
 
-    if ModelsBaseSettings().providers_list_map["OpenAI"]["embeddings_models"]["models_map"].get(model)().config['variant'] == 'clip':
+    if embeddings is None and resolved_model.model_class().config['variant'] == 'clip':
         # cuz our function takes the document object directly
-        embeddings =  CLIPmodel(model).create_embeddings_clip(body_fields, model_settings)
+        embeddings =  CLIPmodel(model, model_settings).create_embeddings_clip(body_fields, model_settings)
+        if cache is not None:
+            cache.set(cache_key, embeddings)
 
-    content = document.image if isinstance(document, Document) and document.image else document.content if isinstance(document, Document) else document.chunk if isinstance(document, TextChunk) else None
+    return utils.embeddings_to_vector(document, embeddings, output_metadata)
 
-    return Vector(
-        document_id=document.id,
-        vector=embeddings,
-        size=len(embeddings),
-        data_type="image" if isinstance(document, Document) and document.image else "text" if isinstance(document, Document) else "text" if isinstance(document, TextChunk) else None,
-        content=content,
-        document_metadata=document.metadata,
-        output_metadata=output_metadata
-    )
+
+def OpenAIEmbeddingsBatch(model: str, documents: Iterable[Document | TextChunk], model_settings: dict = None, batch_size: int = 32) -> List[Vector]:
+    """
+    Generate embeddings for several documents using the specified OpenAI model.
+    The model is resolved once and the documents are encoded by batches of batch_size.
+
+    Args:
+        model (str): The model name.
+        documents (Iterable[Document | TextChunk]): The input documents.
+        model_settings (dict, optional): Additional settings for the model.
+        batch_size (int, optional): The number of documents encoded together. Defaults to 32.
+
+    Returns:
+        List[Vector]: The generated embeddings, in the same order as the documents.
+    """
+    resolved_model = resolve_model(model)
+    if resolved_model.provider != "OpenAI":
+        raise ValueError(f"Model {model} not found in OpenAI settings.")
+    if resolved_model.model_class().config['variant'] != 'clip':
+        raise ValueError(f"Model {model} does not support batched embeddings.")
+    # the settings are validated once, the documents are checked when they are encoded
+    utils.validate_embeddings_input(model, resolved_model, model_settings)
+    clip_model = None
+    cache = get_embeddings_cache()
+
+    vectors = []
+    for batch in batched(documents, batch_size):
+        output_metadata = {
+            'model': model,
+            'model_settings': model_settings,
+            'timestamp': datetime.now().isoformat(),
+        }
+        embeddings = [None] * len(batch)
+        inputs = batch
+        if cache is not None:
+            # the remote images are downloaded once, for their cache keys and for the encoder
+            inputs = [utils.local_image_document(document) for document in batch]
+            cache_keys = [utils.embeddings_cache_key(cache, model, document, model_settings) for document in inputs]
+            embeddings = [cache.get(cache_key) for cache_key in cache_keys]
+        # only the documents missing from the cache are encoded, the model is loaded on the first miss
+        missing = [position for position, document_embeddings in enumerate(embeddings) if document_embeddings is None]
+        if missing:
+            if clip_model is None:
+                clip_model = CLIPmodel(model, model_settings)
+            for position, document_embeddings in zip(missing, clip_model.create_embeddings_clip_batch([inputs[position] for position in missing])):
+                embeddings[position] = document_embeddings
+                if cache is not None:
+                    cache.set(cache_keys[position], document_embeddings)
+        vectors.extend(utils.embeddings_to_vector(document, document_embeddings, output_metadata) for document, document_embeddings in zip(batch, embeddings))
+    return vectors
 
 
 class OpenaiModel():
@@ -415,6 +575,27 @@ class OpenaiModel():
             
 
 
+    def add_rag_prompt(self, query: str, context: list):
+        """
+        Build the agent prompt with the retrieved context and add it to the chat history.
+
+        Args:
+            query (str): The query text.
+            context (list): The retrieved vectors.
+        """
+        if not self.agent_prompt:
+            logger.error("agent_prompt is not defined.")
+        prompt = self.agent_prompt(query=query, context=context)
+        final_prompt = prompt.prompt
+        # print('used docs: ', prompt.context_doc) access source if you want
+        
+        # add the prompt and the context to the chat history
+
+        if prompt.images_list:
+            self.history.add_message(role='user', content=final_prompt, images=prompt.images_list)
+        else:
+            self.history.add_message(role='user', content=final_prompt)
+
     # note that OpenAI requires image url, and it has a specific chat format too, that's why we have a format_chat_to_openai_format function
     @require_login
     def chat(self, query: str, images: list = []):
@@ -432,22 +613,11 @@ class OpenaiModel():
             context = []
             if query:
                 context.extend(self.retriever(query_text=query))
-            elif query and images:
-                if images and len(images) > 1:
+            elif images:
+                if len(images) > 1:
                     logger.warning("Only one image is supported for now.")
                 context.extend(self.retriever(query_image=images[0]))
-            if not self.agent_prompt:
-                logger.error("agent_prompt is not defined.")
-            prompt = self.agent_prompt(query=query, context=context)
-            final_prompt = prompt.prompt
-            # print('used docs: ', prompt.context_doc) access source if you want
-            
-            # add the prompt and the context to the chat history
-
-            if prompt.images_list:
-                self.history.add_message(role='user', content=final_prompt, images=prompt.images_list)
-            else:
-                self.history.add_message(role='user', content=final_prompt)
+            self.add_rag_prompt(query, context)
 
             response = self.openai_client.chat.completions.create(
                 model=self.model_name,
@@ -486,4 +656,66 @@ class OpenaiModel():
             )
 
         self.history.add_message(role='assistant', content=response.choices[0].message.content)
-        return response.choices[0].message.content
\ No newline at end of file
+        return response.choices[0].message.content
+
+    @require_login
+    async def achat(self, query: str, images: list = []):
+        """
+        Async version of chat, using the AsyncOpenAI client.
+        The retriever can be a coroutine function (eg. Pinecone.aquery), otherwise it runs in the default executor.
+
+        Args:
+            query (str): The query text.
+            image (str, optional): The image URL.
+
+        Returns:
+            str: The generated response.
+        """
+        openai_client = get_async_client()
+        if self.retriever:
+            context = []
+            if query:
+                context.extend(await aretrieve(self.retriever, query_text=query))
+            elif images:
+                if len(images) > 1:
+                    logger.warning("Only one image is supported for now.")
+                context.extend(await aretrieve(self.retriever, query_image=images[0]))
+            self.add_rag_prompt(query, context)
+
+            response = await openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=utils.format_chat_to_openai_format(self.history.get_history())
+            )
+
+        elif self.tools is not None:
+            self.history.add_message(role='user', content=query, images=images, tools=self.tools)
+            response = await openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=utils.format_chat_to_openai_format(self.history.get_history()),
+                tools=self.tools,
+                tool_choice=self.tools_choice
+            )
+            if not response.choices[0].message.tool_calls:
+                return response.choices[0].message.content
+
+            tool_call_res, tool_call = utils.parse_tool_call(response, self.function_caller)
+            self.history.add_message(role='function', tool_call=tool_call, tool_call_response=tool_call_res)
+            response = await openai_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=utils.format_chat_to_openai_format(self.history.get_history())
+                )
+            self.history.add_message(role='assistant', content=response.choices[0].message.content)
+            return response.choices[0].message.content
+
+        else:
+            for image in images:
+                if not image.startswith('http'):
+                    raise ValueError(f"Image {image} is not a valid URL.")
+            self.history.add_message(role='user', content=query, images=images)
+            response = await openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=utils.format_chat_to_openai_format(self.history.get_history())
+            )
+
+        self.history.add_message(role='assistant', content=response.choices[0].message.content)
+        return response.choices[0].message.content
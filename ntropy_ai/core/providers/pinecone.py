@@ -1,23 +1,32 @@
 from ntropy_ai.core.utils.connections_manager import ConnectionManager
 from ntropy_ai.core.utils.settings import logger
-from ntropy_ai.core.utils.base_format import Vector, Document
-from typing import List
-from ntropy_ai.core.utils.settings import ModelsBaseSettings
+from ntropy_ai.core.utils.base_format import Vector, VectorBatch, Document
+from typing import Iterator, List, Tuple, Union
+from ntropy_ai.core.utils.settings import resolve_model
+from ntropy_ai.core.utils.filters import Eq, Filter, filter_fields, to_pinecone
+from ntropy_ai.core.utils.query_cache import get_query_cache
+from ntropy_ai.core.providers import embed_queries
 from ntropy_ai.core import utils
 from pinecone import Pinecone as PineconeLib
 from pinecone import ServerlessSpec
+from concurrent.futures import ThreadPoolExecutor
 import json
+import asyncio
+import functools
 import logging
+import random
+import time
+
+
+# Pinecone upsert request limits
+MAX_UPSERT_BATCH_SIZE = 1000 # vectors per request
+MAX_UPSERT_REQUEST_SIZE = 2 * 1024 * 1024 # bytes per request
 
 def get_client():
     return ConnectionManager().get_connection("Pinecone").get_client()
 
 def require_login(func):
-    def wrapper(*args, **kwargs):
-        if ConnectionManager().get_connection("Pinecone") is None:
-            raise Exception("Pinecone connection not found. Please initialize the connection.")
-        return func(*args, **kwargs)
-    return wrapper
+    return utils.require_connection("Pinecone")(func)
 
 class PineconeConnection:
     def __init__(self, api_key: str, other_setting: dict, **kwargs):
@@ -51,6 +60,10 @@ class Pinecone:
         self.embedding_model_name = None
         self.embedding_model_settings_top_k = None
         self.embedding_model_settings_include_values = None
+        # index name -> Index client and index name -> (dimension, metric), so a query does not describe the index again
+        self.indexes = {}
+        self.index_descriptions = {}
+        self.pod_indexes = set() # the pod based indexes can delete by metadata filter
         if not index_name:
             if not self.other_settings:
                 logger.error("No index name specified for Pinecone, please provide an index name !")
@@ -81,7 +94,21 @@ class Pinecone:
         self.index_name = index_name
     
     def get_index(self, index_name: str):
-        return self.client.Index(index_name)
+        if index_name not in self.indexes:
+            self.indexes[index_name] = self.client.Index(index_name)
+        return self.indexes[index_name]
+
+    def describe_index(self, index_name: str) -> tuple:
+        """
+        Returns the (dimension, metric) of an index, described once per store.
+        """
+        if index_name not in self.index_descriptions:
+            description = self.client.describe_index(index_name)
+            self.index_descriptions[index_name] = (description["dimension"], description["metric"])
+            spec = description.get("spec") if isinstance(description, dict) else getattr(description, "spec", None)
+            if spec is not None and (spec.get("pod") if isinstance(spec, dict) else getattr(spec, "pod", None)):
+                self.pod_indexes.add(index_name)
+        return self.index_descriptions[index_name]
     
     def sanitize_metadata(self, metadata):
         sanitized = {}
@@ -90,86 +117,301 @@ class Pinecone:
                 sanitized[k] = v
             elif isinstance(v, list) and all(isinstance(i, str) for i in v):
                 sanitized[k] = v
+            elif v is None:
+                continue # pinecone does not accept null metadata values
             else:
-                sanitized[k] = str(v)
+                # dicts (document_metadata, output_metadata) are stored as JSON strings
+                sanitized[k] = json.dumps(v, default=str)
         return sanitized
+
+    @staticmethod
+    def decode_metadata(value) -> Union[dict, None]:
+        """
+        Decodes a JSON metadata field (document_metadata, output_metadata).
+        """
+        if value is None or isinstance(value, dict):
+            return value
+        try:
+            return json.loads(value)
+        except ValueError:
+            # vectors upserted before the metadata was stored as JSON hold the python repr of the dict
+            return json.loads(value.replace("'", '"').replace("None", "null"))
+
+    def to_vector(self, match: dict, score: float = None) -> Vector:
+        """
+        Maps a Pinecone match / fetched vector back to the universal Vector format.
+        """
+        metadata = match.get('metadata') or {}
+        return Vector(
+            id=match['id'],
+            score=score,
+            document_id=metadata.get('document_id'),
+            vector=match.get('values') or [],
+            content=metadata.get('content'),
+            data_type=metadata.get('data_type'),
+            # the size is the one of the returned values (0 when the query does not include them)
+            size=len(match.get('values') or []),
+            document_metadata=self.decode_metadata(metadata.get('document_metadata')) or {},
+            output_metadata=self.decode_metadata(metadata.get('output_metadata')) or {}
+        )
     
-    def add_vectors(self, vectors: List[Vector], namespace: str = None):
+    def to_record(self, v: Vector) -> dict:
+        return {
+            "id": v.id,
+            "values": v.to_list(),
+            'metadata': self.sanitize_metadata({
+                "document_id": v.document_id,
+                'content': v.content,
+                "size": v.size,
+                'data_type': v.data_type,
+                "document_metadata": v.document_metadata,
+                "output_metadata": v.output_metadata,
+                # flattened metadata keys (eg. document_metadata.page_number), so they can be filtered
+                **filter_fields(v.document_metadata, v.output_metadata)
+            })
+        }
+
+    @staticmethod
+    def make_batches(records: List[dict], batch_size: int, max_request_size: int = MAX_UPSERT_REQUEST_SIZE) -> List[List[dict]]:
+        """
+        Splits the records in batches of at most batch_size records and max_request_size bytes (estimated on the JSON payload).
+        """
+        batches, batch, batch_bytes = [], [], 0
+        for record in records:
+            # ~ size of the record in the request body
+            record_bytes = len(json.dumps(record, default=str)) + 1
+            if batch and (len(batch) >= batch_size or batch_bytes + record_bytes > max_request_size):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(record)
+            batch_bytes += record_bytes
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def add_vectors(self,
+                    vectors: Union[List[Vector], VectorBatch],
+                    namespace: str = None,
+                    batch_size: int = 100,
+                    max_workers: int = 8,
+                    max_retries: int = 3) -> List[dict]:
+        """
+        Upserts vectors in batches, sent concurrently. A failed batch is retried with exponential backoff.
+
+        Args:
+            vectors (List[Vector] | VectorBatch): The vectors to upsert.
+            namespace (str, optional): The namespace.
+            batch_size (int, optional): The maximum number of vectors per request (at most 1000). Defaults to 100.
+            max_workers (int, optional): The number of concurrent requests. Defaults to 8.
+            max_retries (int, optional): The number of retries of a failed batch. Defaults to 3.
+
+        Returns:
+            List[dict]: One report per batch: batch, size, upserted_count, attempts and error (None if the batch was upserted).
+        """
+        if len(vectors) == 0:
+            return []
         if vectors[0].document_id or vectors[0].size:
             logger.warning("Only the fields 'id' and 'values' are supported by Pinecone. The remaining fields will be stored in 'metadata'.")
-        for v in vectors:
-            self.get_index(self.index_name).upsert(
-                vectors=[
-                    {
-                        "id": v.id,
-                        "values": v.vector, 
-                        'metadata': self.sanitize_metadata({
-                            "document_id": v.document_id,
-                            'content': v.content,
-                            "size": v.size,
-                            'data_type': v.data_type,
-                            "document_metadata": v.document_metadata,
-                            "output_metadata": v.output_metadata
-                        })
-                    }
-                ],
-                namespace=namespace
-            )
+        index = self.get_index(self.index_name)
+        if isinstance(vectors, VectorBatch):
+            vectors = vectors.to_vectors()
+        batches = self.make_batches([self.to_record(v) for v in vectors], min(batch_size, MAX_UPSERT_BATCH_SIZE))
+
+        def upsert(batch_number: int, batch: List[dict]) -> dict:
+            report = {"batch": batch_number, "size": len(batch), "upserted_count": 0, "attempts": 0, "error": None}
+            for attempt in range(max_retries + 1):
+                report["attempts"] = attempt + 1
+                try:
+                    response = index.upsert(vectors=batch, namespace=namespace)
+                    report["upserted_count"] = response.get("upserted_count", len(batch)) if hasattr(response, "get") else len(batch)
+                    report["error"] = None
+                    return report
+                except Exception as e:
+                    report["error"] = str(e)
+                    if attempt < max_retries:
+                        time.sleep(random.uniform(0, min(10, 0.5 * 2 ** attempt)))
+            logger.error(f"Pinecone upsert of batch {batch_number} ({len(batch)} vectors) failed after {report['attempts']} attempts: {report['error']}")
+            return report
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            reports = list(executor.map(upsert, range(len(batches)), batches))
+        self.invalidate_query_cache(namespace)
+        failed = sum(report["size"] for report in reports if report["error"])
+        if failed:
+            logger.warning(f"{failed} of {len(vectors)} vectors were not upserted, see the returned report.")
+        return reports
+
+
+    def delete(self, ids: List[str], namespace: str = None, batch_size: int = 1000) -> int:
+        """
+        Deletes vectors by id, in batches of batch_size ids per request.
+
+        Returns:
+            int: The number of ids sent for deletion.
+        """
+        index = self.get_index(self.index_name)
+        for start in range(0, len(ids), batch_size):
+            index.delete(ids=list(ids[start:start + batch_size]), namespace=namespace)
+        self.invalidate_query_cache(namespace)
+        return len(ids)
 
+    def delete_by_document(self, document_id: str, namespace: str = None, batch_size: int = 1000) -> int:
+        """
+        Deletes the vectors of a document.
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        return self.delete_by_filter(Eq("document_id", document_id), namespace=namespace, batch_size=batch_size)
+
+    def delete_by_filter(self, filter: Filter, namespace: str = None, batch_size: int = 1000, page_size: int = 10000, max_wait: float = 60) -> int:
+        """
+        Deletes the vectors matching a filter (eg. Eq("document_metadata.source", "report.pdf")).
+        The pod indexes delete by metadata filter in one request. The serverless indexes can not, so the matching ids
+        are read with filtered queries (page_size ids per query, without values nor metadata) and deleted with batched deletes,
+        until a query returns no match.
+
+        Args:
+            filter (Filter): The metadata filter.
+            namespace (str, optional): The namespace.
+            batch_size (int, optional): The number of ids per delete request. Defaults to 1000.
+            page_size (int, optional): The number of ids read per query. Defaults to 10000.
+            max_wait (float, optional): How long to wait (with exponential backoff) for the deletes to be visible to the queries
+                when a full page only returns deleted ids. Defaults to 60 seconds.
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        index = self.get_index(self.index_name)
+        dimension, _ = self.describe_index(self.index_name)
+        if self.index_name in self.pod_indexes:
+            stats = index.describe_index_stats(filter=to_pinecone(filter))
+            count = stats["namespaces"].get(namespace or "", {}).get("vector_count", 0)
+            index.delete(filter=to_pinecone(filter), namespace=namespace)
+            self.invalidate_query_cache(namespace)
+            return count
+        # any vector works, the filter selects the matches (a zero vector is rejected by the cosine indexes)
+        probe = [1.0] * dimension
+        deleted = set()
+        delay, waited = 0.5, 0.0
+        while True:
+            matches = index.query(vector=probe, top_k=page_size, include_values=False, include_metadata=False, namespace=namespace, filter=to_pinecone(filter))['matches']
+            if not matches:
+                break
+            # the deletes are eventually consistent, the ids already deleted can still be returned
+            ids = [match['id'] for match in matches if match['id'] not in deleted]
+            if ids:
+                self.delete(ids, namespace=namespace, batch_size=batch_size)
+                deleted.update(ids)
+                delay = 0.5
+                continue
+            if len(matches) < page_size:
+                # every match of the filter is in the page and was deleted
+                break
+            # a full page of deleted ids can hide the next matches, wait for the deletes to be visible
+            if waited >= max_wait:
+                logger.warning(f"the deletes of {len(deleted)} vectors are not visible after {max_wait}s, some vectors matching the filter may remain")
+                break
+            time.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 8)
+        return len(deleted)
+
+    def invalidate_query_cache(self, namespace: str = None):
+        # the cached query results of the namespace may not include the written vectors
+        cache = get_query_cache()
+        if cache is not None:
+            cache.invalidate(cache.make_scope("pinecone", self.index_name, namespace))
 
     # set embeddings model default
     def set_embeddings_model(self, model: str, model_settings: dict = None):
         self.embedding_model_settings = model_settings
         self.embedding_model_name = model
-        for provider in ModelsBaseSettings().providers_list_map:
-            if "embeddings_models" in ModelsBaseSettings().providers_list_map[provider]:
-                for model_name in ModelsBaseSettings().providers_list_map[provider]['embeddings_models']['models_map']:
-                    if model_name == model:
-                        self.embedding_func = ModelsBaseSettings().providers_list_map[provider]['functions']['embeddings']
-                        # this needs to be fixed !
-                        break
+        self.embedding_func = resolve_model(model).embedding_func
         if not self.embedding_func:
             raise Exception(f"model {model} not found !")
         
 
-    def fetch_vectors(self, ids: List[str]):
-        return self.get_index(self.index_name).fetch(ids=ids)
+    def fetch_vectors(self, ids: List[str], namespace: str = None):
+        """
+        Returns the Pinecone fetch response of the given ids (see fetch_as_vectors for Vector objects).
+        """
+        return self.get_index(self.index_name).fetch(ids=ids, namespace=namespace)
+
+    def fetch_as_vectors(self, ids: List[str], namespace: str = None) -> List[Vector]:
+        """
+        Returns the stored vectors with the given ids, with their values, in the universal Vector format (the unknown ids are skipped).
+        """
+        response = self.fetch_vectors(ids, namespace=namespace)
+        return [self.to_vector(v) for v in response['vectors'].values()]
     
+    def iter_vectors(self, namespace: str = None, batch_size: int = 100, cursor: str = None) -> Iterator[Tuple[List[Vector], Union[str, None]]]:
+        """
+        Streams the vectors of a namespace: a page of ids is listed (at most 100 per page) then fetched with its values.
+        Yields each batch with the cursor (pagination token) to resume after it, None after the last page.
+        """
+        index = self.get_index(self.index_name)
+        while True:
+            page = index.list_paginated(limit=min(batch_size, 100), pagination_token=cursor, namespace=namespace or "")
+            ids = [vector.id for vector in page.vectors]
+            cursor = page.pagination.next if page.pagination else None
+            if ids:
+                yield self.fetch_as_vectors(ids, namespace=namespace), cursor
+            if cursor is None:
+                return
+
     def set_retriever_settings(self, top_k: int, include_values: bool):
         self.embedding_model_settings_top_k = top_k
         self.embedding_model_settings_include_values = include_values
 
-    # this function returns a vector, it will be modified to return the results directly
     def query(self, 
-              query_vector: List[float] = None, 
+              query_vector: Union[List[float], Vector] = None, 
               model_settings: dict = None, 
               model: str = None, 
               query_text: str = None, 
               query_image: str = None, 
               top_k: int = 5, 
-              include_values: bool = False, 
-              namespace: str = None) -> list:
-           
-        # the model name is required
-        query_dimension = self.client.describe_index(self.index_name)["dimension"]
-        metric = self.client.describe_index(self.index_name)["metric"]
-        if not model:
-            if not self.embedding_model_name:
-                raise Exception("model is required !")
-            model = self.embedding_model_name
-        if not query_vector:
+              include_values: bool = True, 
+              namespace: str = None,
+              filter: Filter = None) -> List[Vector]:
+        """
+        Queries the index, the content and metadata are returned by the query itself (include_metadata),
+        so a query is one network call once the index dimension is cached.
+        filter (eg. Eq("data_type", "text") & Range("document_metadata.page_number", lte=3)) is applied by Pinecone.
+        The results are cached when the query cache is enabled (see enable_query_cache).
+        The values are returned by default (as with the previous fetch), include_values=False returns the Vectors
+        with an empty vector and size 0.
+        """
+        top_k = self.embedding_model_settings_top_k if self.embedding_model_settings_top_k else top_k
+        include_values = self.embedding_model_settings_include_values if self.embedding_model_settings_include_values else include_values
+        cache, cache_key = get_query_cache(), None
+        if cache is not None and (query_vector is not None or query_text):
+            scope = cache.make_scope("pinecone", self.index_name, namespace)
+            cache_key = cache.make_key(
+                scope, query_text if query_vector is None else query_vector, top_k, include_values, filter,
+                model or self.embedding_model_name if query_vector is None else None,
+                # the settings the query is embedded with (the default embedding function uses the store settings)
+                (self.embedding_model_settings if self.embedding_func else model_settings) if query_vector is None else None
+            )
+            results = cache.get(cache_key)
+            if results is not None:
+                return results
+            generation = cache.generation(scope)
+
+        query_dimension, _ = self.describe_index(self.index_name)
+        if query_vector is None:
+            # the model name is required to embed the query
+            if not model:
+                if not self.embedding_model_name:
+                    raise Exception("model is required !")
+                model = self.embedding_model_name
             query_vector_func = None
             # if the user did not set a default embedding model but specified one in the parameters
             if not self.embedding_func:
                 if not model_settings:
                     if not self.embedding_model_settings:
                         raise Exception("model settings is required to match the output format !")
-                for provider in ModelsBaseSettings().providers_list_map:
-                    if "embeddings_models" in ModelsBaseSettings().providers_list_map[provider]:
-                        for model_name in ModelsBaseSettings().providers_list_map[provider]['embeddings_models']['models_map']:
-                            if model_name == model:
-                                query_vector_func = ModelsBaseSettings().providers_list_map[provider]['functions']['embeddings']
-                                break
+                query_vector_func = resolve_model(model).embedding_func
             else:
                 logger.warning("using default embedding model")
                 model_settings = self.embedding_model_settings
@@ -189,37 +431,60 @@ class Pinecone:
             
             query_vector = query_vector_func(model, document, model_settings)
 
-        if query_vector.size != query_dimension:
+        values = query_vector.to_list() if isinstance(query_vector, Vector) else [float(value) for value in query_vector]
+        if len(values) != query_dimension:
             logger.warning(f"query_vector shape does not match the vector store dimension (which is {query_dimension}). use model_settings to set the correct dimension !")
 
-
-        results =  self.get_index(self.index_name).query(
-            vector=query_vector.vector if isinstance(query_vector, Vector) else query_vector,
-            top_k=self.embedding_model_settings_top_k if self.embedding_model_settings_top_k else top_k,
-            include_values=self.embedding_model_settings_include_values if self.embedding_model_settings_include_values else include_values,
-            namespace=namespace
+        results = self.get_index(self.index_name).query(
+            vector=values,
+            top_k=top_k,
+            include_values=include_values,
+            include_metadata=True,
+            namespace=namespace,
+            filter=to_pinecone(filter) if filter is not None else None
         )
+        # remap the matches to the universal Vector format
+        vectors = [self.to_vector(match, score=match['score']) for match in results['matches']]
+        if cache_key is not None:
+            cache.set(cache_key, scope, vectors, generation)
+        return vectors
 
-        results_ids = {}
-        for v in results['matches']:
-            results_ids[v['id']] = v['score']
-
-        original_vectors = self.fetch_vectors(list(results_ids.keys())) # use the fetch vectors by id to fetch back the vectors and its content inside metadata from pinecone
-        # remap the vector to map the original universal format
-        results_vectors = []
-        for vector in original_vectors['vectors']:
-            v = original_vectors['vectors'][vector]
-            results_vectors.append(
-                    Vector(
-                        id=v['id'], 
-                        score=results_ids[v['id']],
-                        document_id=v['metadata']['document_id'],
-                        vector=v['values'], 
-                        content=v['metadata']['content'],
-                        data_type=v['metadata']['data_type'],
-                        size=v['metadata']['size'],
-                        document_metadata = json.loads(v['metadata']['document_metadata'].replace("'", '"').replace("None", "null")),
-                        output_metadata = json.loads(v['metadata']['output_metadata'].replace("'", '"').replace("None", "null"))
-                    )
-            )
-        return results_vectors
+    def query_many(self,
+                   queries: List[Union[str, List[float], Vector]],
+                   top_k: int = 5,
+                   model_settings: dict = None,
+                   model: str = None,
+                   include_values: bool = True,
+                   namespace: str = None,
+                   filter: Filter = None,
+                   max_workers: int = 8) -> List[List[Vector]]:
+        """
+        Runs several queries at once: the text queries are embedded in one batch (embed_many)
+        and the Pinecone queries are sent concurrently.
+
+        Args:
+            queries (List[str | List[float] | Vector]): The query texts or query vectors.
+            top_k (int, optional): The number of results per query. Defaults to 5.
+            max_workers (int, optional): The number of concurrent queries. Defaults to 8.
+
+        Returns:
+            List[List[Vector]]: The results of each query, in the order of the queries.
+        """
+        if len(queries) == 0:
+            return []
+        model = model or self.embedding_model_name
+        model_settings = model_settings or (self.embedding_model_settings if model == self.embedding_model_name else None)
+        query_vectors = embed_queries(model, queries, model_settings)
+
+        def query(query_vector: Union[List[float], Vector]) -> List[Vector]:
+            return self.query(query_vector=query_vector, top_k=top_k, include_values=include_values, namespace=namespace, filter=filter)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(query_vectors))) as executor:
+            return list(executor.map(query, query_vectors))
+
+    async def aquery(self, **kwargs) -> list:
+        """
+        async version of query, it runs in the default executor so the event loop is not blocked.
+        takes the same arguments as query.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.query, **kwargs))
@@ -1,12 +1,13 @@
 import tempfile
-from PIL import Image
-import requests
 from ntropy_ai.core.utils.base_format import Document
 import os
 from shutil import get_terminal_size
 from threading import Thread
 import time
-from itertools import cycle
+from itertools import cycle, islice
+import asyncio
+import functools
+import inspect
 
 
 temps_images = [] # we save the images in a list to be able to clear the cache
@@ -14,6 +15,9 @@ temps_images = [] # we save the images in a list to be able to clear the cache
 # by default return file path, if return_doc is True return file object
 def save_img_to_temp_file(image_url: str, return_doc: bool = False):
     if image_url.startswith('http'):
+        # PIL and requests are imported on first use to keep `import ntropy_ai` cheap
+        from PIL import Image
+        import requests
         with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as image_file:
             image_path = image_file.name
             img = Image.open(requests.get(image_url, stream=True).raw)
@@ -31,6 +35,7 @@ def save_img_to_temp_file(image_url: str, return_doc: bool = False):
 
 def ensure_local_file(remote_file_path: str) -> str:
     if remote_file_path.startswith('http'):
+        import requests
         response = requests.get(remote_file_path)
         ext = os.path.splitext(remote_file_path)[1]  # Extract the file extension
         with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as temp_file:
@@ -39,6 +44,60 @@ def ensure_local_file(remote_file_path: str) -> str:
     else:
         return remote_file_path
 
+def batched(iterable, size: int):
+    """
+    Split an iterable into lists of at most size items (itertools.batched is only available from python 3.12).
+    """
+    if size < 1:
+        raise ValueError("size must be at least one")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def require_connection(provider: str):
+    """
+    Returns the decorator that checks the connection of a provider (eg. "OpenAI") is initialized before calling the function.
+    Coroutine functions get a coroutine wrapper, so they are still detected by inspect.iscoroutinefunction (eg. aretrieve),
+    and the wrappers keep the name and the docstring of the function.
+    """
+    def check():
+        from ntropy_ai.core.utils.connections_manager import ConnectionManager
+        if ConnectionManager().get_connection(provider) is None:
+            raise Exception(f"{provider} connection not found. Please initialize the connection.")
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                check()
+                return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            check()
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+async def aretrieve(retriever, **kwargs) -> list:
+    """
+    Call a retriever from a coroutine: coroutine functions (eg. Pinecone.aquery) are awaited,
+    blocking retrievers (eg. Pinecone.query) run in the default executor so they do not block the event loop.
+    """
+    if inspect.iscoroutinefunction(retriever):
+        return await retriever(**kwargs)
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(retriever, **kwargs))
+
+def failed_writes(reports) -> int:
+    """
+    Returns the number of vectors an add_vectors call could not write, from its reports:
+    nothing (local store) or one report per request (Pinecone: error and size, OpenSearch: errors).
+    """
+    if not reports:
+        return 0
+    return sum(report["size"] if report.get("error") else len(report.get("errors") or []) for report in reports)
+
 def clear_cache():
     for file in temps_images:
         os.remove(file)
@@ -46,6 +105,7 @@ def clear_cache():
 
     
 def resize_image(image_path: str, max_size: int = 1024):
+    from PIL import Image
     img = Image.open(image_path)
     img.thumbnail((max_size, max_size), Image.LANCZOS)  # Preserves aspect ratio
     new_image_path = os.path.splitext(image_path)[0] + ".png"
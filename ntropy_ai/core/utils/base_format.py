@@ -2,10 +2,19 @@
 
 Document Format
 """
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Union
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, field_validator, field_serializer
+from typing import List, Union, Any, Iterator
 from uuid import uuid4
 
+# numpy is imported on first use, so importing the base formats stays cheap
+_float_list = TypeAdapter(List[float])
+
+def is_array(value) -> bool:
+    """
+    True if the value is a numpy array (checked without importing numpy).
+    """
+    return type(value).__module__ == 'numpy' and hasattr(value, 'dtype')
+
 class BaseDocument(BaseModel):
     id: str = Field(default_factory=lambda: uuid4().hex)
     metadata: dict = Field(default={})
@@ -26,7 +35,7 @@ class Vector(BaseModel):
     id: str = Field(default_factory=lambda: uuid4().hex)
     document_id: str
     score: Union[float, None] = None # only for results vector
-    vector: List[float] = Field()
+    vector: Any = Field() # List[float] or a 1-D float32 numpy array (kept as is, without copy)
     size: int
     data_type: str
     content: Union[str, None] = None
@@ -34,7 +43,137 @@ class Vector(BaseModel):
     output_metadata: dict = Field(default={})
     #metadata: dict = Field(default={})
 
-    class Config:
-        extra = "allow"
+    model_config = ConfigDict(extra="allow", arbitrary_types_allowed=True)
+
+    @field_validator('vector', mode='plain')
+    @classmethod
+    def validate_vector(cls, value):
+        if is_array(value):
+            import numpy as np
+            # no copy if the array is already a float32 array
+            return np.asarray(value, dtype=np.float32).reshape(-1)
+        return _float_list.validate_python(value)
+
+    @field_serializer('vector')
+    def serialize_vector(self, value):
+        return value.tolist() if is_array(value) else value
+
+    def to_numpy(self):
+        """
+        Returns the embeddings as a float32 numpy array (without copy if the vector already wraps an array).
+        """
+        import numpy as np
+        return np.asarray(self.vector, dtype=np.float32)
+
+    def to_list(self) -> List[float]:
+        """
+        Returns the embeddings as a list of floats (the format expected by the vector stores APIs).
+        """
+        return self.vector.tolist() if is_array(self.vector) else self.vector
+
+
+class VectorBatch(BaseModel):
+    """
+    Columnar container of N vectors: the embeddings are stored as one contiguous (N, dimension) float32 matrix
+    and the other fields as columns. Indexing the batch or iter_vectors() returns Vector objects that wrap a row of the matrix (no copy).
+
+    usage:
+    - batch = VectorBatch.from_vectors(vectors)
+    - batch.vectors @ query  # similarities
+    - for vector in batch.iter_vectors(): ...
+    - store.add_vectors(batch)
+    """
+    vectors: Any # (N, dimension) float32 numpy array
+    ids: List[str]
+    document_ids: List[str]
+    data_types: List[str]
+    contents: List[Union[str, None]]
+    document_metadata: List[dict]
+    output_metadata: List[dict]
+    scores: Union[List[Union[float, None]], None] = None
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @field_validator('vectors', mode='plain')
+    @classmethod
+    def validate_vectors(cls, value):
+        import numpy as np
+        value = np.ascontiguousarray(value, dtype=np.float32)
+        if value.ndim != 2:
+            raise ValueError("vectors must be a 2-D (N, dimension) matrix")
+        return value
+
+    @classmethod
+    def from_vectors(cls, vectors: List[Vector]) -> "VectorBatch":
+        """
+        Builds a batch from a list of Vector objects (the embeddings are copied once into the matrix).
+        """
+        import numpy as np
+        vectors = list(vectors)
+        matrix = np.empty((len(vectors), vectors[0].size if vectors else 0), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            matrix[row] = vector.vector
+        return cls(
+            vectors=matrix,
+            ids=[vector.id for vector in vectors],
+            document_ids=[vector.document_id for vector in vectors],
+            data_types=[vector.data_type for vector in vectors],
+            contents=[vector.content for vector in vectors],
+            document_metadata=[vector.document_metadata for vector in vectors],
+            output_metadata=[vector.output_metadata for vector in vectors],
+            scores=[vector.score for vector in vectors] if any(vector.score is not None for vector in vectors) else None
+        )
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Vector:
+        return Vector(
+            id=self.ids[index],
+            document_id=self.document_ids[index],
+            score=self.scores[index] if self.scores else None,
+            vector=self.vectors[index],
+            size=self.dimension,
+            data_type=self.data_types[index],
+            content=self.contents[index],
+            document_metadata=self.document_metadata[index],
+            output_metadata=self.output_metadata[index]
+        )
+
+    def iter_vectors(self) -> Iterator[Vector]:
+        """
+        Yields the vectors of the batch as Vector objects, in row order.
+        (iterating the batch itself yields its fields, like any pydantic model)
+        """
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_vectors(self) -> List[Vector]:
+        return list(self.iter_vectors())
+
+    def take(self, rows: List[int]) -> "VectorBatch":
+        """
+        Returns a new batch with the given rows, in the given order.
+        """
+        return VectorBatch(
+            vectors=self.vectors[rows],
+            ids=[self.ids[row] for row in rows],
+            document_ids=[self.document_ids[row] for row in rows],
+            data_types=[self.data_types[row] for row in rows],
+            contents=[self.contents[row] for row in rows],
+            document_metadata=[self.document_metadata[row] for row in rows],
+            output_metadata=[self.output_metadata[row] for row in rows],
+            scores=[self.scores[row] for row in rows] if self.scores else None
+        )
+
+    def deduplicated(self) -> "VectorBatch":
+        """
+        Returns the batch without its duplicate ids, the last vector of an id is kept (as if the batch was upserted one by one).
+        """
+        last = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        return self if len(last) == len(self) else self.take(sorted(last.values()))
 
 
@@ -0,0 +1,116 @@
+"""
+Diversity re-ranking
+
+Post-retrieval stage for the List[Vector] returned by any vector store:
+- mmr: Maximal Marginal Relevance re-ranking, each step picks the vector maximizing
+  lambda_mult * relevance - (1 - lambda_mult) * max similarity to the already selected vectors.
+  The similarities are computed once, as one (n, n) cosine similarity matrix.
+- drop_duplicates: removes the near-duplicates (eg. several copies of the same slide text), keeping the best ranked copy.
+
+usage:
+- results = store.query(query_text="...", top_k=20, include_values=True)
+- context = mmr(results, top_k=5, lambda_mult=0.5, duplicate_threshold=0.95)
+- context = mmr(results, top_k=5, higher_is_better=False) # the scores are distances (l2 LocalVectorStore, IVFPQIndex)
+"""
+from ntropy_ai.core.utils.base_format import Vector
+from typing import List, Union
+
+
+def has_values(vectors: List[Vector]) -> bool:
+    # the stores return the vectors without their values unless include_values=True
+    return all(v.vector is not None and len(v.vector) > 0 for v in vectors)
+
+
+def _normalized_matrix(vectors: List[Vector]):
+    import numpy as np
+    if not has_values(vectors):
+        raise ValueError("the vectors values are required, query the vector store with include_values=True")
+    matrix = np.stack([v.to_numpy() for v in vectors])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def drop_duplicates(vectors: List[Vector], threshold: float = 0.95) -> List[Vector]:
+    """
+    Removes the near-duplicates of a ranked list of vectors, the first (best ranked) copy is kept.
+    Without the vectors values, only the vectors with the same content (whitespace normalized) are duplicates.
+
+    Args:
+        vectors (List[Vector]): The retrieved vectors, best first.
+        threshold (float, optional): The cosine similarity above which two vectors are duplicates. Defaults to 0.95.
+
+    Returns:
+        List[Vector]: The vectors without their duplicates, in the same order.
+    """
+    if not vectors:
+        return []
+    if not has_values(vectors):
+        seen, kept = set(), []
+        for v in vectors:
+            content = " ".join(v.content.split()) if v.content else v.id
+            if content not in seen:
+                seen.add(content)
+                kept.append(v)
+        return kept
+    import numpy as np
+    similarities = _normalized_matrix(vectors)
+    similarities = similarities @ similarities.T
+    kept = np.zeros(len(vectors), dtype=bool)
+    for i in range(len(vectors)):
+        kept[i] = not np.any(similarities[i, kept] > threshold)
+    return [v for v, keep in zip(vectors, kept) if keep]
+
+
+def mmr(vectors: List[Vector],
+        query_vector: Union[List[float], Vector] = None,
+        top_k: int = None,
+        lambda_mult: float = 0.5,
+        duplicate_threshold: Union[float, None] = 0.95,
+        higher_is_better: bool = True) -> List[Vector]:
+    """
+    Re-ranks the retrieved vectors with Maximal Marginal Relevance.
+
+    Args:
+        vectors (List[Vector]): The retrieved vectors, with their values (include_values=True).
+        query_vector (List[float] | Vector, optional): The query embeddings, the relevance is the cosine similarity to the query.
+            Defaults to None: the relevance is the score returned by the store, min-max normalized.
+        top_k (int, optional): The number of vectors to select. Defaults to all the vectors.
+        lambda_mult (float, optional): 1 ranks by relevance only, 0 by diversity only. Defaults to 0.5.
+        duplicate_threshold (float, optional): The vectors whose cosine similarity to a selected vector is above
+            the threshold are dropped. Defaults to 0.95, None keeps them.
+        higher_is_better (bool, optional): Whether a higher store score is more relevant, False for the distances
+            (eg. the l2 metric). Only used without query_vector. Defaults to True.
+
+    Returns:
+        List[Vector]: The selected vectors, in MMR order.
+    """
+    if not vectors:
+        return []
+    import numpy as np
+    matrix = _normalized_matrix(vectors)
+    if query_vector is not None:
+        query = query_vector.to_numpy() if isinstance(query_vector, Vector) else np.asarray(query_vector, dtype=np.float32)
+        relevance = matrix @ (query / max(np.linalg.norm(query), np.finfo(np.float32).tiny))
+    else:
+        scores = np.array([v.score if v.score is not None else 0.0 for v in vectors], dtype=np.float32)
+        if not higher_is_better:
+            scores = -scores
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones(len(vectors), dtype=np.float32)
+    similarities = matrix @ matrix.T
+
+    top_k = len(vectors) if top_k is None else min(top_k, len(vectors))
+    available = np.ones(len(vectors), dtype=bool)
+    max_similarity = np.full(len(vectors), -np.inf, dtype=np.float32)
+    selected = []
+    while len(selected) < top_k and available.any():
+        # the first pick is the most relevant vector (no selected vector to be similar to yet)
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0)
+        objective = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(objective))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarities[best])
+        if duplicate_threshold is not None:
+            available &= max_similarity <= duplicate_threshold
+    return [vectors[i] for i in selected]
@@ -0,0 +1,211 @@
+"""
+Embeddings cache
+
+Content addressed cache of the embeddings, stored in a local SQLite database.
+The key is a hash of the model name, the normalized model settings and the text or the image bytes,
+so re-ingesting an unchanged chunk does not call the embeddings model again.
+The database is capped in size and the least recently used embeddings are evicted first.
+The access times of the hits are kept in memory and written in one transaction with the next insert
+(or every ACCESS_FLUSH_SIZE hits), so a cached lookup does not commit to the database.
+The database is stored in the user cache directory ($XDG_CACHE_HOME/ntropy_ai, defaults to ~/.cache/ntropy_ai).
+
+usage:
+- enable_embeddings_cache(max_size=512 * 1024 * 1024)
+- ... OpenAIEmbeddings / AWSEmbeddings / embed_many use the cache ...
+- get_embeddings_cache().stats()
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import List, Union
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "ntropy_ai")
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "embeddings_cache.db")
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024 # 1GB of embeddings
+ACCESS_FLUSH_SIZE = 256 # pending access times written at once
+
+
+class EmbeddingsCache():
+    """
+    SQLite embeddings cache with a size cap and LRU eviction.
+    The embeddings are stored as float64 blobs, so the cached values are the exact values returned by the model.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        Args:
+            path (str, optional): The path of the SQLite database. Defaults to ~/.cache/ntropy_ai/embeddings_cache.db.
+            max_size (int, optional): The maximum size of the stored embeddings in bytes. Defaults to 1GB.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._accessed = {} # key -> last access time, not written yet
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the embeddings functions can run on a thread pool, the connection is shared and guarded by the lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, size INTEGER, last_access REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, model_settings: Union[dict, None], text: str = None, image: bytes = None) -> str:
+        """
+        Builds the cache key of an input.
+
+        Args:
+            model (str): The model name.
+            model_settings (dict): The settings that change the output of the model.
+            text (str, optional): The text input.
+            image (bytes, optional): The image input.
+
+        Returns:
+            str: The sha256 hex digest of the input.
+        """
+        key = hashlib.sha256()
+        key.update(model.encode('utf-8'))
+        key.update(b'\0')
+        key.update(json.dumps(model_settings or {}, sort_keys=True, default=str).encode('utf-8'))
+        key.update(b'\0')
+        if text is not None:
+            key.update(b'text:')
+            key.update(text.encode('utf-8') if isinstance(text, str) else text)
+        if image is not None:
+            key.update(b'image:')
+            key.update(image)
+        return key.hexdigest()
+
+    def get(self, key: str) -> Union[List[float], None]:
+        """
+        Returns the cached embeddings, or None if the key is not in the cache.
+        """
+        with self._lock:
+            row = self.db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accesses()
+                self.db.commit()
+        return array('d', row[0]).tolist()
+
+    def set(self, key: str, embeddings):
+        """
+        Stores embeddings (list of floats or numpy array) in the cache, evicting the least recently used ones if the cache is full.
+        """
+        # numpy embeddings (eg. CLIP batches) are converted without going through python floats
+        blob = embeddings.astype('float64').tobytes() if hasattr(embeddings, 'astype') else array('d', embeddings).tobytes()
+        with self._lock:
+            self._flush_accesses()
+            previous = self.db.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+            self.size += len(blob) - (previous[0] if previous else 0)
+            if self.size > self.max_size:
+                self._evict()
+            self.db.commit()
+
+    def _flush_accesses(self):
+        # the LRU order is only read by _evict, the access times of the hits are written in batches
+        if self._accessed:
+            self.db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def flush(self):
+        """
+        Writes the pending access times of the cached embeddings.
+        """
+        with self._lock:
+            self._flush_accesses()
+            self.db.commit()
+
+    def _evict(self):
+        # drop the least recently used entries until the cache is 10% under its cap, so we do not evict on every insert
+        target = self.max_size * 0.9
+        rows = self.db.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+    def clear(self):
+        """
+        Removes all the cached embeddings and resets the statistics.
+        """
+        with self._lock:
+            self._accessed.clear()
+            self.db.execute("DELETE FROM embeddings")
+            self.db.commit()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the hit / miss statistics of the cache.
+        """
+        with self._lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size': self.size,
+            'max_size': self.max_size
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_accesses()
+            self.db.commit()
+            self.db.close()
+
+
+_embeddings_cache = None
+
+def enable_embeddings_cache(path: str = DEFAULT_CACHE_PATH, max_size: int = DEFAULT_MAX_SIZE) -> EmbeddingsCache:
+    """
+    Enables the embeddings cache for the OpenAI and AWS embeddings functions.
+
+    Args:
+        path (str, optional): The path of the SQLite database.
+        max_size (int, optional): The maximum size of the stored embeddings in bytes.
+
+    Returns:
+        EmbeddingsCache: The cache instance.
+    """
+    global _embeddings_cache
+    if _embeddings_cache is not None:
+        _embeddings_cache.close()
+    _embeddings_cache = EmbeddingsCache(path=path, max_size=max_size)
+    return _embeddings_cache
+
+def disable_embeddings_cache():
+    """
+    Disables the embeddings cache, the stored embeddings are kept on disk.
+    """
+    global _embeddings_cache
+    if _embeddings_cache is not None:
+        _embeddings_cache.close()
+    _embeddings_cache = None
+
+def get_embeddings_cache() -> Union[EmbeddingsCache, None]:
+    """
+    Returns the enabled embeddings cache, or None if the cache is disabled.
+    """
+    return _embeddings_cache
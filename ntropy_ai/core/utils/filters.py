@@ -0,0 +1,176 @@
+"""
+Metadata filters
+
+Provider-neutral filter expressions, translated to the filter syntax of each vector store so the search is restricted
+server-side instead of over-fetching and filtering the results in python.
+
+The fields are the Vector fields (document_id, data_type) or a key of its metadata dicts, as a path:
+document_metadata.page_number, output_metadata.model...
+Only the scalar values (str, int, float, bool) and the lists of strings of the metadata dicts can be filtered.
+
+usage:
+- from ntropy_ai.core.utils.filters import Eq, In, Range
+- filter = Eq("data_type", "text") & Range("document_metadata.page_number", gte=2, lte=5)
+- filter = In("document_id", ["doc-1", "doc-2"]) | Eq("data_type", "image")
+- store.query(query_text="...", filter=filter)
+"""
+from pydantic import BaseModel
+from typing import Any, Collection, List, Set, Union
+
+
+# metadata dicts whose keys are stored as filterable fields
+METADATA_FIELDS = ("document_metadata", "output_metadata")
+
+
+class Filter(BaseModel):
+    """
+    Base class of the filter expressions, combine them with & and |.
+    """
+    def __and__(self, other: "Filter") -> "And":
+        return And(filters=[self, other])
+
+    def __or__(self, other: "Filter") -> "Or":
+        return Or(filters=[self, other])
+
+
+class Eq(Filter):
+    field: str
+    value: Union[str, int, float, bool]
+
+    def __init__(self, field: str, value: Union[str, int, float, bool]):
+        super().__init__(field=field, value=value)
+
+
+class In(Filter):
+    field: str
+    values: List[Union[str, int, float, bool]]
+
+    def __init__(self, field: str, values: List[Union[str, int, float, bool]]):
+        super().__init__(field=field, values=list(values))
+
+
+class Range(Filter):
+    field: str
+    gt: Union[int, float, None] = None
+    gte: Union[int, float, None] = None
+    lt: Union[int, float, None] = None
+    lte: Union[int, float, None] = None
+
+    def __init__(self, field: str, gt: Union[int, float] = None, gte: Union[int, float] = None, lt: Union[int, float] = None, lte: Union[int, float] = None):
+        if gt is None and gte is None and lt is None and lte is None:
+            raise ValueError("Range requires at least one bound (gt, gte, lt or lte)")
+        super().__init__(field=field, gt=gt, gte=gte, lt=lt, lte=lte)
+
+    def bounds(self) -> dict:
+        return {name: value for name, value in (("gt", self.gt), ("gte", self.gte), ("lt", self.lt), ("lte", self.lte)) if value is not None}
+
+
+class And(Filter):
+    filters: List[Filter]
+
+    def __and__(self, other: Filter) -> "And":
+        return And(filters=self.filters + [other])
+
+
+class Or(Filter):
+    filters: List[Filter]
+
+    def __or__(self, other: Filter) -> "Or":
+        return Or(filters=self.filters + [other])
+
+
+def filter_fields(document_metadata: dict, output_metadata: dict) -> dict:
+    """
+    Returns the filterable fields of the metadata dicts, flattened as {"document_metadata.page_number": 3, ...}.
+    The vector stores write them next to the vector so they can be filtered server-side.
+    """
+    fields = {}
+    for name, metadata in zip(METADATA_FIELDS, (document_metadata, output_metadata)):
+        for key, value in (metadata or {}).items():
+            if isinstance(value, (str, int, float, bool)) or (isinstance(value, list) and value and all(isinstance(item, str) for item in value)):
+                fields[f"{name}.{key}"] = value
+    return fields
+
+
+def to_pinecone(filter: Filter) -> dict:
+    """
+    Translates a filter to a Pinecone metadata filter.
+    The metadata fields are flattened keys of the Pinecone metadata (see filter_fields).
+    """
+    if isinstance(filter, Eq):
+        return {filter.field: {"$eq": filter.value}}
+    if isinstance(filter, In):
+        return {filter.field: {"$in": filter.values}}
+    if isinstance(filter, Range):
+        return {filter.field: {f"${name}": value for name, value in filter.bounds().items()}}
+    if isinstance(filter, And):
+        return {"$and": [to_pinecone(f) for f in filter.filters]}
+    if isinstance(filter, Or):
+        return {"$or": [to_pinecone(f) for f in filter.filters]}
+    raise ValueError(f"unsupported filter {type(filter).__name__}")
+
+
+def opensearch_field(field: str) -> str:
+    # the metadata fields are indexed under the filter_fields object (see filter_fields)
+    if field.split(".", 1)[0] in METADATA_FIELDS:
+        return f"filter_fields.{field}"
+    return field
+
+
+def filter_field_names(filter: Filter) -> Set[str]:
+    """
+    Returns the fields of a filter expression.
+    """
+    if isinstance(filter, (And, Or)):
+        return set().union(*(filter_field_names(f) for f in filter.filters))
+    return {filter.field}
+
+
+def to_opensearch(filter: Filter, keyword_fields: Collection[str] = ()) -> dict:
+    """
+    Translates a filter to an OpenSearch query DSL filter (used as the knn filter, or in a bool filter clause).
+    keyword_fields are the OpenSearch fields mapped as text (eg. by the dynamic mapping of an index without the
+    filter_fields keyword template), their Eq / In filters on strings use the <field>.keyword sub-field.
+    """
+    def term_field(field: str, values: list) -> str:
+        field = opensearch_field(field)
+        return f"{field}.keyword" if field in keyword_fields and all(isinstance(value, str) for value in values) else field
+
+    if isinstance(filter, Eq):
+        return {"term": {term_field(filter.field, [filter.value]): filter.value}}
+    if isinstance(filter, In):
+        return {"terms": {term_field(filter.field, filter.values): filter.values}}
+    if isinstance(filter, Range):
+        return {"range": {opensearch_field(filter.field): filter.bounds()}}
+    if isinstance(filter, And):
+        return {"bool": {"filter": [to_opensearch(f, keyword_fields) for f in filter.filters]}}
+    if isinstance(filter, Or):
+        return {"bool": {"should": [to_opensearch(f, keyword_fields) for f in filter.filters], "minimum_should_match": 1}}
+    raise ValueError(f"unsupported filter {type(filter).__name__}")
+
+
+def matches(filter: Filter, fields: dict) -> bool:
+    """
+    Evaluates a filter in python on the fields of a vector (top level fields and flattened metadata, see filter_fields).
+    """
+    if isinstance(filter, Eq):
+        value = fields.get(filter.field)
+        return filter.value in value if isinstance(value, list) else value == filter.value
+    if isinstance(filter, In):
+        value = fields.get(filter.field)
+        return any(item in filter.values for item in value) if isinstance(value, list) else value in filter.values
+    if isinstance(filter, Range):
+        value = fields.get(filter.field)
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return False
+        return all((
+            filter.gt is None or value > filter.gt,
+            filter.gte is None or value >= filter.gte,
+            filter.lt is None or value < filter.lt,
+            filter.lte is None or value <= filter.lte
+        ))
+    if isinstance(filter, And):
+        return all(matches(f, fields) for f in filter.filters)
+    if isinstance(filter, Or):
+        return any(matches(f, fields) for f in filter.filters)
+    raise ValueError(f"unsupported filter {type(filter).__name__}")
@@ -0,0 +1,41 @@
+"""
+Fingerprints
+
+Content hashes and deterministic ids of the documents and chunks.
+The loaders and the chunkers derive the ids from the source, the position and the content instead of uuid4,
+so loading the same file twice gives the same ids and a modified chunk gets a new id (see document_instance.ingest).
+"""
+import hashlib
+from typing import Union
+
+
+def content_hash(content: Union[str, bytes, None]) -> str:
+    """
+    Returns the sha256 hex digest of a text or of bytes.
+    """
+    if content is None:
+        content = b""
+    return hashlib.sha256(content.encode('utf-8') if isinstance(content, str) else content).hexdigest()
+
+
+def file_hash(path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Returns the sha256 hex digest of the bytes of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stable_id(*parts: Union[str, bytes, int, None]) -> str:
+    """
+    Returns a deterministic id (32 hex characters, like uuid4().hex) derived from the parts,
+    eg. stable_id(source, page_number, content).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
@@ -0,0 +1,156 @@
+"""
+Hybrid search
+
+Lexical (BM25) retrieval and rank fusion, to combine a keyword search with the k-NN search.
+Exact terms (tickers, part numbers, ids) are matched by the lexical search even when their embeddings are not close
+to the query, so the fused ranking surfaces them with a small top_k.
+
+- BM25Index: in-memory inverted index over the chunks text (TextChunk.chunk / Vector.content).
+- reciprocal_rank_fusion: score = sum of weight / (rrf_k + rank) over the rankings, only the ranks are used.
+- weighted_score_fusion: score = sum of weight * min-max normalized score over the rankings.
+"""
+from ntropy_ai.core.utils.base_format import TextChunk
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+import math
+import re
+
+
+# words, and compound tokens such as part numbers (xj-200-b) or tickers (brk.b)
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits a text in tokens, the compound tokens are kept whole and also split in their parts.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./]", token) if part)
+    return tokens
+
+
+class BM25Index():
+    """
+    In-memory BM25 inverted index.
+
+    usage:
+    - index = BM25Index.from_chunks(chunks)
+    - index.search("AAPL guidance", top_k=10) -> [(chunk id, score), ...]
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {} # term -> {document id -> term frequency}
+        self.lengths = {} # document id -> number of tokens
+        self.terms = {} # document id -> indexed terms, to remove a document without scanning the postings
+        self.total_length = 0
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[TextChunk], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        for chunk in chunks:
+            index.add(chunk.id, chunk.chunk)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self.lengths
+
+    def add(self, document_id: str, text: str):
+        """
+        Indexes a text, an already indexed document id is replaced.
+        """
+        if document_id in self.lengths:
+            self.remove(document_id)
+        frequencies = Counter(tokenize(text or ""))
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[document_id] = frequency
+        length = sum(frequencies.values())
+        self.terms[document_id] = list(frequencies)
+        self.lengths[document_id] = length
+        self.total_length += length
+
+    def remove(self, document_id: str):
+        length = self.lengths.pop(document_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(document_id):
+            del self.postings[term][document_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns the top_k (document id, BM25 score) pairs, best first.
+        """
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for document_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[document_id] / average_length)
+                scores[document_id] = scores.get(document_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], weights: Sequence[float] = None, rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses rankings (lists of ids, best first) with reciprocal rank fusion.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): The rankings to fuse.
+        weights (Sequence[float], optional): The weight of each ranking. Defaults to 1.
+        rrf_k (int, optional): The rank constant, higher values flatten the contribution of the top ranks. Defaults to 60.
+
+    Returns:
+        List[Tuple[str, float]]: The (id, fused score) pairs, best first.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, document_id in enumerate(ranking, start=1):
+            scores[document_id] = scores.get(document_id, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_score_fusion(results: Sequence[Sequence[Tuple[str, float]]], weights: Sequence[float] = None) -> List[Tuple[str, float]]:
+    """
+    Fuses scored results ((id, score) lists, higher is better) with a weighted sum of the min-max normalized scores.
+
+    Returns:
+        List[Tuple[str, float]]: The (id, fused score) pairs, best first.
+    """
+    weights = weights or [1.0] * len(results)
+    scores: Dict[str, float] = {}
+    for result, weight in zip(results, weights):
+        if not result:
+            continue
+        values = [score for _, score in result]
+        low, high = min(values), max(values)
+        for document_id, score in result:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            scores[document_id] = scores.get(document_id, 0.0) + weight * normalized
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse(vector_results: Sequence[Tuple[str, float]], lexical_results: Sequence[Tuple[str, float]], fusion: str = "rrf", weights: Sequence[float] = (1.0, 1.0), rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses the k-NN and the lexical results ((id, score) lists, best first, higher is better) with rrf or weighted fusion.
+    """
+    if fusion == "rrf":
+        return reciprocal_rank_fusion([[document_id for document_id, _ in vector_results], [document_id for document_id, _ in lexical_results]], weights, rrf_k)
+    if fusion == "weighted":
+        return weighted_score_fusion([vector_results, lexical_results], weights)
+    raise ValueError("fusion must be rrf or weighted")
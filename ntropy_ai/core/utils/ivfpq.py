@@ -0,0 +1,380 @@
+"""
+IVF-PQ index
+
+Compressed index for embedding sets that do not fit in memory as float32:
+- IVF: a k-means coarse quantizer splits the vectors in n_lists inverted lists, a query only scans the nprobe closest lists.
+- PQ: the residual of each vector (vector - its list centroid) is split in m sub-vectors, each one is replaced by the
+  id of its closest centroid in a 256 entries codebook, so a vector is stored in m bytes (eg. 64 bytes instead of 4096
+  for a 1024 dimension float32 Titan embedding).
+- ADC (asymmetric distance computation): the query is not quantized, the distances between the query sub-vectors and
+  the codebooks are computed once per list, the distance to a stored vector is then the sum of m table lookups.
+- re-ranking: the top candidates can be re-scored with the exact vectors (kept in memory or in a memory-mapped file).
+- the inverted lists are growable buffers (their capacity doubles), so adding a batch does not copy the lists.
+- with vectors_path, the rows (ids, contents, metadata and exact vectors) are appended to a VectorFile instead of
+  python lists, so the memory used by the index is the codes, the positions and the quantizers.
+
+usage:
+- index = IVFPQIndex(dimension=1024, n_lists=1024, m=64, keep_vectors=True, vectors_path="./ivfpq_rows")
+- index.train(sample_vectors)
+- index.add_vectors(vectors) # List[Vector] from OpenAIEmbeddings / AWSEmbeddings, or a VectorBatch
+- index.query(query_vector=vector, top_k=5, nprobe=16, rerank=100)
+- index.memory_usage()
+"""
+from ntropy_ai.core.utils.settings import logger
+from ntropy_ai.core.utils.base_format import Vector, VectorBatch
+from ntropy_ai.core.utils.vector_file import VectorFile
+from typing import List, Union
+import numpy as np
+import json
+import sys
+import os
+
+
+METRICS = ("cosine", "dot", "l2")
+MIN_LIST_CAPACITY = 16
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = None, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Lloyd k-means, the assignments are computed by chunks so the distance matrix stays small.
+
+    Args:
+        vectors (np.ndarray): The (n, d) float32 training vectors.
+        k (int): The number of centroids.
+        iterations (int, optional): The number of iterations. Defaults to 20.
+        seed (int, optional): The random seed.
+
+    Returns:
+        np.ndarray: The (k, d) centroids.
+    """
+    if len(vectors) < k:
+        raise ValueError(f"at least {k} training vectors are required, got {len(vectors)}")
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids, chunk_size)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # the empty clusters are re-seeded with random training vectors
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Returns the index of the closest centroid (l2) of each vector.
+    """
+    centroids_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        # argmin |x - c|^2 = argmin |c|^2 - 2 x.c
+        assignments[start:start + chunk_size] = np.argmin(centroids_norms[None, :] - 2 * chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFPQIndex():
+    """
+    Inverted file index with product quantization, see the module docstring.
+    """
+    def __init__(self,
+                 dimension: int,
+                 n_lists: int = 1024,
+                 m: int = 64,
+                 n_bits: int = 8,
+                 metric: str = "cosine",
+                 nprobe: int = 16,
+                 keep_vectors: bool = False,
+                 vectors_path: str = None,
+                 seed: int = None):
+        """
+        Args:
+            dimension (int): The vectors dimension.
+            n_lists (int, optional): The number of inverted lists (coarse centroids). Defaults to 1024.
+            m (int, optional): The number of sub-vectors (bytes per code), must divide the dimension. Defaults to 64.
+            n_bits (int, optional): The bits per sub-vector code (at most 8). Defaults to 8.
+            metric (str, optional): cosine, dot or l2. Defaults to cosine.
+            nprobe (int, optional): The number of lists scanned per query. Defaults to 16.
+            keep_vectors (bool, optional): Keep the exact vectors for re-ranking. Defaults to False.
+            vectors_path (str, optional): VectorFile directory where the rows (ids, contents, metadata and exact vectors)
+                are appended (memory-mapped), instead of the memory. The exact vectors are then kept (keep_vectors=True).
+            seed (int, optional): The k-means seed.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        if dimension % m != 0:
+            raise ValueError(f"m ({m}) must divide the dimension ({dimension})")
+        if not 1 <= n_bits <= 8:
+            raise ValueError("n_bits must be between 1 and 8")
+        self.dimension = dimension
+        self.n_lists = n_lists
+        self.m = m
+        self.ks = 2 ** n_bits
+        self.sub_dimension = dimension // m
+        self.metric = metric
+        self.nprobe = nprobe
+        self.keep_vectors = keep_vectors or bool(vectors_path)
+        self.vectors_path = vectors_path
+        self.seed = seed
+        self.centroids = None # (n_lists, dimension)
+        self.codebooks = None # (m, ks, sub_dimension)
+        # the lists are over-allocated, list_sizes are their used rows
+        self.list_codes = [np.empty((0, m), dtype=np.uint8) for _ in range(n_lists)]
+        self.list_positions = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self.list_sizes = np.zeros(n_lists, dtype=np.int64)
+        self.count = 0
+        self.vectors = np.empty((0, dimension), dtype=np.float32) if keep_vectors and not vectors_path else None
+        self.rows_file = None
+        if vectors_path:
+            if os.path.exists(os.path.join(vectors_path, "header.json")):
+                raise ValueError(f"{vectors_path} already exists, the rows vector file must be new")
+            self.rows_file = VectorFile.open(vectors_path, mode="a", dimension=dimension, metric=metric)
+        # the rows of an in-memory index
+        self.ids = []
+        self.document_ids = []
+        self.data_types = []
+        self.contents = []
+        self.document_metadata = []
+        self.output_metadata = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.metric == "cosine":
+            # on unit vectors |x - q|^2 = 2 - 2 cos(x, q), so the cosine index is an l2 index on normalized vectors
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), np.finfo(np.float32).tiny)
+        return vectors
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        # (n, dimension) -> (m, n, sub_dimension)
+        return vectors.reshape(len(vectors), self.m, self.sub_dimension).transpose(1, 0, 2)
+
+    def train(self, vectors: Union[np.ndarray, List[Vector], VectorBatch], iterations: int = 20):
+        """
+        Trains the coarse quantizer and the PQ codebooks on a sample of the vectors.
+
+        Args:
+            vectors: The training sample, at least n_lists and 2 ** n_bits vectors (a few tens of vectors per list is better).
+            iterations (int, optional): The k-means iterations. Defaults to 20.
+        """
+        vectors = self._prepare(self._to_matrix(vectors))
+        self.centroids = kmeans(vectors, self.n_lists, iterations, seed=self.seed)
+        residuals = self._split(vectors - self.centroids[assign(vectors, self.centroids)])
+        self.codebooks = np.stack([kmeans(np.ascontiguousarray(sub_vectors), self.ks, iterations, seed=self.seed) for sub_vectors in residuals])
+        logger.info(f"IVF-PQ index trained on {len(vectors)} vectors ({self.n_lists} lists, {self.m} x {self.ks} codebooks)")
+
+    def encode(self, residuals: np.ndarray) -> np.ndarray:
+        """
+        Returns the (n, m) uint8 PQ codes of residual vectors.
+        """
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j, sub_vectors in enumerate(self._split(residuals)):
+            codes[:, j] = assign(np.ascontiguousarray(sub_vectors), self.codebooks[j])
+        return codes
+
+    @staticmethod
+    def _to_matrix(vectors) -> np.ndarray:
+        if isinstance(vectors, VectorBatch):
+            return vectors.vectors
+        if isinstance(vectors, list):
+            return VectorBatch.from_vectors(vectors).vectors
+        return np.asarray(vectors, dtype=np.float32)
+
+    @staticmethod
+    def _grow(buffer: np.ndarray, size: int, needed: int) -> np.ndarray:
+        # doubles the capacity, so n appends copy O(n) rows in total
+        if needed <= len(buffer):
+            return buffer
+        grown = np.empty((max(needed, 2 * len(buffer), MIN_LIST_CAPACITY),) + buffer.shape[1:], dtype=buffer.dtype)
+        grown[:size] = buffer[:size]
+        return grown
+
+    def _append_to_list(self, list_id: int, codes: np.ndarray, positions: np.ndarray):
+        size = int(self.list_sizes[list_id])
+        end = size + len(codes)
+        self.list_codes[list_id] = self._grow(self.list_codes[list_id], size, end)
+        self.list_positions[list_id] = self._grow(self.list_positions[list_id], size, end)
+        self.list_codes[list_id][size:end] = codes
+        self.list_positions[list_id][size:end] = positions
+        self.list_sizes[list_id] = end
+
+    def _append_rows(self, batch: VectorBatch, prepared: np.ndarray):
+        if self.rows_file is not None:
+            # the prepared (normalized for cosine) vectors are stored, they are the re-ranking vectors.
+            # replace=False: the rows are appended as they are, their position is their row in the file
+            self.rows_file.append(batch.model_copy(update={"vectors": prepared}), replace=False)
+            return
+        if self.keep_vectors:
+            self.vectors = self._grow(self.vectors, self.count, self.count + len(batch))
+            self.vectors[self.count:self.count + len(batch)] = prepared
+        self.ids.extend(batch.ids)
+        self.document_ids.extend(batch.document_ids)
+        self.data_types.extend(batch.data_types)
+        self.contents.extend(batch.contents)
+        self.document_metadata.extend(batch.document_metadata)
+        self.output_metadata.extend(batch.output_metadata)
+
+    def _exact_vectors(self, positions: np.ndarray) -> np.ndarray:
+        if self.rows_file is not None:
+            # the pages are loaded by the OS on access, only the re-ranked rows are read
+            return np.asarray(self.rows_file.matrix[positions])
+        return self.vectors[positions]
+
+    def _row(self, position: int, score: float) -> Vector:
+        if self.rows_file is not None:
+            return self.rows_file.get(position, score=score, include_values=False)
+        return Vector(
+            id=self.ids[position],
+            document_id=self.document_ids[position],
+            score=score,
+            vector=[],
+            size=0,
+            data_type=self.data_types[position],
+            content=self.contents[position],
+            document_metadata=self.document_metadata[position],
+            output_metadata=self.output_metadata[position]
+        )
+
+    def add_vectors(self, vectors: Union[List[Vector], VectorBatch]):
+        """
+        Encodes and adds vectors (eg. the output of OpenAIEmbeddings / AWSEmbeddings) to the index.
+        """
+        if not self.is_trained:
+            raise Exception("the index is not trained, call train() with a sample of the vectors first !")
+        batch = vectors if isinstance(vectors, VectorBatch) else VectorBatch.from_vectors(vectors)
+        if len(batch) == 0:
+            return
+        if batch.dimension != self.dimension:
+            raise ValueError(f"vectors dimension {batch.dimension} does not match the index dimension {self.dimension}")
+        prepared = self._prepare(batch.vectors)
+        lists = assign(prepared, self.centroids)
+        codes = self.encode(prepared - self.centroids[lists])
+        positions = np.arange(len(self), len(self) + len(batch))
+        # one append per list touched by the batch
+        order = np.argsort(lists, kind='stable')
+        touched, starts = np.unique(lists[order], return_index=True)
+        for list_id, rows in zip(touched.tolist(), np.split(order, starts[1:])):
+            self._append_to_list(list_id, codes[rows], positions[rows])
+        self._append_rows(batch, prepared)
+        self.count += len(batch)
+
+    def _search(self, query: np.ndarray, top_k: int, nprobe: int, rerank: int):
+        """
+        Returns the positions and the distances (lower is closer: squared l2, or -dot) of the top_k vectors.
+        """
+        centroid_products = self.centroids @ query
+        if self.metric == "dot":
+            probed = np.argsort(-centroid_products)[:nprobe]
+            # q.x ~ q.c + q.r, the query / codebooks products do not depend on the list
+            table = -np.einsum('jkd,jd->jk', self.codebooks, query.reshape(self.m, self.sub_dimension))
+        else:
+            probed = np.argsort(np.einsum('ij,ij->i', self.centroids, self.centroids) - 2 * centroid_products)[:nprobe]
+            codebooks_norms = np.einsum('jkd,jkd->jk', self.codebooks, self.codebooks)
+        offsets = np.arange(self.m) * self.ks
+        positions, distances = [], []
+        for list_id in probed.tolist():
+            size = int(self.list_sizes[list_id])
+            if size == 0:
+                continue
+            codes = self.list_codes[list_id][:size]
+            if self.metric == "dot":
+                list_table, base = table, -float(centroid_products[list_id])
+            else:
+                # |r - C_jk|^2 for each sub-vector j of the query residual r and each codeword k
+                residual = (query - self.centroids[list_id]).reshape(self.m, self.sub_dimension)
+                list_table = codebooks_norms - 2 * np.einsum('jkd,jd->jk', self.codebooks, residual) + np.einsum('jd,jd->j', residual, residual)[:, None]
+                base = 0.0
+            # ADC: m table lookups per stored vector
+            distances.append(base + list_table.ravel()[codes.astype(np.int64) + offsets].sum(axis=1))
+            positions.append(self.list_positions[list_id][:size])
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions, distances = np.concatenate(positions), np.concatenate(distances)
+
+        candidates = min(max(rerank, top_k), len(positions))
+        best = np.argpartition(distances, candidates - 1)[:candidates] if candidates < len(positions) else np.arange(len(positions))
+        positions, distances = positions[best], distances[best]
+        if rerank and self.keep_vectors:
+            # sorted positions, so a memory-mapped file is read forward
+            positions = np.sort(positions)
+            exact = self._exact_vectors(positions)
+            products = exact @ query
+            distances = -products if self.metric == "dot" else np.einsum('ij,ij->i', exact, exact) - 2 * products + query @ query
+        order = np.argsort(distances, kind='stable')[:top_k]
+        return positions[order], distances[order]
+
+    def query(self,
+              query_vector: Union[List[float], Vector],
+              top_k: int = 5,
+              nprobe: int = None,
+              rerank: int = 0) -> List[Vector]:
+        """
+        Approximate top_k search.
+
+        Args:
+            query_vector (List[float] | Vector): The query embeddings.
+            top_k (int, optional): The number of results. Defaults to 5.
+            nprobe (int, optional): The number of lists scanned. Defaults to the index nprobe.
+            rerank (int, optional): The number of ADC candidates re-scored with the exact vectors (needs keep_vectors). Defaults to 0 (no re-ranking).
+
+        Returns:
+            List[Vector]: The results (without values), the score is the cosine similarity, the dot product or the euclidean distance.
+        """
+        if not self.is_trained or len(self) == 0:
+            return []
+        query = query_vector.to_numpy() if isinstance(query_vector, Vector) else np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != self.dimension:
+            raise ValueError(f"query_vector shape does not match the index dimension (which is {self.dimension})")
+        if rerank and not self.keep_vectors:
+            logger.warning("rerank requires keep_vectors=True, the ADC scores are returned")
+        positions, distances = self._search(self._prepare(query), top_k, nprobe or self.nprobe, rerank)
+        if self.metric == "cosine":
+            scores = 1 - distances / 2
+        elif self.metric == "dot":
+            scores = -distances
+        else:
+            scores = np.sqrt(np.maximum(distances, 0))
+        return [self._row(position, score) for position, score in zip(positions.tolist(), scores.tolist())]
+
+    def _metadata_bytes(self) -> int:
+        # estimate of the python objects of the rows: the strings, the lists, and the JSON size of the metadata dicts
+        if self.rows_file is not None:
+            return 0
+        columns = (self.ids, self.document_ids, self.data_types, self.contents)
+        size = sum(sys.getsizeof(column) for column in columns + (self.document_metadata, self.output_metadata))
+        size += sum(sys.getsizeof(value) for column in columns for value in column if value is not None)
+        size += sum(len(json.dumps(metadata, default=str)) for column in (self.document_metadata, self.output_metadata) for metadata in column)
+        return size
+
+    def memory_usage(self) -> dict:
+        """
+        Returns the memory footprint of the index in bytes, the allocated list buffers included.
+        The metadata (ids, contents and metadata of the rows) is an estimate, it is 0 when the rows are memory-mapped from vectors_path.
+        """
+        codes = sum(codes.nbytes for codes in self.list_codes)
+        positions = sum(positions.nbytes for positions in self.list_positions)
+        quantizers = (self.centroids.nbytes + self.codebooks.nbytes) if self.is_trained else 0
+        exact = self.vectors.nbytes if self.vectors is not None else 0
+        metadata = self._metadata_bytes()
+        count = max(len(self), 1)
+        return {
+            'vectors': len(self),
+            'code_bytes_per_vector': self.m,
+            'bytes_per_vector': (codes + positions) / count,
+            'raw_bytes_per_vector': self.dimension * 4,
+            'compression_ratio': self.dimension * 4 / self.m,
+            'quantizers_bytes': quantizers,
+            'exact_vectors_bytes': exact, # 0 when the exact vectors are memory-mapped from vectors_path
+            'metadata_bytes': metadata,
+            'total_bytes': codes + positions + quantizers + exact + metadata
+        }
@@ -0,0 +1,141 @@
+"""
+Vector stores migration
+
+Streams every vector of a store into another store (Pinecone, OpenSearchServerless, LocalVectorStore, VectorFile),
+one batch at a time so the memory stays bounded, optionally re-embedding the contents with another model on the way.
+
+The source stores stream their vectors with iter_vectors, which yields each batch with a cursor
+(Pinecone: list pagination token, OpenSearch: search_after value, local stores: next row).
+The cursor is checkpointed in a JSON file once the batch is written, so an interrupted copy resumes after the last written batch.
+A crash between the write and the checkpoint writes the batch again on resume: the ids of the first batch of a resumed copy
+are deleted from the target before it is written (OpenSearch generates the _id of each document, adding them again would duplicate them).
+A batch the target could not fully write stops the copy before its cursor, so running it again retries the batch,
+unless skip_failed=True (the failed vectors are then counted in failed and not copied).
+
+usage:
+- migrate(pinecone_store, opensearch_store, source_kwargs={"namespace": "docs"}, target_kwargs={"index": "docs"}, checkpoint="migration.json")
+- migrate(opensearch_store, local_store, model="amazon.titan-embed-text-v2:0", model_settings={"dimensions": 512})
+"""
+from ntropy_ai.core.utils.base_format import Document, TextChunk, Vector
+from ntropy_ai.core.utils import failed_writes
+from ntropy_ai.core.utils.settings import logger
+from typing import Callable, List, Union
+import json
+import os
+
+
+def load_checkpoint(path: str) -> Union[dict, None]:
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # written to a temporary file then renamed, an interrupted write does not lose the previous checkpoint
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def reembed(vectors: List[Vector], model: str, model_settings: dict = None, batch_size: int = 32) -> List[Vector]:
+    """
+    Embeds the contents of the vectors again with another model, the ids, contents and document metadata are kept.
+    """
+    from ntropy_ai.core.providers import embed_many
+    documents = [
+        Document(id=v.document_id, image=v.content, page_number=v.document_metadata.get("page_number"), metadata=v.document_metadata) if v.data_type == "image"
+        else TextChunk(id=v.document_id, chunk=v.content or "", chunk_number=v.output_metadata.get("chunk") or 0, document_id=v.document_id, metadata=v.document_metadata)
+        for v in vectors
+    ]
+    embedded = embed_many(model, documents, model_settings, batch_size=batch_size)
+    return [
+        Vector(
+            id=v.id,
+            document_id=v.document_id,
+            vector=new.vector,
+            size=new.size,
+            data_type=v.data_type,
+            content=v.content,
+            document_metadata=v.document_metadata,
+            output_metadata=new.output_metadata or getattr(new, "metadata", {}) or {}
+        )
+        for v, new in zip(vectors, embedded)
+    ]
+
+
+def migrate(source,
+            target,
+            source_kwargs: dict = None,
+            target_kwargs: dict = None,
+            batch_size: int = 100,
+            checkpoint: str = None,
+            model: str = None,
+            model_settings: dict = None,
+            progress: Callable[[int], None] = None,
+            skip_failed: bool = False) -> dict:
+    """
+    Copies every vector of a store into another store.
+
+    Args:
+        source: The store to read (Pinecone, OpenSearchServerless, LocalVectorStore or VectorFile).
+        target: The store to write (Pinecone, OpenSearchServerless, LocalVectorStore or VectorFile opened in "a" mode).
+        source_kwargs (dict, optional): The namespace (Pinecone, local store) or index (OpenSearch) of the source.
+        target_kwargs (dict, optional): The namespace or index of the target.
+        batch_size (int, optional): The number of vectors read and written at a time. Defaults to 100.
+        checkpoint (str, optional): The path of the checkpoint file, the copy resumes from it if it exists. Defaults to None.
+        model (str, optional): Re-embeds the contents with this embeddings model. Defaults to None (the values are copied).
+        model_settings (dict, optional): The settings of the embeddings model.
+        progress (Callable[[int], None], optional): Called with the number of copied vectors after each batch.
+        skip_failed (bool, optional): Continues after a batch the target could not fully write, its failed vectors are not copied.
+            Defaults to False: the copy stops before the batch (done is False) and the next run retries it.
+
+    Returns:
+        dict: copied (written vectors), failed (vectors the target could not write), batches and done.
+    """
+    source_kwargs = source_kwargs or {}
+    target_kwargs = target_kwargs or {}
+    state = load_checkpoint(checkpoint) or {"cursor": None, "copied": 0, "failed": 0, "batches": 0, "done": False, "retry": False}
+    if state["done"]:
+        logger.info(f"migration already done according to {checkpoint}")
+        return state
+    # the first batch after a checkpoint may have been written before the copy was interrupted, or partially written
+    resumed = state["batches"] > 0 or state.get("retry", False)
+    if resumed:
+        logger.info(f"resuming the migration after {state['copied']} vectors")
+    write = target.add_vectors if hasattr(target, "add_vectors") else target.append
+
+    for vectors, cursor in source.iter_vectors(batch_size=batch_size, cursor=state["cursor"], **source_kwargs):
+        if vectors:
+            if model:
+                vectors = reembed(vectors, model, model_settings)
+            if resumed and hasattr(target, "delete"):
+                target.delete([v.id for v in vectors], **target_kwargs)
+            resumed = False
+            failed = failed_writes(write(vectors, **target_kwargs))
+            if failed and not skip_failed:
+                # the cursor is not advanced, the next run deletes the batch then writes it again
+                logger.error(f"{failed} of {len(vectors)} vectors of batch {state['batches']} could not be written to the target, "
+                             "the migration stops before this batch, run it again to retry it (skip_failed=True skips the failed vectors)")
+                state["retry"] = True
+                if checkpoint:
+                    save_checkpoint(checkpoint, state)
+                return {**state, "failed": state["failed"] + failed}
+            if failed:
+                logger.warning(f"{failed} of {len(vectors)} vectors of batch {state['batches']} could not be written to the target")
+            state["copied"] += len(vectors) - failed
+            state["failed"] += failed
+        state["retry"] = False
+        state["cursor"] = cursor
+        state["batches"] += 1
+        # a None cursor after a batch is the end of the source (resuming from None would start over)
+        state["done"] = cursor is None
+        if checkpoint:
+            save_checkpoint(checkpoint, state)
+        if progress is not None:
+            progress(state["copied"])
+
+    state["done"] = True
+    if checkpoint:
+        save_checkpoint(checkpoint, state)
+    return state
@@ -1,6 +1,7 @@
 
 from ntropy_ai.core.utils.base_format import Vector
 from ntropy_ai.core.utils import save_img_to_temp_file
+from ntropy_ai.core.utils.diversity import drop_duplicates, has_values, mmr
 from typing import List
 
 class RagPrompt():
@@ -9,8 +10,20 @@ class RagPrompt():
     Using this data: DOCUMENT_TEXTS and the images. Respond to this prompt: USER_QUERY
 
     access the prompt and images to pass the model with RagPrompt.images_list and RagPrompt.prompt
+
+    with diversify=True the context is re-ranked with MMR (when the vectors have their values) and its near-duplicates
+    are dropped, top_k limits the number of chunks in the prompt. higher_is_better=False when the scores of the
+    retriever are distances (eg. LocalVectorStore(metric="l2")).
+    eg. agent_prompt=functools.partial(RagPrompt, diversify=True, top_k=5)
     """
-    def __init__(self, query: str, context: List[Vector]):
+    def __init__(self, query: str, context: List[Vector], diversify: bool = False, top_k: int = None, lambda_mult: float = 0.5, duplicate_threshold: float = 0.95, higher_is_better: bool = True):
+        if diversify:
+            if has_values(context):
+                context = mmr(context, top_k=top_k, lambda_mult=lambda_mult, duplicate_threshold=duplicate_threshold, higher_is_better=higher_is_better)
+            else:
+                context = drop_duplicates(context, duplicate_threshold)[:top_k]
+        elif top_k is not None:
+            context = context[:top_k]
         self.doc_list = []
         self.images_list = []
         for doc in context:
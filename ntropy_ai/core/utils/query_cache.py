@@ -0,0 +1,281 @@
+"""
+Query cache
+
+Cache of the vector stores query results, in front of Pinecone.query and OpenSearchServerless.query.
+The key is a hash of the store scope (provider, index, namespace), the normalized query (text or vector),
+top_k, include_values, the filter and the embeddings model and settings, so a chat session re-running the same retrieval
+every turn gets its results from memory without embedding the query or calling the store.
+
+The entries expire after ttl seconds and are invalidated when add_vectors writes to their index / namespace:
+every scope has a generation number, bumped on write, and an entry is only valid for the generation it was read in.
+With a path, the entries and the generations are also stored in a SQLite database shared by the processes,
+the generations read from the database are kept in memory for generation_refresh seconds, so a write made by
+another process is seen after at most generation_refresh seconds (the writes of this process are seen immediately).
+The entries are kept in memory as Vector objects and a hit returns shallow copies (new Vector objects and metadata dicts,
+the values are shared), the callers can modify them. The database stores the results as JSON (Vector.model_dump).
+
+usage:
+- enable_query_cache(ttl=300)
+- ... store.query(query_text="...") ...
+- get_query_cache().stats()
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, Tuple, Union
+from ntropy_ai.core.utils.base_format import Vector
+
+
+DEFAULT_TTL = 300 # seconds
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_GENERATION_REFRESH = 1.0 # seconds
+
+
+class QueryCache():
+    """
+    In-memory LRU cache of the query results with a TTL, optionally backed by a shared SQLite database.
+    """
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, path: str = None, generation_refresh: float = DEFAULT_GENERATION_REFRESH):
+        """
+        Args:
+            ttl (float, optional): The lifetime of an entry in seconds. Defaults to 300.
+            max_entries (int, optional): The maximum number of entries kept in memory. Defaults to 1024.
+            path (str, optional): The path of a SQLite database shared by the processes. Defaults to None (memory only).
+            generation_refresh (float, optional): With a path, how long a generation read from the database is trusted. Defaults to 1 second.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.generation_refresh = generation_refresh
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict() # key -> (expires, scope, generation, results)
+        self.generations = {} # scope -> generation
+        self.generations_read = {} # scope -> time the generation was read from the database
+        self._lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, scope TEXT, generation INTEGER, expires REAL, payload BLOB)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS generations (scope TEXT PRIMARY KEY, generation INTEGER)")
+            self.db.commit()
+
+    @staticmethod
+    def make_scope(*parts: Any) -> str:
+        """
+        Builds the scope of an index / namespace, eg. make_scope("pinecone", index_name, namespace).
+        """
+        return json.dumps([part if part is not None else "" for part in parts])
+
+    @staticmethod
+    def make_key(scope: str, query: Union[str, List[float], Any], top_k: int, include_values: bool = False, filter: Any = None, model: str = None, model_settings: dict = None) -> str:
+        """
+        Builds the cache key of a query.
+
+        Args:
+            scope (str): The scope of the queried index / namespace.
+            query (str | List[float] | Vector): The query text (whitespace normalized) or the query vector (as float32).
+            top_k (int): The number of results.
+            include_values (bool, optional): Whether the results include the values.
+            filter (Filter, optional): The metadata filter.
+            model (str, optional): The embeddings model of a text query.
+            model_settings (dict, optional): The settings of the embeddings model (eg. the dimensions).
+
+        Returns:
+            str: The sha256 hex digest of the query.
+        """
+        key = hashlib.sha256()
+        key.update(json.dumps([scope, top_k, bool(include_values), repr(filter), model or "", model_settings or {}], sort_keys=True, default=str).encode('utf-8'))
+        key.update(b'\0')
+        if isinstance(query, str):
+            key.update(b'text:')
+            key.update(" ".join(query.split()).encode('utf-8'))
+        else:
+            import numpy as np
+            values = query.to_numpy() if hasattr(query, 'to_numpy') else query
+            key.update(b'vector:')
+            key.update(np.asarray(values, dtype=np.float32).tobytes())
+        return key.hexdigest()
+
+    @staticmethod
+    def _copy(results: Tuple[Vector, ...]) -> List[Vector]:
+        return [
+            v.model_copy(update={"document_metadata": dict(v.document_metadata), "output_metadata": dict(v.output_metadata)})
+            for v in results
+        ]
+
+    @staticmethod
+    def _dumps(results: Tuple[Vector, ...]) -> str:
+        return json.dumps([{**v.model_dump(exclude={"vector"}), "vector": v.to_list()} for v in results], default=str)
+
+    @staticmethod
+    def _loads(payload: str) -> Tuple[Vector, ...]:
+        return tuple(Vector.model_validate(fields) for fields in json.loads(payload))
+
+    def generation(self, scope: str) -> int:
+        """
+        Returns the current generation of a scope, read before running a query and passed to set().
+        """
+        with self._lock:
+            return self._generation(scope)
+
+    def _generation(self, scope: str) -> int:
+        if self.db is None:
+            return self.generations.get(scope, 0)
+        now = time.monotonic()
+        if scope in self.generations and now - self.generations_read[scope] < self.generation_refresh:
+            return self.generations[scope]
+        row = self.db.execute("SELECT generation FROM generations WHERE scope = ?", (scope,)).fetchone()
+        self.generations[scope] = row[0] if row else 0
+        self.generations_read[scope] = now
+        return self.generations[scope]
+
+    def get(self, key: str) -> Union[List, None]:
+        """
+        Returns the cached results, or None if the key is not in the cache, expired or invalidated.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, scope, generation, results = entry
+                if expires > now and generation == self._generation(scope):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self._copy(results)
+                del self.entries[key]
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT r.scope, r.generation, r.expires, r.payload FROM results r LEFT JOIN generations g ON g.scope = r.scope WHERE r.key = ? AND r.expires > ? AND r.generation = COALESCE(g.generation, 0)",
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    scope, generation, expires, payload = row
+                    try:
+                        results = self._loads(payload)
+                    except ValueError:
+                        # not a JSON payload (eg. written by a previous version), a miss
+                        results = None
+                    if results is not None:
+                        self._store(key, (expires, scope, generation, results))
+                        self.hits += 1
+                        return self._copy(results)
+            self.misses += 1
+            return None
+
+    def set(self, key: str, scope: str, results: List, generation: int):
+        """
+        Stores the results of a query read in the given generation of its scope.
+        The results are dropped if the scope was written to since (the results may not include the write).
+        """
+        expires = time.time() + self.ttl
+        # copied now, so the caller can modify the results it returns
+        results = tuple(self._copy(results))
+        payload = self._dumps(results) if self.db is not None else None
+        with self._lock:
+            if generation != self._generation(scope):
+                return
+            self._store(key, (expires, scope, generation, results))
+            if self.db is not None:
+                self.db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO results (key, scope, generation, expires, payload) VALUES (?, ?, ?, ?, ?)",
+                    (key, scope, generation, expires, payload)
+                )
+                self.db.commit()
+
+    def _store(self, key: str, entry: Tuple):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, scope: str):
+        """
+        Invalidates the entries of a scope, called after a write to its index / namespace.
+        """
+        with self._lock:
+            if self.db is None:
+                self.generations[scope] = self.generations.get(scope, 0) + 1
+            else:
+                # read again on the next lookup, after the increment below
+                self.generations.pop(scope, None)
+            for key in [key for key, entry in self.entries.items() if entry[1] == scope]:
+                del self.entries[key]
+            if self.db is not None:
+                self.db.execute("INSERT INTO generations (scope, generation) VALUES (?, 1) ON CONFLICT(scope) DO UPDATE SET generation = generation + 1", (scope,))
+                self.db.execute("DELETE FROM results WHERE scope = ?", (scope,))
+                self.db.commit()
+
+    def clear(self):
+        """
+        Removes all the cached results and resets the statistics.
+        """
+        with self._lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM results")
+                self.db.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the hit / miss statistics of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl
+        }
+
+    def close(self):
+        with self._lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+_query_cache = None
+
+def enable_query_cache(ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, path: str = None, generation_refresh: float = DEFAULT_GENERATION_REFRESH) -> QueryCache:
+    """
+    Enables the query results cache of Pinecone.query and OpenSearchServerless.query.
+
+    Args:
+        ttl (float, optional): The lifetime of an entry in seconds.
+        max_entries (int, optional): The maximum number of entries kept in memory.
+        path (str, optional): The path of a SQLite database to share the cache between processes.
+        generation_refresh (float, optional): With a path, the delay before the writes of the other processes invalidate the cache.
+
+    Returns:
+        QueryCache: The cache instance.
+    """
+    global _query_cache
+    if _query_cache is not None:
+        _query_cache.close()
+    _query_cache = QueryCache(ttl=ttl, max_entries=max_entries, path=path, generation_refresh=generation_refresh)
+    return _query_cache
+
+def disable_query_cache():
+    """
+    Disables the query results cache.
+    """
+    global _query_cache
+    if _query_cache is not None:
+        _query_cache.close()
+    _query_cache = None
+
+def get_query_cache() -> Union[QueryCache, None]:
+    """
+    Returns the enabled query cache, or None if the cache is disabled.
+    """
+    return _query_cache
@@ -1,4 +1,10 @@
 from ntropy_ai.core.utils.auth_format import *
+from pydantic import BaseModel, ConfigDict
+from typing import Any, Callable, Literal, Union
+from collections.abc import Mapping
+import importlib.util
+import threading
+import time
 import logging
 
 
@@ -15,103 +21,310 @@ logging.basicConfig(
 logger = logging.getLogger('ntropy_ai')
 
 
+# time (in seconds) before the dynamic providers entries (eg. the models served by the local Ollama service) are fetched again
+DYNAMIC_PROVIDERS_TTL = 60
 
-class ModelsBaseSettings():
-    def __init__(self):
-        self.providers_list_map = {}
-
-        try:
-            from ntropy_ai.core.providers import aws
-            self.providers_list_map["AWS"] = {
-                "auth": AWSAuth,
-                "connect": aws.AWSConnection,
-                "functions": {
-                    "embeddings": aws.AWSEmbeddings,
-                    "chat": aws.AWSBedrockModels.chat
-                },
-
-                "embeddings_models": {
-                    # input format map because each models has different input format
-                    "models_map": {
-                        "amazon.titan-embed-image-v1": aws.AWSEmbeddingModels.AmazonTitanMultimodalEmbeddingsG1Input,
-                        "amazon.titan-embed-text-v2:0": aws.AWSEmbeddingModels.AmazonTitanEmbedTextV2Input
-                    }
-                },
-                "models": {
-                    "anthropic.claude-3-haiku-20240307-v1:0": aws.AWSBedrockModelsSettings.AnthropicClaude3HaikuInput
-                },
-                'settings': {
-                    'default_s3_bucket': 'ntropy-test-2'
-                }
-            }
-        except ImportError:
-            pass
-
-        try:
-            from ntropy_ai.core.providers.openai import OpenAIConnection, OpenAIEmbeddings, OpenaiModel, OpenAIEmbeddingModels
-            self.providers_list_map["OpenAI"] = {
-                "auth": OpenAIAuth,
-                "connect": OpenAIConnection,
-                "functions": {
-                    "embeddings": OpenAIEmbeddings,
-                    "chat": OpenaiModel.chat
-                },
-                "embeddings_models": {
-                    "models_map": {
-                        'openai.clip-vit-base-patch32': OpenAIEmbeddingModels.OpenAIclipVIT32
-                    }
-                },
-                "models": {
-                    "gpt-4o": OpenaiModel,
-                    "gpt-4o-mini": OpenaiModel,
-                    "gpt-4-turbo": OpenaiModel,
-                    "gpt-4": OpenaiModel
-                }
-            }
-        except ImportError:
-            pass
 
+def _require(*modules: str):
+    """
+    Raises ImportError if one of the modules is not installed, without importing it.
 
-        try: 
-            from ntropy_ai.core.providers.pinecone import PineconeConnection
-            self.providers_list_map["Pinecone"] = {
-                "auth": PineconeAuth,
-                "connect": PineconeConnection,
-            }
-        except ImportError:
-            pass
-
-        # models providers
-        try:
-            from ntropy_ai.core.providers import ollama
-            self.providers_list_map['Ollama'] = {
-                'functions': {
-                    'generate': ollama.OllamaModel.generate,
-                    'chat': ollama.OllamaModel.chat,
-                    'sgenerate': ollama.OllamaModel.sgenerate,
-                    'schat': ollama.OllamaModel.schat,
-                },
-                'models': {
-                    model: model for model in ollama.list_models()
-                }
+    The providers modules import their heavy dependencies (torch, clip, boto3, opensearch-py...) on first use,
+    so the registry checks they are installed before declaring a provider available.
+    """
+    for module in modules:
+        if importlib.util.find_spec(module) is None:
+            raise ImportError(f"{module} is not installed.")
+
+
+def _load_aws():
+    _require("boto3", "botocore", "opensearchpy")
+    from ntropy_ai.core.providers import aws
+    return {
+        "auth": AWSAuth,
+        "connect": aws.AWSConnection,
+        "functions": {
+            "embeddings": aws.AWSEmbeddings,
+            "embeddings_batch": aws.AWSEmbeddingsBatch,
+            "chat": aws.AWSBedrockModels.chat,
+            "achat": aws.AWSBedrockModels.achat
+        },
+
+        "embeddings_models": {
+            # input format map because each models has different input format
+            "models_map": {
+                "amazon.titan-embed-image-v1": aws.AWSEmbeddingModels.AmazonTitanMultimodalEmbeddingsG1Input,
+                "amazon.titan-embed-text-v2:0": aws.AWSEmbeddingModels.AmazonTitanEmbedTextV2Input
             }
-        except Exception: # it can be ImportError or Httpx Ollama connection error (when the Ollama service is not started)
-            pass
-
-        try:
-            from ntropy_ai.core.providers import anthropic
-            self.providers_list_map['Anthropic'] = {
-                "auth": AnthropicAuth,
-                "connect": anthropic.AnthropicConnection,
-                'functions': {
-                    'chat': anthropic.AnthropicModel.chat
-                },
-                "models": {
-                    "claude-3-5-sonnet-20240620": anthropic.AnthropicModel,
-                    "claude-3-opus-20240229": anthropic.AnthropicModel,
-                    "claude-3-sonnet-202402290": anthropic.AnthropicModel,
-                    "claude-3-haiku-20240307": anthropic.AnthropicModel,
-                }
+        },
+        "models": {
+            "anthropic.claude-3-haiku-20240307-v1:0": aws.AWSBedrockModelsSettings.AnthropicClaude3HaikuInput
+        },
+        'settings': {
+            'default_s3_bucket': 'ntropy-test-2'
+        }
+    }
+
+
+def _load_openai():
+    _require("torch", "clip")
+    from ntropy_ai.core.providers.openai import OpenAIConnection, OpenAIEmbeddings, OpenAIEmbeddingsBatch, OpenaiModel, OpenAIEmbeddingModels
+    return {
+        "auth": OpenAIAuth,
+        "connect": OpenAIConnection,
+        "functions": {
+            "embeddings": OpenAIEmbeddings,
+            "embeddings_batch": OpenAIEmbeddingsBatch,
+            "chat": OpenaiModel.chat,
+            "achat": OpenaiModel.achat
+        },
+        "embeddings_models": {
+            "models_map": {
+                'openai.clip-vit-base-patch32': OpenAIEmbeddingModels.OpenAIclipVIT32
             }
-        except Exception:
-            pass
\ No newline at end of file
+        },
+        "models": {
+            "gpt-4o": OpenaiModel,
+            "gpt-4o-mini": OpenaiModel,
+            "gpt-4-turbo": OpenaiModel,
+            "gpt-4": OpenaiModel
+        }
+    }
+
+
+def _load_pinecone():
+    from ntropy_ai.core.providers.pinecone import PineconeConnection
+    return {
+        "auth": PineconeAuth,
+        "connect": PineconeConnection,
+    }
+
+
+# models providers
+def _load_ollama():
+    from ntropy_ai.core.providers import ollama
+    return {
+        'functions': {
+            'generate': ollama.OllamaModel.generate,
+            'chat': ollama.OllamaModel.chat,
+            'achat': ollama.OllamaModel.achat,
+            'sgenerate': ollama.OllamaModel.sgenerate,
+            'schat': ollama.OllamaModel.schat,
+        },
+        'models': {
+            model: model for model in ollama.list_models()
+        }
+    }
+
+
+def _load_anthropic():
+    from ntropy_ai.core.providers import anthropic
+    return {
+        "auth": AnthropicAuth,
+        "connect": anthropic.AnthropicConnection,
+        'functions': {
+            'chat': anthropic.AnthropicModel.chat,
+            'achat': anthropic.AnthropicModel.achat
+        },
+        "models": {
+            "claude-3-5-sonnet-20240620": anthropic.AnthropicModel,
+            "claude-3-opus-20240229": anthropic.AnthropicModel,
+            "claude-3-sonnet-202402290": anthropic.AnthropicModel,
+            "claude-3-haiku-20240307": anthropic.AnthropicModel,
+        }
+    }
+
+
+class ResolvedModel(BaseModel):
+    """
+    Entry of the model name index, returned by resolve_model(name).
+    """
+    name: str
+    provider: str
+    model_type: Literal['embeddings', 'chat']
+    model_class: Any = None # settings class of the model (eg. AWSEmbeddingModels.AmazonTitanEmbedTextV2Input)
+    embedding_func: Union[Callable, None] = None # only for embeddings models
+    batch_embedding_func: Union[Callable, None] = None # embeddings function taking a list of documents, if the provider has one
+    input_schema: Any = None # ModelInputSchema of the embeddings models
+    output_dimension: Union[int, None] = None # default embeddings size
+    model_config = ConfigDict(arbitrary_types_allowed=True, protected_namespaces=())
+
+
+def _index_provider(provider: str, settings: dict) -> dict:
+    """
+    Builds the model name -> ResolvedModel entries of a provider.
+    """
+    index = {}
+    for model_name, model_class in settings.get('models', {}).items():
+        index[model_name] = ResolvedModel(
+            name=model_name,
+            provider=provider,
+            model_type='chat',
+            model_class=model_class
+        )
+    if 'embeddings_models' in settings:
+        for model_name, model_class in settings['embeddings_models']['models_map'].items():
+            output_dimension = model_class.model_fields.get('output_dimension')
+            index[model_name] = ResolvedModel(
+                name=model_name,
+                provider=provider,
+                model_type='embeddings',
+                model_class=model_class,
+                embedding_func=settings['functions']['embeddings'],
+                batch_embedding_func=settings['functions'].get('embeddings_batch'),
+                input_schema=model_class.ModelInputSchema,
+                output_dimension=output_dimension.default if output_dimension else None
+            )
+    return index
+
+
+class ProvidersRegistry(Mapping):
+    """
+    Process-wide registry of the providers settings.
+
+    Each provider is resolved lazily the first time it is accessed and then kept for the lifetime of the process,
+    so looking up a model does not re-import the provider modules. Dynamic providers (eg. Ollama, whose models
+    are listed through its local HTTP service) are fetched again once their ttl has expired.
+    Use refresh() to force the providers to be resolved again.
+    """
+    _instance = None
+    _lock = threading.RLock()
+
+    # provider name -> (loader, ttl in seconds or None if the entry never expires)
+    # the loader raises ImportError when the optional dependencies of the provider are not installed
+    _loaders = {
+        "AWS": (_load_aws, None),
+        "OpenAI": (_load_openai, None),
+        "Pinecone": (_load_pinecone, None),
+        "Ollama": (_load_ollama, DYNAMIC_PROVIDERS_TTL),
+        "Anthropic": (_load_anthropic, None),
+    }
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ProvidersRegistry, cls).__new__(cls)
+                    cls._instance._entries = {}
+                    cls._instance._models_index = None
+        return cls._instance
+
+    def _resolve(self, provider: str):
+        """
+        Returns the settings of a provider, loading it if it was never resolved or if its entry has expired.
+
+        Args:
+            provider (str): The provider name.
+
+        Returns:
+            dict: The provider settings, or None if the provider is not available.
+        """
+        loader, ttl = self._loaders[provider]
+        entry = self._entries.get(provider)
+        if entry is not None and (ttl is None or time.monotonic() - entry[1] < ttl):
+            return entry[0]
+        with self._lock:
+            entry = self._entries.get(provider)
+            if entry is not None and (ttl is None or time.monotonic() - entry[1] < ttl):
+                return entry[0]
+            try:
+                settings = loader()
+            except Exception: # it can be ImportError or Httpx Ollama connection error (when the Ollama service is not started)
+                settings = None
+            # unavailable providers are cached too, so a missing dependency is not imported again on every lookup
+            self._entries[provider] = (settings, time.monotonic())
+            return settings
+
+    def refresh(self, provider: str = None):
+        """
+        Drops the cached providers settings, they will be resolved again on next access.
+
+        Args:
+            provider (str, optional): Only refresh this provider. Defaults to all the providers.
+        """
+        with self._lock:
+            if provider:
+                self._entries.pop(provider, None)
+            else:
+                self._entries.clear()
+            self._models_index = None
+
+    def _build_models_index(self) -> dict:
+        """
+        Builds the model name index of the static providers (the ones without ttl).
+        """
+        index = {}
+        for provider, (_, ttl) in self._loaders.items():
+            if ttl is None:
+                settings = self._resolve(provider)
+                if settings is not None:
+                    index.update(_index_provider(provider, settings))
+        self._models_index = index
+        return index
+
+    def resolve_model(self, name: str) -> ResolvedModel:
+        """
+        Finds the provider, embeddings function, input schema and output dimension of a model.
+
+        The static providers are indexed once, so a lookup is a dict hit. The dynamic providers
+        (eg. Ollama) are only checked when the model is not found in the index.
+
+        Args:
+            name (str): The model name.
+
+        Returns:
+            ResolvedModel: The model entry.
+        """
+        index = self._models_index
+        if index is None:
+            index = self._build_models_index()
+        resolved = index.get(name)
+        if resolved is not None:
+            return resolved
+        for provider, (_, ttl) in self._loaders.items():
+            if ttl is not None:
+                settings = self._resolve(provider)
+                if settings is not None:
+                    resolved = _index_provider(provider, settings).get(name)
+                    if resolved is not None:
+                        return resolved
+        raise ValueError(f"Model {name} not found in settings.")
+
+    def __getitem__(self, provider: str):
+        settings = self._resolve(provider) if provider in self._loaders else None
+        if settings is None:
+            raise KeyError(provider)
+        return settings
+
+    def __contains__(self, provider):
+        return provider in self._loaders and self._resolve(provider) is not None
+
+    def __iter__(self):
+        for provider in self._loaders:
+            if self._resolve(provider) is not None:
+                yield provider
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class ModelsBaseSettings():
+    def __init__(self):
+        # shared by every instance, the providers are only resolved once per process
+        self.providers_list_map = ProvidersRegistry()
+
+
+def resolve_model(name: str) -> ResolvedModel:
+    """
+    Resolves a model name to its provider, embeddings function, input schema and output dimension.
+
+    usage:
+    - resolve_model("amazon.titan-embed-text-v2:0").embedding_func
+
+    Args:
+        name (str): The model name.
+
+    Returns:
+        ResolvedModel: The model entry.
+    """
+    return ProvidersRegistry().resolve_model(name)
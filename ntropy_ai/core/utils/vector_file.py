@@ -0,0 +1,358 @@
+"""
+Vector file
+
+Persisted, append-friendly on-disk format for embeddings, read through memory maps: opening a multi-GB file does not read
+it, the pages are loaded by the OS on access, and every process mapping the same file shares the same pages of the OS cache.
+
+Layout of a vector file directory:
+- header.json: format version, dimension, dtype (float32 or float16), metric, number of rows and data directory.
+  It is written last (atomically) on every append, so a reader never sees a partially written row.
+- the data files below, in the vector file directory or, once compacted, in a versioned sub-directory (v1, v2...)
+  named by the header: compact() writes a new version then switches the header to it, which is atomic.
+- vectors.bin: the (rows, dimension) matrix, row-major, without header.
+- norms.bin: the float32 squared norms of the rows (cosine and l2 scores without a pass over the matrix).
+- deleted.bin: one byte per row, 1 for the deleted rows (tombstones, reclaimed by compact()).
+- ids.bin / ids.idx: the utf-8 ids, concatenated, and the uint64 end offset of each id.
+- metadata.jsonl / metadata.idx: one JSON line per row (document_id, data_type, content, document_metadata,
+  output_metadata) and the uint64 end offset of each line, so the metadata of a row is read without parsing the others.
+
+usage:
+- vector_file = VectorFile.open("./embeddings", mode="a", dimension=1024, dtype="float16")
+- vector_file.append(vectors) # List[Vector] or VectorBatch
+- VectorFile.open("./embeddings").query(query_vector=vector, top_k=5)
+"""
+from ntropy_ai.core.utils.base_format import Vector, VectorBatch
+from typing import Dict, Iterator, List, Tuple, Union
+import numpy as np
+import shutil
+import json
+import os
+
+
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16")
+METRICS = ("cosine", "dot", "l2")
+SCAN_CHUNK_SIZE = 65536 # rows scored per matrix product, bounds the float32 copy of float16 matrices
+DATA_FILES = ("vectors.bin", "norms.bin", "deleted.bin", "ids.bin", "ids.idx", "metadata.jsonl", "metadata.idx")
+
+
+class VectorFile():
+    """
+    Memory-mapped vector store, see the module docstring for the layout.
+    Only one process should write (mode="a") a vector file, any number of processes can read it.
+    """
+    def __init__(self, path: str, header: dict, mode: str = "r"):
+        self.path = path
+        self.header = header
+        self.mode = mode
+        self._maps = {}
+        self._rows = None # id -> row, built on first use
+
+    @classmethod
+    def open(cls, path: str, mode: str = "r", dimension: int = None, dtype: str = "float32", metric: str = "cosine") -> "VectorFile":
+        """
+        Opens (or creates, in append mode) a vector file. Nothing is read but the header.
+
+        Args:
+            path (str): The vector file directory.
+            mode (str, optional): r (read only) or a (append, delete, compact). Defaults to r.
+            dimension (int, optional): The vectors dimension, required to create a vector file.
+            dtype (str, optional): float32 or float16 (half the size, ~3 significant digits). Defaults to float32.
+            metric (str, optional): cosine, dot or l2. Defaults to cosine.
+        """
+        if mode not in ("r", "a"):
+            raise ValueError("mode must be r or a")
+        header_path = os.path.join(path, "header.json")
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+            if header["version"] != FORMAT_VERSION:
+                raise ValueError(f"unsupported vector file version {header['version']}")
+            vector_file = cls(path, header, mode)
+            if mode == "a":
+                vector_file._truncate()
+            return vector_file
+        if mode == "r":
+            raise FileNotFoundError(f"{path} is not a vector file")
+        if not dimension:
+            raise ValueError("dimension is required to create a vector file")
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        os.makedirs(path, exist_ok=True)
+        for name in DATA_FILES:
+            open(os.path.join(path, name), "wb").close()
+        vector_file = cls(path, {"version": FORMAT_VERSION, "dimension": dimension, "dtype": dtype, "metric": metric, "count": 0, "deleted": 0, "data": ""}, mode)
+        vector_file._write_header()
+        return vector_file
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    @property
+    def dimension(self) -> int:
+        return self.header["dimension"]
+
+    @property
+    def live_count(self) -> int:
+        return self.header["count"] - self.header["deleted"]
+
+    def _file(self, name: str) -> str:
+        # the data files of the current version ("" for the files written before the first compaction)
+        return os.path.join(self.path, self.header.get("data", ""), name)
+
+    def _write_header(self):
+        # written to a temporary file then renamed, the rename is atomic
+        header_path = os.path.join(self.path, "header.json")
+        with open(header_path + ".tmp", "w") as f:
+            json.dump(self.header, f)
+        os.replace(header_path + ".tmp", header_path)
+
+    def _truncate(self):
+        # drops the bytes of an append interrupted before its header was written
+        count = len(self)
+        offsets = {name: int(self._map(name, np.uint64, (count,))[-1]) if count else 0 for name in ("ids.idx", "metadata.idx")}
+        self._maps.clear()
+        sizes = {
+            "vectors.bin": count * self.dimension * np.dtype(self.header["dtype"]).itemsize,
+            "norms.bin": count * 4,
+            "deleted.bin": count,
+            "ids.idx": count * 8,
+            "metadata.idx": count * 8,
+            "ids.bin": offsets["ids.idx"],
+            "metadata.jsonl": offsets["metadata.idx"]
+        }
+        for name, size in sizes.items():
+            if os.path.getsize(self._file(name)) > size:
+                os.truncate(self._file(name), size)
+
+    def _map(self, name: str, dtype, shape: tuple, writable: bool = False) -> np.ndarray:
+        key = (name, writable)
+        if key not in self._maps:
+            if 0 in shape:
+                self._maps[key] = np.empty(shape, dtype=dtype)
+            else:
+                self._maps[key] = np.memmap(self._file(name), dtype=dtype, mode="r+" if writable else "r", shape=shape)
+        return self._maps[key]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        The memory-mapped (rows, dimension) matrix.
+        """
+        return self._map("vectors.bin", self.header["dtype"], (len(self), self.dimension))
+
+    @property
+    def squared_norms(self) -> np.ndarray:
+        return self._map("norms.bin", np.float32, (len(self),))
+
+    @property
+    def deleted(self) -> np.ndarray:
+        return self._map("deleted.bin", np.uint8, (len(self),)).view(bool)
+
+    def _read(self, data_name: str, index_name: str, row: int) -> bytes:
+        ends = self._map(index_name, np.uint64, (len(self),))
+        start = int(ends[row - 1]) if row else 0
+        end = int(ends[row])
+        return self._map(data_name, np.uint8, (int(ends[-1]),))[start:end].tobytes()
+
+    def id(self, row: int) -> str:
+        return self._read("ids.bin", "ids.idx", row).decode("utf-8")
+
+    @property
+    def rows(self) -> Dict[str, int]:
+        """
+        The id -> row mapping of the live vectors (read from the id table on first use).
+        """
+        if self._rows is None:
+            count = len(self)
+            if count == 0:
+                self._rows = {}
+            else:
+                ends = self._map("ids.idx", np.uint64, (count,)).astype(np.int64)
+                data = self._map("ids.bin", np.uint8, (int(ends[-1]),)).tobytes()
+                starts = np.concatenate([[0], ends[:-1]])
+                deleted = self.deleted
+                self._rows = {data[start:end].decode("utf-8"): row for row, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())) if not deleted[row]}
+        return self._rows
+
+    def get(self, row: int, score: float = None, include_values: bool = True) -> Vector:
+        """
+        Returns the Vector stored at a row (only this row is read).
+        """
+        metadata = json.loads(self._read("metadata.jsonl", "metadata.idx", row))
+        return Vector(
+            id=self.id(row),
+            score=score,
+            vector=np.asarray(self.matrix[row], dtype=np.float32) if include_values else [],
+            size=self.dimension if include_values else 0,
+            **metadata
+        )
+
+    def fetch_vectors(self, ids: List[str]) -> List[Vector]:
+        """
+        Returns the stored vectors with the given ids (the unknown ids are skipped).
+        """
+        return [self.get(self.rows[vector_id]) for vector_id in ids if vector_id in self.rows]
+
+    def iter_vectors(self, batch_size: int = 1000, cursor: int = None) -> Iterator[Tuple[List[Vector], int]]:
+        """
+        Streams the live vectors in row order, batch_size at a time.
+        Yields each batch with the cursor (next row) to resume after it.
+        """
+        row = cursor or 0
+        while row < len(self):
+            end = min(row + batch_size, len(self))
+            deleted = self.deleted[row:end]
+            yield [self.get(i) for i in range(row, end) if not deleted[i - row]], end
+            row = end
+
+    def _check_writable(self):
+        if self.mode != "a":
+            raise Exception("the vector file is opened read only, use mode='a'")
+
+    def append(self, vectors: Union[List[Vector], VectorBatch], replace: bool = True):
+        """
+        Appends vectors at the end of the files, the vectors whose id is already stored replace the old ones (which are deleted),
+        and only the last vector of an id repeated in the batch is appended.
+        replace=False appends the rows as they are, without looking up their ids (eg. IVFPQIndex, whose positions are the rows).
+        """
+        self._check_writable()
+        batch = vectors if isinstance(vectors, VectorBatch) else VectorBatch.from_vectors(vectors)
+        if len(batch) == 0:
+            return
+        if batch.dimension != self.dimension:
+            raise ValueError(f"vectors dimension {batch.dimension} does not match the vector file dimension {self.dimension}")
+        if replace:
+            batch = batch.deduplicated()
+            self.delete([vector_id for vector_id in batch.ids if vector_id in self.rows])
+
+        stored = batch.vectors.astype(self.header["dtype"])
+        metadata = [
+            (json.dumps({
+                "document_id": batch.document_ids[i],
+                "data_type": batch.data_types[i],
+                "content": batch.contents[i],
+                "document_metadata": batch.document_metadata[i],
+                "output_metadata": batch.output_metadata[i]
+            }, default=str) + "\n").encode("utf-8") for i in range(len(batch))
+        ]
+        count = len(self)
+        # the norms are computed on the stored values, so the scores match the matrix
+        self._append_rows(stored, np.einsum('ij,ij->i', stored.astype(np.float32), stored.astype(np.float32)), [vector_id.encode("utf-8") for vector_id in batch.ids], metadata)
+        if self._rows is not None:
+            for i, vector_id in enumerate(batch.ids):
+                self._rows[vector_id] = count + i
+
+    def _append_rows(self, stored: np.ndarray, squared_norms: np.ndarray, ids: List[bytes], metadata: List[bytes]):
+        count = len(self)
+        ids_end = int(self._map("ids.idx", np.uint64, (count,))[-1]) if count else 0
+        metadata_end = int(self._map("metadata.idx", np.uint64, (count,))[-1]) if count else 0
+        for name, data in (
+            ("vectors.bin", stored.tobytes()),
+            ("norms.bin", squared_norms.astype(np.float32).tobytes()),
+            ("deleted.bin", bytes(len(ids))),
+            ("ids.bin", b"".join(ids)),
+            ("ids.idx", (ids_end + np.cumsum([len(i) for i in ids], dtype=np.uint64)).tobytes()),
+            ("metadata.jsonl", b"".join(metadata)),
+            ("metadata.idx", (metadata_end + np.cumsum([len(m) for m in metadata], dtype=np.uint64)).tobytes())
+        ):
+            with open(self._file(name), "ab") as f:
+                f.write(data)
+        self.header["count"] = count + len(ids)
+        self._write_header()
+        # the maps are sized with the rows count, they are re-created on next access
+        self._maps.clear()
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Deletes vectors by id (tombstones, the space is reclaimed by compact()).
+
+        Returns:
+            int: The number of deleted vectors.
+        """
+        self._check_writable()
+        rows = [self.rows.pop(vector_id) for vector_id in ids if vector_id in self.rows]
+        if rows:
+            deleted = self._map("deleted.bin", np.uint8, (len(self),), writable=True)
+            deleted[rows] = 1
+            deleted.flush()
+            self.header["deleted"] += len(rows)
+            self._write_header()
+        return len(rows)
+
+    def _version_path(self, version: int) -> str:
+        return os.path.join(self.path, f"v{version}") if version else self.path
+
+    def compact(self, chunk_size: int = SCAN_CHUNK_SIZE):
+        """
+        Rewrites the vector file without the deleted vectors.
+        The new files are written in a new version directory, then the header is switched to it (one atomic rename):
+        an interrupted compaction leaves the vector file unchanged. The previous version is kept until the next
+        compaction, so the readers opened before it keep reading it until they open the vector file again.
+        """
+        self._check_writable()
+        if self.header["deleted"] == 0:
+            return
+        live = np.flatnonzero(~self.deleted)
+        version = self.header.get("generation", 0) + 1
+        if os.path.exists(self._version_path(version)): # left by an interrupted compaction
+            shutil.rmtree(self._version_path(version))
+        compacted = VectorFile.open(self._version_path(version), mode="a", dimension=self.dimension, dtype=self.header["dtype"], metric=self.header["metric"])
+        # the rows are copied as stored (no decoding, no float conversion)
+        for start in range(0, len(live), chunk_size):
+            rows = live[start:start + chunk_size]
+            compacted._append_rows(
+                np.asarray(self.matrix[rows]),
+                np.asarray(self.squared_norms[rows]),
+                [self._read("ids.bin", "ids.idx", row) for row in rows.tolist()],
+                [self._read("metadata.jsonl", "metadata.idx", row) for row in rows.tolist()]
+            )
+        self._maps.clear()
+        os.remove(os.path.join(compacted.path, "header.json"))
+        self.header = {**compacted.header, "data": f"v{version}", "generation": version}
+        self._write_header()
+        self._rows = None
+        # the version before the previous one is no longer read
+        if version >= 2:
+            self._remove_version(version - 2)
+
+    def _remove_version(self, version: int):
+        if version:
+            shutil.rmtree(self._version_path(version), ignore_errors=True)
+            return
+        for name in DATA_FILES:
+            if os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+
+    def query(self,
+              query_vector: Union[List[float], Vector],
+              top_k: int = 5,
+              include_values: bool = False) -> List[Vector]:
+        """
+        Exact top_k search, the matrix is scanned by chunks of SCAN_CHUNK_SIZE rows.
+        The scores are the cosine similarity, the dot product or the euclidean distance depending on the metric.
+        """
+        count = len(self)
+        if count == 0 or self.live_count == 0:
+            return []
+        query = query_vector.to_numpy() if isinstance(query_vector, Vector) else np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != self.dimension:
+            raise ValueError(f"query_vector shape does not match the vector file dimension (which is {self.dimension})")
+        metric = self.header["metric"]
+        matrix, squared_norms = self.matrix, self.squared_norms
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_CHUNK_SIZE):
+            scores[start:start + SCAN_CHUNK_SIZE] = np.asarray(matrix[start:start + SCAN_CHUNK_SIZE], dtype=np.float32) @ query
+        if metric == "cosine":
+            scores /= np.maximum(np.sqrt(squared_norms) * np.linalg.norm(query), np.finfo(np.float32).tiny)
+        elif metric == "l2":
+            scores = np.sqrt(np.maximum(squared_norms - 2 * scores + query @ query, 0))
+        ranking = scores if metric == "l2" else -scores
+        if self.header["deleted"]:
+            ranking[self.deleted] = np.inf
+        top_k = min(top_k, self.live_count)
+        candidates = np.argpartition(ranking, top_k - 1)[:top_k] if top_k < count else np.arange(count)
+        rows = candidates[np.argsort(ranking[candidates], kind='stable')][:top_k]
+        return [self.get(row, score=float(scores[row]), include_values=include_values) for row in rows.tolist()]
@@ -0,0 +1,27 @@
+"""
+Shared helpers of the behaviour tests (python -m pytest tests).
+"""
+import os
+import sys
+# run from a checkout: the repository root is importable without installing the package or setting PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ntropy_ai.core.utils.base_format import Vector
+import pytest
+
+
+def make_vector(vector_id: str, values, document_id: str = "doc", data_type: str = "text", content: str = None, **document_metadata) -> Vector:
+    return Vector(
+        id=vector_id,
+        document_id=document_id,
+        vector=[float(value) for value in values],
+        size=len(values),
+        data_type=data_type,
+        content=content if content is not None else f"content of {vector_id}",
+        document_metadata=document_metadata
+    )
+
+
+@pytest.fixture
+def vector():
+    return make_vector
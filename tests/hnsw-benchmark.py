@@ -0,0 +1,77 @@
+"""
+HNSW benchmark
+
+Recall@k and latency of the HNSW index of LocalVectorStore against the exact search, on synthetic clustered
+512 (CLIP) and 1024 (Titan) dimension embeddings.
+
+usage: python tests/hnsw-benchmark.py [number of vectors]
+"""
+import os
+import sys
+# run from a checkout: the repository root is importable without installing the package or setting PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ntropy_ai.core.providers.local import LocalVectorStore
+from ntropy_ai.core.utils.base_format import VectorBatch
+import numpy as np
+import time
+
+DEFAULT_SIZE = 10000
+QUERIES = 200
+TOP_K = 10
+DIMENSIONS = [512, 1024]
+EF_VALUES = [16, 32, 64, 128]
+INDEX_SETTINGS = {"M": 16, "ef_construction": 100, "seed": 0}
+
+
+def synthetic_embeddings(size: int, dimension: int, rng) -> np.ndarray:
+    # embeddings are not uniform: a mixture of gaussians is closer to real chunks (topics)
+    centers = rng.standard_normal((max(size // 100, 1), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.standard_normal((size, dimension)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def make_batch(vectors: np.ndarray) -> VectorBatch:
+    size = len(vectors)
+    return VectorBatch(
+        vectors=vectors,
+        ids=[str(i) for i in range(size)],
+        document_ids=["benchmark"] * size,
+        data_types=["text"] * size,
+        contents=[None] * size,
+        document_metadata=[{}] * size,
+        output_metadata=[{}] * size
+    )
+
+
+def run_queries(store: LocalVectorStore, queries: np.ndarray, ef: int = None):
+    start = time.perf_counter()
+    results = [[vector.id for vector in store.query(query_vector=query, top_k=TOP_K, ef=ef)] for query in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main(size: int = DEFAULT_SIZE):
+    rng = np.random.default_rng(0)
+    for dimension in DIMENSIONS:
+        vectors = synthetic_embeddings(size + QUERIES, dimension, rng)
+        batch, queries = make_batch(vectors[:size]), vectors[size:]
+
+        exact = LocalVectorStore(metric="cosine")
+        exact.add_vectors(batch)
+        truth, exact_latency = run_queries(exact, queries)
+
+        hnsw = LocalVectorStore(metric="cosine", index="hnsw", index_settings=INDEX_SETTINGS)
+        start = time.perf_counter()
+        hnsw.add_vectors(batch)
+        build_time = time.perf_counter() - start
+
+        print(f"dimension {dimension}, {size} vectors, HNSW build {build_time:.1f}s")
+        print(f"  exact        recall@{TOP_K} 1.000  {exact_latency * 1000:.2f}ms/query")
+        for ef in EF_VALUES:
+            results, latency = run_queries(hnsw, queries, ef=ef)
+            recall = np.mean([len(set(result) & set(expected)) / TOP_K for result, expected in zip(results, truth)])
+            print(f"  hnsw ef={ef:<4} recall@{TOP_K} {recall:.3f}  {latency * 1000:.2f}ms/query")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
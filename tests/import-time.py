@@ -0,0 +1,52 @@
+"""
+Import time benchmark
+
+Fails if `import ntropy_ai.core.utils.settings` takes longer than the budget, or if importing the settings and
+resolving an embeddings model loads one of the heavy optional dependencies.
+
+usage: python tests/import-time.py [budget in seconds]
+"""
+import subprocess
+import sys
+import json
+
+DEFAULT_BUDGET = 0.5 # seconds
+RUNS = 5
+HEAVY_MODULES = ["torch", "clip", "boto3", "botocore", "opensearchpy", "pymupdf", "numpy"]
+
+# each run is a fresh interpreter, otherwise the modules are already in sys.modules
+SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+import ntropy_ai.core.utils.settings
+elapsed = time.perf_counter() - start
+try:
+    ntropy_ai.core.utils.settings.resolve_model("amazon.titan-embed-text-v2:0")
+except ValueError: # the AWS provider is not installed
+    pass
+print(json.dumps({"elapsed": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+def measure():
+    output = subprocess.run([sys.executable, "-c", SNIPPET], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(budget: float = DEFAULT_BUDGET):
+    results = [measure() for _ in range(RUNS)]
+    best = min(result["elapsed"] for result in results)
+    loaded = results[0]["modules"]
+    print(f"import ntropy_ai.core.utils.settings: {best * 1000:.1f}ms (best of {RUNS}, budget {budget * 1000:.0f}ms)")
+    if loaded:
+        print(f"FAILED: heavy modules loaded eagerly: {', '.join(loaded)}")
+        return 1
+    if best > budget:
+        print("FAILED: import time is over budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET))
@@ -0,0 +1,103 @@
+"""
+Query results cache and embeddings cache.
+"""
+from ntropy_ai.core.utils.query_cache import QueryCache
+from ntropy_ai.core.utils.embeddings_cache import EmbeddingsCache
+import ntropy_ai.core.utils.embeddings_cache as embeddings_cache
+import importlib
+import json
+import time
+
+
+def test_query_cache_hit_and_miss(vector):
+    cache = QueryCache()
+    scope = cache.make_scope("local", "index", None)
+    key = cache.make_key(scope, "what  is\nthe revenue", 5, model="titan")
+    assert cache.get(key) is None
+    cache.set(key, scope, [vector("a", [1, 0])], cache.generation(scope))
+    # the query text is whitespace normalized
+    assert [v.id for v in cache.get(cache.make_key(scope, "what is the revenue", 5, model="titan"))] == ["a"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_query_cache_key_includes_the_query_settings():
+    scope = QueryCache.make_scope("local", "index", None)
+    key = QueryCache.make_key(scope, "revenue", 5, model="titan", model_settings={"dimensions": 512})
+    assert key == QueryCache.make_key(scope, "revenue", 5, model="titan", model_settings={"dimensions": 512})
+    assert key != QueryCache.make_key(scope, "revenue", 5, model="titan", model_settings={"dimensions": 256})
+    assert key != QueryCache.make_key(scope, "revenue", 10, model="titan", model_settings={"dimensions": 512})
+    assert QueryCache.make_key(scope, [1, 0], 5) == QueryCache.make_key(scope, [1.0, 0.0], 5)
+
+
+def test_query_cache_returns_copies(vector):
+    cache = QueryCache()
+    scope = cache.make_scope("local")
+    key = cache.make_key(scope, "q", 1)
+    cache.set(key, scope, [vector("a", [1, 0])], 0)
+    cache.get(key)[0].content = "modified"
+    cache.get(key)[0].document_metadata["page_number"] = 2
+    assert cache.get(key)[0].content == "content of a"
+    assert cache.get(key)[0].document_metadata == {}
+
+
+def test_query_cache_invalidation_and_ttl(vector):
+    cache = QueryCache(ttl=0.05)
+    scope = cache.make_scope("local")
+    key = cache.make_key(scope, "q", 1)
+    generation = cache.generation(scope)
+    cache.invalidate(scope)
+    # read before the write: not cached
+    cache.set(key, scope, [vector("a", [1, 0])], generation)
+    assert cache.get(key) is None
+    cache.set(key, scope, [vector("a", [1, 0])], cache.generation(scope))
+    assert cache.get(key) is not None
+    time.sleep(0.06)
+    assert cache.get(key) is None
+
+
+def test_query_cache_shared_between_processes(vector, tmp_path):
+    path = str(tmp_path / "queries.db")
+    writer, reader = QueryCache(path=path), QueryCache(path=path, generation_refresh=0)
+    scope = writer.make_scope("local")
+    key = writer.make_key(scope, "q", 1)
+    writer.set(key, scope, [vector("a", [1, 0], page_number=1)], writer.generation(scope))
+    assert [(v.id, v.to_list(), v.document_metadata) for v in reader.get(key)] == [("a", [1.0, 0.0], {"page_number": 1})]
+    # the shared database stores JSON, not pickles
+    payload = writer.db.execute("SELECT payload FROM results").fetchone()[0]
+    assert json.loads(payload)[0]["id"] == "a"
+    reader.invalidate(scope)
+    assert writer.get(key) is not None # the writer reads the generations again after generation_refresh
+    writer.generation_refresh = 0
+    assert writer.get(key) is None
+
+
+def test_embeddings_cache_round_trip(tmp_path):
+    cache = EmbeddingsCache(path=str(tmp_path / "embeddings.db"))
+    key = cache.make_key("titan", {"dimensions": 3}, text="hello")
+    assert key != cache.make_key("titan", {"dimensions": 4}, text="hello")
+    assert cache.get(key) is None
+    cache.set(key, [0.1, 0.2, 0.3])
+    assert cache.get(key) == [0.1, 0.2, 0.3]
+    cache.close()
+    assert EmbeddingsCache(path=str(tmp_path / "embeddings.db")).get(key) == [0.1, 0.2, 0.3]
+
+
+def test_embeddings_cache_evicts_the_least_recently_used(tmp_path):
+    # 3 embeddings of 4 float64 fit in the cache
+    cache = EmbeddingsCache(path=str(tmp_path / "embeddings.db"), max_size=3 * 32)
+    for name in ("a", "b", "c"):
+        cache.set(name, [1.0] * 4)
+        time.sleep(0.01)
+    assert cache.get("a") is not None
+    cache.set("d", [1.0] * 4)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("d") is not None
+
+
+def test_embeddings_cache_default_path_is_the_user_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    try:
+        assert importlib.reload(embeddings_cache).DEFAULT_CACHE_PATH == str(tmp_path / "ntropy_ai" / "embeddings_cache.db")
+    finally:
+        monkeypatch.undo()
+        importlib.reload(embeddings_cache)
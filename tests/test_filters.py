@@ -0,0 +1,81 @@
+"""
+Metadata filters: python evaluation and the Pinecone / OpenSearch translations.
+"""
+from ntropy_ai.core.utils.filters import And, Eq, In, Or, Range, filter_fields, matches, to_opensearch, to_pinecone
+import pytest
+
+
+FIELDS = {
+    "document_id": "doc-1",
+    "data_type": "text",
+    **filter_fields({"page_number": 3, "source": "report.pdf", "tags": ["finance", "q3"], "draft": False, "nested": {"a": 1}}, {"model": "titan"})
+}
+
+
+def test_filter_fields_flattens_the_scalar_metadata():
+    assert FIELDS["document_metadata.page_number"] == 3
+    assert FIELDS["document_metadata.tags"] == ["finance", "q3"]
+    assert FIELDS["output_metadata.model"] == "titan"
+    assert "document_metadata.nested" not in FIELDS
+
+
+@pytest.mark.parametrize("filter, expected", [
+    (Eq("data_type", "text"), True),
+    (Eq("data_type", "image"), False),
+    (Eq("document_metadata.tags", "q3"), True),
+    (Eq("document_metadata.missing", "x"), False),
+    (In("document_id", ["doc-1", "doc-2"]), True),
+    (In("document_metadata.tags", ["q4", "finance"]), True),
+    (In("document_metadata.tags", ["q4"]), False),
+    (Range("document_metadata.page_number", gte=3, lt=4), True),
+    (Range("document_metadata.page_number", gt=3), False),
+    (Range("document_metadata.source", gte=0), False),
+    (Range("document_metadata.draft", gte=0), False),
+])
+def test_matches(filter, expected):
+    assert matches(filter, FIELDS) is expected
+
+
+def test_combined_filters():
+    text_page_3 = Eq("data_type", "text") & Range("document_metadata.page_number", lte=3)
+    assert isinstance(text_page_3, And)
+    assert matches(text_page_3, FIELDS)
+    assert not matches(text_page_3 & Eq("document_id", "doc-2"), FIELDS)
+    either = Eq("document_id", "doc-2") | Eq("output_metadata.model", "titan")
+    assert isinstance(either, Or)
+    assert matches(either, FIELDS)
+    assert len((either | Eq("data_type", "image")).filters) == 3
+
+
+def test_range_requires_a_bound():
+    with pytest.raises(ValueError):
+        Range("document_metadata.page_number")
+
+
+def test_to_pinecone():
+    filter = Eq("data_type", "text") & (In("document_id", ["a", "b"]) | Range("document_metadata.page_number", gte=2, lt=5))
+    assert to_pinecone(filter) == {"$and": [
+        {"data_type": {"$eq": "text"}},
+        {"$or": [{"document_id": {"$in": ["a", "b"]}}, {"document_metadata.page_number": {"$gte": 2, "$lt": 5}}]}
+    ]}
+
+
+def test_to_opensearch():
+    filter = Eq("data_type", "text") & (In("document_id", ["a", "b"]) | Range("document_metadata.page_number", gte=2))
+    assert to_opensearch(filter) == {"bool": {"filter": [
+        {"term": {"data_type": "text"}},
+        {"bool": {"should": [
+            {"terms": {"document_id": ["a", "b"]}},
+            {"range": {"filter_fields.document_metadata.page_number": {"gte": 2}}}
+        ], "minimum_should_match": 1}}
+    ]}}
+
+
+def test_to_opensearch_keyword_fields():
+    filter = Eq("document_metadata.source", "report.pdf") & In("data_type", ["text"]) & Eq("document_metadata.page_number", 2)
+    keyword_fields = {"filter_fields.document_metadata.source", "data_type", "filter_fields.document_metadata.page_number"}
+    assert to_opensearch(filter, keyword_fields) == {"bool": {"filter": [
+        {"term": {"filter_fields.document_metadata.source.keyword": "report.pdf"}},
+        {"terms": {"data_type.keyword": ["text"]}},
+        {"term": {"filter_fields.document_metadata.page_number": 2}}
+    ]}}
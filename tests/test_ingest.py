@@ -0,0 +1,121 @@
+"""
+Incremental ingestion: only the new or modified chunks are embedded, the removed chunks are deleted.
+The embeddings model is replaced by a deterministic fake (no provider is called).
+"""
+from ntropy_ai.core.document_instance.ingest import IngestManifest, ingest
+from ntropy_ai.core.document_instance.load.json import JsonLoader
+from ntropy_ai.core.providers.local import LocalVectorStore
+from ntropy_ai.core.utils.base_format import TextChunk, Vector
+from ntropy_ai.core.utils.fingerprint import stable_id
+import ntropy_ai.core.providers
+import hashlib
+import json
+import pytest
+
+
+class SpyStore(LocalVectorStore):
+    def __init__(self, failing: bool = False):
+        super().__init__()
+        self.failing = failing
+        self.deleted_ids = []
+
+    def add_vectors(self, vectors, namespace: str = None):
+        if self.failing:
+            return [{"error": "throttled", "size": len(vectors)}]
+        return super().add_vectors(vectors, namespace=namespace)
+
+    def delete(self, ids, namespace: str = None) -> int:
+        self.deleted_ids.extend(ids)
+        return super().delete(ids, namespace=namespace)
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """
+    The texts embedded by the fake model, per call.
+    """
+    calls = []
+
+    def embed_many(model, items, model_settings=None, batch_size=32):
+        texts = [item.chunk if isinstance(item, TextChunk) else item.content for item in items]
+        calls.append(texts)
+        return [
+            Vector(document_id=getattr(item, "document_id", item.id), vector=[b / 255 for b in hashlib.sha256(f"{model}{text}".encode()).digest()[:4]], size=4, data_type="text", content=text)
+            for item, text in zip(items, texts)
+        ]
+
+    monkeypatch.setattr(ntropy_ai.core.providers, "embed_many", embed_many)
+    return calls
+
+
+def chunks(*texts: str):
+    return [TextChunk(id=stable_id("report.pdf", i, text), chunk=text, chunk_number=i, document_id="report.pdf") for i, text in enumerate(texts)]
+
+
+def run(store, manifest, items, source_hash, model="fake-model", **kwargs):
+    return ingest(store, items, source="report.pdf", model=model, source_hash=source_hash, manifest=manifest, **kwargs)
+
+
+def test_only_the_changes_are_embedded(embedded, tmp_path):
+    store, manifest = SpyStore(), str(tmp_path / "manifest.json")
+    report = run(store, manifest, chunks("a", "b", "c"), "v1")
+    assert report["embedded"] == 3 and report["deleted"] == 0
+    assert len(store.namespaces[None].rows) == 3
+
+    report = run(store, manifest, chunks("a", "b", "c"), "v1")
+    assert report["skipped"] and report["unchanged"] == 3
+    assert len(embedded) == 1
+
+    report = run(store, manifest, chunks("a", "B", "c"), "v2")
+    assert embedded[-1] == ["B"]
+    assert (report["embedded"], report["unchanged"], report["deleted"]) == (1, 2, 1)
+    assert sorted(v.content for v in store.query(query_vector=[1, 1, 1, 1], top_k=10)) == ["B", "a", "c"]
+    assert IngestManifest(manifest).get("report.pdf")["source_hash"] == "v2"
+
+
+def test_removed_chunks_are_deleted(embedded, tmp_path):
+    store, manifest = SpyStore(), str(tmp_path / "manifest.json")
+    run(store, manifest, chunks("a", "b"), "v1")
+    report = run(store, manifest, chunks("a"), "v2")
+    assert report["embedded"] == 0 and report["deleted"] == 1
+    assert [v.content for v in store.query(query_vector=[1, 1, 1, 1], top_k=10)] == ["a"]
+
+
+def test_a_model_change_rewrites_every_chunk(embedded, tmp_path):
+    store, manifest = SpyStore(), str(tmp_path / "manifest.json")
+    items = chunks("a", "b")
+    run(store, manifest, items, "v1")
+    report = run(store, manifest, items, "v1", model="other-model")
+    assert report["embedded"] == 2
+    # the previous vectors are deleted before they are written again
+    assert sorted(store.deleted_ids) == sorted(item.id for item in items)
+    assert len(store.namespaces[None].rows) == 2
+
+
+def test_failed_writes_are_retried(embedded, tmp_path):
+    store, manifest = SpyStore(failing=True), str(tmp_path / "manifest.json")
+    items = chunks("a", "b")
+    report = run(store, manifest, items, "v1")
+    assert report["failed"] == 2
+    assert IngestManifest(manifest).get("report.pdf")["pending"] == sorted(item.id for item in items)
+
+    store.failing = False
+    report = run(store, manifest, items, "v1")
+    assert report["embedded"] == 2 and report["failed"] == 0
+    assert sorted(store.deleted_ids) == sorted(item.id for item in items)
+    assert IngestManifest(manifest).get("report.pdf")["pending"] == []
+    assert run(store, manifest, items, "v1")["skipped"]
+
+
+def test_modified_documents_are_embedded_again(embedded, tmp_path):
+    # the id of a JSON value is derived from its path, a modified value keeps its id and is found by its content_hash
+    store, manifest, path = SpyStore(), str(tmp_path / "manifest.json"), tmp_path / "data.json"
+    path.write_text(json.dumps({"title": "revenue", "body": "grew"}))
+    loader = JsonLoader(str(path), source="data.json")
+    ingest(store, loader.load(), source=loader.source, model="fake-model", manifest=manifest)
+
+    path.write_text(json.dumps({"title": "revenue", "body": "fell"}))
+    report = ingest(store, loader.load(), source=loader.source, model="fake-model", manifest=manifest)
+    assert (report["embedded"], report["unchanged"], report["deleted"]) == (1, 1, 0)
+    assert embedded[-1] == ["fell"]
+    assert sorted(v.content for v in store.query(query_vector=[1, 1, 1, 1], top_k=10)) == ["fell", "revenue"]
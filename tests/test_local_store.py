@@ -0,0 +1,160 @@
+"""
+LocalVectorStore: exact search, upserts, deletes, filters, persistence and the HNSW index.
+"""
+from ntropy_ai.core.providers.local import LocalVectorStore
+from ntropy_ai.core.utils.filters import Eq, Range
+from ntropy_ai.core.utils.base_format import VectorBatch
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def store(vector):
+    store = LocalVectorStore(metric="cosine")
+    store.add_vectors([
+        vector("x", [1, 0, 0], page_number=1),
+        vector("y", [0, 1, 0], page_number=2),
+        vector("xy", [1, 1, 0], page_number=3),
+        vector("z", [0, 0, 1], document_id="other", data_type="image", page_number=4)
+    ])
+    return store
+
+
+def test_exact_search_ranks_by_cosine_similarity(store):
+    results = store.query(query_vector=[1, 0.1, 0], top_k=3)
+    assert [v.id for v in results] == ["x", "xy", "y"]
+    assert results[0].score == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+    assert results[0].content == "content of x"
+    assert results[0].document_metadata == {"page_number": 1}
+
+
+@pytest.mark.parametrize("metric, expected", [("dot", ["xy", "x", "y"]), ("l2", ["x", "xy", "y"])])
+def test_exact_search_metrics(vector, metric, expected):
+    store = LocalVectorStore(metric=metric)
+    store.add_vectors([vector("x", [1, 0]), vector("y", [0, 1]), vector("xy", [1, 1])])
+    results = store.query(query_vector=[1, 0.2], top_k=3)
+    assert [v.id for v in results] == expected
+    if metric == "l2":
+        assert results[0].score == pytest.approx(0.2, rel=1e-5)
+
+
+def test_top_k_larger_than_the_store(store):
+    assert len(store.query(query_vector=[1, 0, 0], top_k=10)) == 4
+
+
+def test_values_are_only_returned_on_demand(store):
+    result = store.query(query_vector=[1, 0, 0], top_k=1)[0]
+    assert len(result.vector) == 0 and result.size == 0
+    assert store.query(query_vector=[1, 0, 0], top_k=1, include_values=True)[0].to_list() == [1.0, 0.0, 0.0]
+
+
+def test_upsert_replaces_by_id(store, vector):
+    store.add_vectors([vector("x", [0, 0, 1], content="new")])
+    results = store.query(query_vector=[0, 0, 1], top_k=2)
+    assert {v.id for v in results} == {"x", "z"}
+    assert store.fetch_vectors(["x"])[0].content == "new"
+
+
+def test_repeated_id_in_a_batch_keeps_the_last_vector(vector):
+    store = LocalVectorStore()
+    store.add_vectors([vector("a", [1, 0]), vector("a", [0, 1])])
+    assert [v.to_list() for v in store.fetch_vectors(["a"])] == [[0.0, 1.0]]
+    assert len(store.query(query_vector=[1, 0], top_k=5)) == 1
+
+
+def test_vector_batch_round_trip(vector):
+    vectors = [vector("a", [1, 0], page_number=1), vector("b", [0, 1])]
+    batch = VectorBatch.from_vectors(vectors)
+    assert [v.id for v in batch.iter_vectors()] == ["a", "b"]
+    assert batch.to_vectors()[0].document_metadata == {"page_number": 1}
+    assert batch.to_vectors()[1].to_list() == [0.0, 1.0]
+    # the batch is a pydantic model, iterating it yields its fields
+    assert dict(batch)["ids"] == ["a", "b"]
+    store = LocalVectorStore()
+    store.add_vectors(batch)
+    assert [v.id for v in store.query(query_vector=[0, 1], top_k=1)] == ["b"]
+
+
+def test_deleted_vectors_are_not_returned(store):
+    assert store.delete(["x", "unknown"]) == 1
+    assert "x" not in [v.id for v in store.query(query_vector=[1, 0, 0], top_k=4)]
+    assert store.delete_by_document("other") == 1
+    assert {v.id for v in store.query(query_vector=[0, 0, 1], top_k=4)} == {"y", "xy"}
+
+
+def test_filtered_search(store):
+    results = store.query(query_vector=[1, 0, 0], top_k=4, filter=Eq("data_type", "text") & Range("document_metadata.page_number", gte=2))
+    assert [v.id for v in results] == ["xy", "y"]
+    assert store.delete_by_filter(Range("document_metadata.page_number", lte=2)) == 2
+    assert {v.id for v in store.query(query_vector=[1, 0, 0], top_k=4)} == {"xy", "z"}
+
+
+def test_query_many_matches_query(store):
+    queries = [[1, 0, 0], [0, 0.5, 1]]
+    many = store.query_many(queries, top_k=2)
+    assert [[v.id for v in results] for results in many] == [[v.id for v in store.query(query_vector=q, top_k=2)] for q in queries]
+
+
+def test_namespaces_are_separate(vector):
+    store = LocalVectorStore()
+    store.add_vectors([vector("a", [1, 0])], namespace="one")
+    store.add_vectors([vector("b", [1, 0])], namespace="two")
+    assert [v.id for v in store.query(query_vector=[1, 0], namespace="one")] == ["a"]
+    assert store.query(query_vector=[1, 0], namespace="three") == []
+
+
+def test_save_and_load(store, tmp_path):
+    store.delete(["y"])
+    store.save(str(tmp_path / "index"))
+    loaded = LocalVectorStore.load(str(tmp_path / "index"))
+    assert [v.id for v in loaded.query(query_vector=[1, 0.1, 0], top_k=4)] == [v.id for v in store.query(query_vector=[1, 0.1, 0], top_k=4)]
+
+
+def test_iter_vectors_streams_the_live_vectors(store):
+    store.delete(["y"])
+    batches = list(store.iter_vectors(batch_size=2))
+    assert [[v.id for v in batch] for batch, _ in batches] == [["x"], ["xy", "z"]]
+    assert [cursor for _, cursor in batches] == [2, 4]
+    assert [[v.id for v in batch] for batch, _ in store.iter_vectors(batch_size=2, cursor=2)] == [["xy", "z"]]
+
+
+def test_hnsw_index_matches_the_exact_search(vector):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 16)).astype(np.float32)
+    exact = LocalVectorStore()
+    hnsw = LocalVectorStore(index="hnsw", index_settings={"M": 8, "ef_construction": 64, "seed": 0})
+    for store in (exact, hnsw):
+        store.add_vectors([vector(str(i), values) for i, values in enumerate(vectors)])
+    recall = np.mean([
+        len({v.id for v in hnsw.query(query_vector=q, top_k=10, ef=64)} & {v.id for v in exact.query(query_vector=q, top_k=10)}) / 10
+        for q in vectors[:50] + 0.01
+    ])
+    assert recall >= 0.95
+
+
+def test_hnsw_upsert_and_delete(vector):
+    store = LocalVectorStore(index="hnsw", index_settings={"seed": 0})
+    store.add_vectors([vector("a", [1, 0]), vector("b", [0, 1]), vector("a", [-1, 0])])
+    assert [v.id for v in store.query(query_vector=[-1, 0], top_k=2)] == ["a", "b"]
+    store.add_vectors([vector("a", [1, 0])])
+    store.delete(["b"])
+    assert [v.id for v in store.query(query_vector=[1, 0], top_k=5)] == ["a"]
+
+
+@pytest.mark.parametrize("index", ["exact", "hnsw"])
+def test_compact_removes_the_deleted_rows(vector, index):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 8)).astype(np.float32)
+    store = LocalVectorStore(index=index, index_settings={"seed": 0} if index == "hnsw" else None)
+    store.add_vectors([vector(str(i), values, content=f"chunk {i}") for i, values in enumerate(vectors)])
+    # re-ingesting the same ids appends new rows in a graph, deleting tombstones rows
+    store.add_vectors([vector(str(i), vectors[i], content=f"chunk {i}") for i in range(50)])
+    store.delete([str(i) for i in range(150, 200)])
+    namespace = store.get_namespace()
+    expected = [[v.id for v in store.query(query_vector=q, top_k=5)] for q in vectors[:20]]
+    rows = len(namespace)
+    assert store.compact() == rows - 150
+    assert len(namespace) == 150 and not namespace.deleted[:150].any()
+    assert [[v.id for v in store.query(query_vector=q, top_k=5)] for q in vectors[:20]] == expected
+    assert store.fetch_vectors(["42"])[0].content == "chunk 42"
+    assert store.compact() == 0
@@ -0,0 +1,105 @@
+"""
+Vector stores migration: streaming copy, checkpoints and resume.
+"""
+from ntropy_ai.core.utils.migrate import migrate
+from ntropy_ai.core.utils.vector_file import VectorFile
+from ntropy_ai.core.providers.local import LocalVectorStore
+from ntropy_ai.core.utils import failed_writes
+import json
+import pytest
+
+
+class Interrupted(Exception):
+    pass
+
+
+class RecordingStore(LocalVectorStore):
+    def __init__(self):
+        super().__init__()
+        self.deleted_ids = []
+
+    def delete(self, ids, namespace: str = None) -> int:
+        self.deleted_ids.extend(ids)
+        return super().delete(ids, namespace=namespace)
+
+
+@pytest.fixture
+def source(vector):
+    store = LocalVectorStore()
+    store.add_vectors([vector(str(i), [i, 1], page_number=i) for i in range(10)], namespace="docs")
+    return store
+
+
+def ids(store, namespace=None):
+    return sorted(v.id for batch, _ in store.iter_vectors(namespace=namespace) for v in batch)
+
+
+def test_failed_writes():
+    assert failed_writes(None) == 0
+    assert failed_writes([{"error": None, "size": 10}, {"error": "throttled", "size": 4}]) == 4
+    assert failed_writes([{"errors": [{"id": "a"}], "size": 3}]) == 1
+
+
+def test_copy_between_stores(source, tmp_path):
+    target = VectorFile.open(str(tmp_path / "vectors"), mode="a", dimension=2)
+    report = migrate(source, target, source_kwargs={"namespace": "docs"}, batch_size=4)
+    assert (report["copied"], report["failed"], report["batches"], report["done"]) == (10, 0, 3, True)
+    assert sorted(v.id for batch, _ in target.iter_vectors() for v in batch) == ids(source, "docs")
+    assert target.fetch_vectors(["3"])[0].document_metadata == {"page_number": 3}
+
+
+def test_resume_from_the_checkpoint(source, tmp_path):
+    checkpoint = str(tmp_path / "migration.json")
+    target = RecordingStore()
+    copied = []
+
+    def progress(count):
+        copied.append(count)
+        if len(copied) == 2:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        migrate(source, target, source_kwargs={"namespace": "docs"}, batch_size=4, checkpoint=checkpoint, progress=progress)
+    with open(checkpoint) as f:
+        assert json.load(f)["copied"] == 8
+
+    report = migrate(source, target, source_kwargs={"namespace": "docs"}, batch_size=4, checkpoint=checkpoint)
+    assert report["copied"] == 10 and report["done"]
+    assert ids(target) == ids(source, "docs")
+    # the first batch after the checkpoint may have been written already, it is deleted before it is written again
+    assert target.deleted_ids == ["8", "9"]
+    assert migrate(source, target, source_kwargs={"namespace": "docs"}, checkpoint=checkpoint) == report
+
+
+class FlakyStore(RecordingStore):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def add_vectors(self, vectors, namespace: str = None):
+        if self.failures:
+            self.failures -= 1
+            # the first vector is written, the others fail
+            super().add_vectors(vectors[:1], namespace=namespace)
+            return [{"error": "throttled", "size": len(vectors) - 1}]
+        return super().add_vectors(vectors, namespace=namespace)
+
+
+def test_a_failed_batch_is_retried(source, tmp_path):
+    checkpoint = str(tmp_path / "migration.json")
+    target = FlakyStore(failures=1)
+    report = migrate(source, target, source_kwargs={"namespace": "docs"}, batch_size=4, checkpoint=checkpoint)
+    assert (report["copied"], report["failed"], report["done"]) == (0, 3, False)
+
+    report = migrate(source, target, source_kwargs={"namespace": "docs"}, batch_size=4, checkpoint=checkpoint)
+    assert (report["copied"], report["failed"], report["done"]) == (10, 0, True)
+    assert ids(target) == ids(source, "docs")
+    # the partially written batch is deleted before it is written again
+    assert target.deleted_ids == ["0", "1", "2", "3"]
+
+
+def test_skip_failed(source):
+    target = FlakyStore(failures=1)
+    report = migrate(source, target, source_kwargs={"namespace": "docs"}, batch_size=4, skip_failed=True)
+    assert (report["copied"], report["failed"], report["done"]) == (7, 3, True)
+    assert len(ids(target)) == 7
@@ -0,0 +1,90 @@
+"""
+Hybrid search (BM25, rank fusion), diversity re-ranking (MMR) and the IVF-PQ index.
+"""
+from ntropy_ai.core.utils.hybrid import BM25Index, fuse, reciprocal_rank_fusion, tokenize
+from ntropy_ai.core.utils.diversity import drop_duplicates, mmr
+from ntropy_ai.core.utils.ivfpq import IVFPQIndex
+from ntropy_ai.core.providers.local import LocalVectorStore
+import numpy as np
+import pytest
+
+
+def test_tokenize_keeps_the_compound_tokens():
+    assert tokenize("EBITDA of AAPL-Q3 was 1.5B") == ["ebitda", "of", "aapl-q3", "aapl", "q3", "was", "1.5b", "1", "5b"]
+
+
+def test_bm25_ranks_the_rare_terms_first():
+    index = BM25Index()
+    index.add("a", "the revenue grew in the third quarter")
+    index.add("b", "the margin of the quarter")
+    index.add("c", "EBITDA guidance")
+    assert [document_id for document_id, _ in index.search("ebitda quarter")] == ["c", "b", "a"]
+    index.remove("c")
+    assert "c" not in index and [document_id for document_id, _ in index.search("ebitda")] == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]])
+    assert [document_id for document_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert [document_id for document_id, _ in fuse([("a", 0.9), ("b", 0.8)], [("b", 12.0)])] == ["b", "a"]
+
+
+def test_local_hybrid_query_finds_the_keyword_match(vector):
+    store = LocalVectorStore()
+    store.add_vectors([
+        vector("semantic", [1, 0], content="revenue growth"),
+        vector("keyword", [0, 1], content="AAPL-Q3 EBITDA"),
+        vector("other", [0.5, 0.5], content="unrelated text")
+    ])
+    results = store.hybrid_query("EBITDA", query_vector=[1, 0], top_k=2)
+    assert {v.id for v in results} == {"semantic", "keyword"}
+
+
+def test_mmr_skips_the_near_duplicates(vector):
+    results = [vector("a", [1, 0, 0]), vector("a-copy", [0.99, 0.01, 0]), vector("b", [0.7, 0.7, 0])]
+    assert [v.id for v in mmr(results, query_vector=[1, 0, 0.1], top_k=2)] == ["a", "b"]
+    assert [v.id for v in mmr(results, query_vector=[1, 0, 0.1], top_k=2, lambda_mult=1.0, duplicate_threshold=None)] == ["a", "a-copy"]
+    assert [v.id for v in drop_duplicates(results)] == ["a", "b"]
+
+
+def test_mmr_relevance_from_the_scores(vector):
+    results = [vector("near", [1, 0]), vector("far", [0, 1])]
+    results[0].score, results[1].score = 0.1, 2.0
+    # l2 distances: the lowest score is the most relevant
+    assert [v.id for v in mmr(results, top_k=1, higher_is_better=False)] == ["near"]
+    assert [v.id for v in mmr(results, top_k=1)] == ["far"]
+
+
+def test_mmr_requires_the_values(vector):
+    results = [vector("a", [1, 0]), vector("b", [0, 1])]
+    results[0].vector = []
+    with pytest.raises(ValueError):
+        mmr(results, top_k=1)
+
+
+@pytest.mark.parametrize("vectors_path", [False, True])
+def test_ivfpq_search(vector, tmp_path, vectors_path):
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((16, 32)).astype(np.float32)
+    data = (centers[rng.integers(0, 16, 2000)] + 0.3 * rng.standard_normal((2000, 32))).astype(np.float32)
+    index = IVFPQIndex(dimension=32, n_lists=16, m=8, nprobe=4, keep_vectors=True, vectors_path=str(tmp_path / "rows") if vectors_path else None, seed=0)
+    index.train(data[:1000], iterations=10)
+    for start in range(0, len(data), 500):
+        index.add_vectors([vector(str(i), data[i], page_number=i) for i in range(start, start + 500)])
+    assert len(index) == 2000
+    results = index.query(query_vector=data[42], top_k=5, rerank=50)
+    assert results[0].id == "42" and results[0].score == pytest.approx(1.0, abs=1e-4)
+    assert results[0].document_metadata == {"page_number": 42}
+
+    exact = data / np.linalg.norm(data, axis=1, keepdims=True)
+    recall = np.mean([
+        len({v.id for v in index.query(query_vector=query, top_k=10, nprobe=8, rerank=100)} & {str(i) for i in np.argsort(-(exact @ query))[:10]}) / 10
+        for query in data[:20]
+    ])
+    assert recall >= 0.8
+
+    usage = index.memory_usage()
+    assert usage["code_bytes_per_vector"] == 8
+    assert (usage["metadata_bytes"] == 0) == vectors_path
+    assert usage["total_bytes"] >= usage["quantizers_bytes"] + usage["exact_vectors_bytes"] + usage["metadata_bytes"]
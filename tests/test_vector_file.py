@@ -0,0 +1,77 @@
+"""
+VectorFile: memory-mapped append, search, delete and compaction.
+"""
+from ntropy_ai.core.utils.vector_file import VectorFile
+import json
+import os
+import pytest
+
+
+@pytest.fixture
+def vector_file(vector, tmp_path):
+    vector_file = VectorFile.open(str(tmp_path / "vectors"), mode="a", dimension=2)
+    vector_file.append([vector("x", [1, 0], page_number=1), vector("y", [0, 1]), vector("xy", [1, 1])])
+    return vector_file
+
+
+def test_append_and_query(vector_file):
+    results = VectorFile.open(vector_file.path).query(query_vector=[1, 0.1], top_k=2)
+    assert [v.id for v in results] == ["x", "xy"]
+    assert results[0].document_metadata == {"page_number": 1}
+    assert len(results[0].vector) == 0
+
+
+def test_read_only_mode(vector_file, vector):
+    with pytest.raises(Exception):
+        VectorFile.open(vector_file.path).append([vector("z", [1, 1])])
+    with pytest.raises(FileNotFoundError):
+        VectorFile.open(os.path.join(vector_file.path, "missing"))
+
+
+def test_append_replaces_by_id(vector_file, vector):
+    vector_file.append([vector("x", [0, 1], content="new"), vector("z", [1, 0]), vector("z", [-1, 0], content="last")])
+    assert len(vector_file) == 5 and vector_file.live_count == 4
+    assert [v.content for v in vector_file.fetch_vectors(["x", "z"])] == ["new", "last"]
+    assert [v.id for v in vector_file.query(query_vector=[-1, 0], top_k=1)] == ["z"]
+
+
+def test_delete_and_compact(vector_file):
+    assert vector_file.delete(["y", "unknown"]) == 1
+    reader = VectorFile.open(vector_file.path)
+    assert [v.id for v in reader.query(query_vector=[0, 1], top_k=3)] == ["xy", "x"]
+    vector_file.compact()
+    assert len(vector_file) == 2 and vector_file.header["data"] == "v1"
+    # a reader opened before the compaction still reads the previous version
+    assert reader.get(1).id == "y"
+    reopened = VectorFile.open(vector_file.path)
+    assert [v.id for v in reopened.query(query_vector=[0, 1], top_k=3)] == ["xy", "x"]
+    assert [v.id for batch, _ in reopened.iter_vectors() for v in batch] == ["x", "xy"]
+
+
+def test_interrupted_compaction_keeps_the_vector_file(vector_file):
+    vector_file.delete(["y"])
+    os.makedirs(os.path.join(vector_file.path, "v1"))
+    with open(os.path.join(vector_file.path, "v1", "vectors.bin"), "wb") as f:
+        f.write(b"partial")
+    assert len(VectorFile.open(vector_file.path)) == 3
+    vector_file.compact()
+    assert [v.id for batch, _ in VectorFile.open(vector_file.path).iter_vectors() for v in batch] == ["x", "xy"]
+
+
+def test_interrupted_append_is_truncated(vector_file, vector):
+    header = dict(vector_file.header)
+    vector_file.append([vector("z", [1, 0])])
+    # the header of the last append was not written
+    with open(os.path.join(vector_file.path, "header.json"), "w") as f:
+        json.dump(header, f)
+    reopened = VectorFile.open(vector_file.path, mode="a")
+    assert len(reopened) == 3
+    reopened.append([vector("w", [0, 1])])
+    assert [v.id for batch, _ in reopened.iter_vectors() for v in batch] == ["x", "y", "xy", "w"]
+
+
+def test_float16_storage(vector, tmp_path):
+    vector_file = VectorFile.open(str(tmp_path / "half"), mode="a", dimension=2, dtype="float16", metric="l2")
+    vector_file.append([vector("a", [1, 0]), vector("b", [3, 4])])
+    assert os.path.getsize(os.path.join(vector_file.path, "vectors.bin")) == 2 * 2 * 2
+    assert vector_file.query(query_vector=[0, 0], top_k=2)[1].score == pytest.approx(5, rel=1e-3)